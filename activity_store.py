@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import calendar
+import glob
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+from interval_log import IntervalLogWriter
+from log_schema import POINT_HEADER, INTERVAL_HEADER, read_records
+from log_archive import all_logs, day_of, stat as archive_stat
+
+# --- 設定 ---
+ACTIVITY_DB_FILE = "activity.db"  # SQLiteデータベースのファイル名
+# --- 設定ここまで ---
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS apps (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS titles (id INTEGER PRIMARY KEY, title TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS activity (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,   -- local wall time as seconds (naive, DST-free arithmetic)
+    day INTEGER NOT NULL,  -- YYYYMMDD; durations never cross a day, like the daily CSVs
+    app_id INTEGER NOT NULL REFERENCES apps(id),
+    title_id INTEGER NOT NULL REFERENCES titles(id),
+    pid INTEGER,
+    state TEXT,
+    task_id INTEGER REFERENCES tasks(id),
+    duration INTEGER       -- seconds, for rows imported from interval-format logs
+);
+CREATE INDEX IF NOT EXISTS idx_activity_ts ON activity(ts);
+CREATE INDEX IF NOT EXISTS idx_activity_app ON activity(app_id, ts);
+CREATE INDEX IF NOT EXISTS idx_activity_task ON activity(task_id, ts);
+CREATE TABLE IF NOT EXISTS imported_files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, rows INTEGER);
+"""
+
+# Dwell time of each row = its recorded duration, else the next row's timestamp on the
+# same day (last row of a day: 0)
+_DWELL = """
+    SELECT a.*, COALESCE(a.duration, LEAD(a.ts) OVER (PARTITION BY a.day ORDER BY a.ts, a.id) - a.ts, 0) AS dwell
+    FROM activity a WHERE a.ts >= ? AND a.ts < ?
+"""
+
+_NO_CAP = 1 << 62
+
+
+def to_seconds(dt):
+    return calendar.timegm(dt.timetuple())
+
+
+def from_seconds(seconds):
+    return datetime(1970, 1, 1) + timedelta(seconds=seconds)
+
+
+class ActivityStore:
+    """
+    操作ログをSQLite (WALモード) に保存・検索するクラス。
+    アプリ名・ウィンドウタイトル・タスク名は参照表に一度だけ格納し、
+    activity 表は整数IDで参照する。時刻・アプリ・タスクに索引がある。
+    """
+
+    def __init__(self, path=ACTIVITY_DB_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(activity)")]
+        if "duration" not in columns:
+            # Databases created before interval-format logs existed
+            self.conn.execute("ALTER TABLE activity ADD COLUMN duration INTEGER")
+        self._ids = {"apps": {}, "titles": {}, "tasks": {}}
+
+    def close(self):
+        self.conn.close()
+
+    # --- Writes ---
+    def _intern(self, table, column, value):
+        cache = self._ids[table]
+        row_id = cache.get(value)
+        if row_id is None:
+            self.conn.execute(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", (value,))
+            row_id = self.conn.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,)).fetchone()[0]
+            cache[value] = row_id
+        return row_id
+
+    def insert_records(self, records):
+        """
+        (タイムスタンプ文字列, アプリ名, タイトル, pid, 状態, タスク名[, 秒数]) をまとめて
+        1トランザクションで追加する。秒数のある行は次の行までの時間ではなくその値を使う。
+        """
+        params = []
+        for record in records:
+            timestamp, app, title, pid, state, task = record[:6]
+            duration = record[6] if len(record) > 6 else None
+            dt = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+            params.append((
+                to_seconds(dt),
+                dt.year * 10000 + dt.month * 100 + dt.day,
+                self._intern("apps", "name", app or ""),
+                self._intern("titles", "title", title or ""),
+                int(pid) if pid not in (None, "") else None,
+                state or None,
+                self._intern("tasks", "name", task) if task else None,
+                int(float(duration)) if duration not in (None, "") else None,
+            ))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO activity (ts, day, app_id, title_id, pid, state, task_id, duration) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                params)
+        return len(params)
+
+    # --- Queries (start/end are datetimes, end exclusive) ---
+    def rows(self, start, end):
+        cur = self.conn.execute(
+            "SELECT a.ts, ap.name, t.title, a.pid, a.state, tk.name FROM activity a "
+            "JOIN apps ap ON ap.id = a.app_id JOIN titles t ON t.id = a.title_id "
+            "LEFT JOIN tasks tk ON tk.id = a.task_id "
+            "WHERE a.ts >= ? AND a.ts < ? ORDER BY a.ts, a.id",
+            (to_seconds(start), to_seconds(end)))
+        for ts, app, title, pid, state, task in cur:
+            yield from_seconds(ts).strftime(TIMESTAMP_FORMAT), app, title, pid, state, task or ""
+
+    # idle_threshold: rows longer than this many seconds only count up to it (None: no cap)
+    @staticmethod
+    def _params(start, end, idle_threshold):
+        return (idle_threshold or _NO_CAP, to_seconds(start), to_seconds(end))
+
+    def task_totals(self, start, end, idle_threshold=None):
+        """タスク名 → 合計秒数。"""
+        cur = self.conn.execute(
+            f"SELECT tk.name, SUM(MIN(d.dwell, ?)) FROM ({_DWELL}) d JOIN tasks tk ON tk.id = d.task_id GROUP BY tk.name",
+            self._params(start, end, idle_threshold))
+        return dict(cur.fetchall())
+
+    def app_totals(self, start, end, idle_threshold=None):
+        """アプリ名 → 合計秒数。"""
+        cur = self.conn.execute(
+            f"SELECT ap.name, SUM(MIN(d.dwell, ?)) FROM ({_DWELL}) d JOIN apps ap ON ap.id = d.app_id GROUP BY ap.name",
+            self._params(start, end, idle_threshold))
+        return dict(cur.fetchall())
+
+    def usage_summary(self, start, end, idle_threshold=None):
+        """(アプリ名, ウィンドウタイトル, 合計秒数) のリスト。"""
+        cur = self.conn.execute(
+            f"SELECT ap.name, t.title, SUM(MIN(d.dwell, ?)) FROM ({_DWELL}) d "
+            "JOIN apps ap ON ap.id = d.app_id JOIN titles t ON t.id = d.title_id "
+            "GROUP BY ap.name, t.title",
+            self._params(start, end, idle_threshold))
+        return cur.fetchall()
+
+    # --- Import ---
+    def import_csv(self, path):
+        """
+        既存のログCSV（旧形式・区間形式、圧縮・アーカイブ済みも可）を取り込む。
+        同じ日は（圧縮されて場所が変わっても）二度取り込まない。戻り値は追加した行数。
+        """
+        mtime, size = archive_stat(path)
+        key = day_of(path) or os.path.abspath(path)
+        if self.conn.execute("SELECT 1 FROM imported_files WHERE path = ?", (key,)).fetchone():
+            return 0
+        # Any schema version: every record comes back with its start and length
+        records = [(r.start, r.app, r.title, r.pid, r.state, r.task, r.seconds)
+                   for r in read_records(path) if r.start]
+        count = self.insert_records(records)
+        with self.conn:
+            self.conn.execute("INSERT INTO imported_files (path, mtime, size, rows) VALUES (?, ?, ?, ?)",
+                              (key, mtime, size, count))
+        return count
+
+
+class SqliteLogWriter(IntervalLogWriter):
+    """
+    IntervalLogWriter と同じく切り替え行を閉じた区間にして、開始時刻と秒数をSQLiteに書き込むバックエンド
+    （終了は開始 + 秒数）。一時停止・日付変更・終了の時間は close_interval() で区間から外れる。
+    open() に渡される日次ファイル名は使わず、常に同じデータベースに書く。
+    """
+
+    def __init__(self, point_header=POINT_HEADER, db_path=ACTIVITY_DB_FILE, **kwargs):
+        self.db_path = db_path
+        self._store = None
+        index = {name: i for i, name in enumerate(INTERVAL_HEADER)}
+        self._columns = [index[name] for name in
+                         ("開始", "アプリ名", "ウィンドウタイトル", "プロセスID", "ポモドーロ状態", "タスク名", "秒数")]
+        super().__init__(point_header, **kwargs)
+
+    def _to_record(self, row):
+        return tuple(row[i] for i in self._columns)
+
+    def _write_batch(self, rows):
+        if self._store is None:
+            self._open_file(self._target)
+        self._store.insert_records([self._to_record(row) for row in rows])
+
+    def _open_file(self, path):
+        if self._store is None:
+            self._store = ActivityStore(self.db_path)
+
+    def _close_file(self):
+        if self._store is not None:
+            try:
+                self._store.close()
+            except Exception:
+                pass
+        self._store = None
+
+    def _prepare_file(self, path):
+        pass
+
+    def _append_direct(self, path, rows):
+        store = ActivityStore(self.db_path)
+        try:
+            store.insert_records([self._to_record(row) for row in rows])
+        finally:
+            store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="既存のログCSVをSQLiteデータベースに取り込みます。")
+    parser.add_argument("pattern", nargs="?",
+                        help="取り込むファイルのglobパターン（省略時は圧縮・アーカイブ済みを含むすべての日）")
+    parser.add_argument("--db", default=ACTIVITY_DB_FILE, help="データベースファイル")
+    parser.add_argument("--include-today", action="store_true",
+                        help="記録中の今日のファイルも取り込む（ロガーがSQLiteにも書いている場合は重複します）")
+    args = parser.parse_args()
+
+    today_file = f"log_{datetime.now().strftime('%Y%m%d')}.csv"
+    store = ActivityStore(args.db)
+    total = 0
+    paths = sorted(glob.glob(args.pattern)) if args.pattern else all_logs()
+    for path in paths:
+        if os.path.basename(path) == today_file and not args.include_today:
+            print(f"スキップ（記録中）: {path}")
+            continue
+        count = store.import_csv(path)
+        total += count
+        print(f"{path}: {count}行")
+    store.close()
+    print(f"合計 {total} 行を取り込みました。")
+
+
+if __name__ == "__main__":
+    main()
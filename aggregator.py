@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+from datetime import datetime
+
+
+class TaskDurationAggregator:
+    """
+    ログの行を順に受け取り、タスク別・アプリ別の合計時間を保持し続けるクラス。
+    区間形式のログは各行の秒数をそのまま加算する。旧形式（切り替え時刻のみ）は
+    次の行までの時間を滞在時間とし、最後の行は次の行が届いた時点で加算される。
+    新しい行の分だけ計算するので O(新しい行数)。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.task_totals = defaultdict(float)  # task -> seconds
+        self.app_totals = defaultdict(float)  # app -> seconds
+        self.row_count = 0
+        self._columns = None
+        self._seconds_col = None  # Set for interval-format logs
+        self._last = None  # (timestamp, app, task) of the row still waiting for its end
+
+    def set_header(self, header):
+        """CSVのヘッダーから列の位置を決める。タスク名列の無い古い形式にも対応する。"""
+        if not header:
+            self._columns = None
+            return
+        index = {name: i for i, name in enumerate(header)}
+        self._seconds_col = index.get("秒数")
+        self._columns = (index.get("タイムスタンプ", index.get("開始")), index.get("アプリ名"), index.get("タスク名"))
+
+    @property
+    def has_task_column(self):
+        return self._columns is not None and self._columns[2] is not None
+
+    def feed(self, rows):
+        """CSVの行（リスト）をまとめて取り込む。"""
+        if self._columns is None:
+            return
+        ts_col, app_col, task_col = self._columns
+        if ts_col is None:
+            return
+        if self._seconds_col is not None:
+            self._feed_intervals(rows)
+            return
+        for row in rows:
+            try:
+                timestamp = datetime.fromisoformat(row[ts_col])
+            except (ValueError, IndexError):
+                continue
+            app = row[app_col] if app_col is not None and app_col < len(row) else ""
+            # Empty task names are not a task (pandas read them as NaN and groupby dropped them)
+            task = (row[task_col] or None) if task_col is not None and task_col < len(row) else None
+            self.add(timestamp, app, task)
+
+    def _feed_intervals(self, rows):
+        _, app_col, task_col = self._columns
+        seconds_col = self._seconds_col
+        for row in rows:
+            try:
+                seconds = float(row[seconds_col])
+            except (ValueError, IndexError):
+                continue
+            app = row[app_col] if app_col is not None and app_col < len(row) else ""
+            task = (row[task_col] or None) if task_col is not None and task_col < len(row) else None
+            self.add_interval(app, task, seconds)
+
+    def add_interval(self, app, task, seconds):
+        """閉じた区間を1件取り込む。"""
+        self.app_totals[app] += seconds
+        if task is not None:
+            self.task_totals[task] += seconds
+        self.row_count += 1
+
+    def add(self, timestamp, app, task):
+        """1件の切り替えを取り込む。timestamp は datetime。"""
+        self._close_last(timestamp)
+        self._last = (timestamp, app, task)
+        self.row_count += 1
+
+    def pause(self, timestamp):
+        """記録が一時停止した: 待っている行を timestamp で締め、再開後の最初の行まで時間を加算しない。"""
+        self._close_last(timestamp)
+        self._last = None
+
+    def _close_last(self, timestamp):
+        if self._last is not None:
+            last_ts, last_app, last_task = self._last
+            # Rows are appended in time order; a clock step backwards must not subtract time
+            seconds = max(0.0, (timestamp - last_ts).total_seconds())
+            self.app_totals[last_app] += seconds
+            if last_task is not None:
+                self.task_totals[last_task] += seconds
+
+    def on_event(self, event):
+        """EventBus の WindowSwitched を直接取り込むためのコールバック。"""
+        self.add(datetime.fromisoformat(event.timestamp), event.process_name, event.task or None)
+
+    def task_duration(self, task):
+        return self.task_totals.get(task, 0.0)
@@ -2,9 +2,22 @@
 
 import pandas as pd
 import numpy as np
-import glob
 from datetime import datetime, timedelta
 import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from log_loader import load_log
+from summary_cache import SummaryCache, summarize_file, SUMMARY_CACHE_FILE
+from prompt_builder import (format_seconds, stream_day_prompt, stream_range_prompt, build_prompt,
+                            PROMPT_MAX_TOKENS)
+from title_rules import TitleClassifier, TITLE_RULES_FILE
+from log_archive import find_log, all_logs, day_of, MEMBER_SEPARATOR, stat as archive_stat
+
+LOG_FILE_PREFIX = "log_"
+MAX_WORKERS = None  # 並列に解析するプロセス数（None ならCPU数）
+SERIAL_THRESHOLD = 2  # これ以下のファイル数ならプロセスを起動せずに順に解析する
+IDLE_THRESHOLD_SECONDS = 15 * 60  # これより長い区間は離席とみなし、この長さで打ち切る
 
 def format_timedelta(td):
     """
@@ -12,89 +25,242 @@ def format_timedelta(td):
     """
     if pd.isna(td):
         return "N/A"
+    return format_seconds(td.total_seconds())
+
+def to_intervals(df):
+    """
+    読み込んだログを区間 (開始, 秒数, アプリ名, ウィンドウタイトル, タスク名) の表にする。
+    旧形式は時刻順に並べ、次の行までの時間を秒数にする（日の最後の行は 0 秒）。
+    """
+    if '秒数' in df.columns:
+        intervals = df.copy()
+        intervals['秒数'] = intervals['秒数'].astype('float64')
+    else:
+        intervals = df.sort_values(by='タイムスタンプ', kind='stable').reset_index(drop=True)
+        intervals = intervals.rename(columns={'タイムスタンプ': '開始'})
+        start = intervals['開始']
+        following = start.shift(-1)
+        # 次の行との差分。日をまたぐ差分（や最後の行）は不明なので 0 秒
+        same_day = following.dt.normalize() == start.dt.normalize()
+        intervals['秒数'] = (following - start).dt.total_seconds().where(same_day, 0.0)
+    if 'タスク名' not in intervals.columns:
+        intervals['タスク名'] = np.nan
+    return intervals[['開始', '秒数', 'アプリ名', 'ウィンドウタイトル', 'タスク名']]
+
+def cap_durations(seconds, idle_threshold):
+    """idle_threshold 秒より長い区間はそこで打ち切る（昼休みや画面ロックを直前のウィンドウに数えない）。"""
+    if not idle_threshold:
+        return seconds
+    return seconds.clip(upper=idle_threshold)
+
+def load_intervals(paths):
+    """1日または複数日のログを読み、1つの区間表にする。"""
+    frames = []
+    for path in paths:
+        try:
+            # 集計に使う列だけを型付きで読む（時刻は固定書式、文字列は category）
+            df = load_log(path, usecols=['タイムスタンプ', '開始', '秒数', 'アプリ名', 'ウィンドウタイトル', 'タスク名'])
+        except pd.errors.EmptyDataError:
+            continue
+        frames.append(to_intervals(df))
+    if not frames:
+        return None
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
 
-    total_seconds = int(td.total_seconds())
-    hours, remainder = divmod(total_seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
+def sessionize(intervals, idle_threshold=IDLE_THRESHOLD_SECONDS):
+    """
+    区間表をセッション表 (開始, 終了, 滞在時間, アプリ名, ウィンドウタイトル, タスク名) にまとめる。
+    アプリ名・タイトル・タスクが同じで途切れずに続く行は1つのセッションになり、
+    idle_threshold を超えた区間はそこで打ち切ってセッションを終える。
+    すべて列演算で行い、何か月分でも1パスで処理する。
+    """
+    start = intervals['開始']
+    raw = intervals['秒数']
+    seconds = cap_durations(raw, idle_threshold)
+    end = start + pd.to_timedelta(seconds, unit='s')
 
-    parts = []
-    if hours > 0:
-        parts.append(f"{hours}時間")
-    if minutes > 0:
-        parts.append(f"{minutes}分")
-    if seconds > 0 or not parts:
-        parts.append(f"{seconds}秒")
+    # Same window as the row before, starting where that row really ended, and not cut by idling
+    same = pd.Series(True, index=intervals.index)
+    for column in ['アプリ名', 'ウィンドウタイトル', 'タスク名']:
+        values = intervals[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Compare the integer codes (missing is -1, so it equals itself)
+            codes = pd.Series(values.cat.codes, index=intervals.index)
+            same &= codes == codes.shift(1)
+        else:
+            previous = values.shift(1)
+            same &= (values == previous) | (values.isna() & previous.isna())
+    previous_end = (start + pd.to_timedelta(raw, unit='s')).shift(1)
+    contiguous = (start - previous_end).abs() <= pd.Timedelta(seconds=1)
+    idle_cut = (raw > idle_threshold).shift(1, fill_value=False) if idle_threshold else False
+    session_id = (~(same & contiguous & ~idle_cut)).cumsum()
 
-    return "".join(parts)
+    sessions = pd.DataFrame({
+        '開始': start, '終了': end, '秒数': seconds,
+        'アプリ名': intervals['アプリ名'], 'ウィンドウタイトル': intervals['ウィンドウタイトル'],
+        'タスク名': intervals['タスク名'],
+    }).groupby(session_id, sort=False).agg({
+        '開始': 'first', '終了': 'last', '秒数': 'sum',
+        'アプリ名': 'first', 'ウィンドウタイトル': 'first', 'タスク名': 'first',
+    }).reset_index(drop=True)
+    sessions.insert(2, '滞在時間', pd.to_timedelta(sessions.pop('秒数'), unit='s'))
+    return sessions
 
-def analyze_log_file(file_path):
+def analyze_log_file(file_path, idle_threshold=IDLE_THRESHOLD_SECONDS):
     """
     単一のログファイルを読み込み、滞在時間を計算して集計する。
+    idle_threshold 秒を超える区間はその長さで打ち切る（None または 0 なら打ち切らない）。
     """
-    try:
-        df = pd.read_csv(file_path)
-    except FileNotFoundError:
+    if not file_path or not os.path.exists(file_path.split(MEMBER_SEPARATOR)[0]):
         print(f"エラー: ログファイル '{file_path}' が見つかりません。")
         return None
-    except pd.errors.EmptyDataError:
+    intervals = load_intervals([file_path])
+    if intervals is None or intervals.empty:
         print(f"情報: ログファイル '{file_path}' は空です。")
         return None
 
-    # タイムスタンプをdatetimeオブジェクトに変換
-    df['タイムスタンプ'] = pd.to_datetime(df['タイムスタンプ'])
+    intervals['滞在時間'] = pd.to_timedelta(cap_durations(intervals['秒数'], idle_threshold), unit='s')
 
-    # タイムスタンプでソート
-    df = df.sort_values(by='タイムスタンプ').reset_index(drop=True)
+    # アプリ名とウィンドウタイトルでグループ化し、滞在時間を合計する
+    # (category 列なので observed=True で実在する組み合わせだけを残す)
+    usage_summary = intervals.groupby(['アプリ名', 'ウィンドウタイトル'], observed=True)['滞在時間'].sum().reset_index()
 
-    # 各行の滞在時間を計算（次の行との差分）
-    df['滞在時間'] = df['タイムスタンプ'].shift(-1) - df['タイムスタンプ']
+    # アプリごとの合計時間を計算
+    app_total_usage = usage_summary.groupby('アプリ名', observed=True)['滞在時間'].sum().sort_values(ascending=False)
 
-    # 最後のログの滞在時間は不明なため、ここでは0秒としておく
-    # （または、平均値や固定値（例: 5秒）を設定することも可能）
-    df.loc[df.index[-1], '滞在時間'] = timedelta(seconds=0)
+    return usage_summary, app_total_usage
 
-    # アプリ名とウィンドウタイトルでグループ化し、滞在時間を合計する
-    usage_summary = df.groupby(['アプリ名', 'ウィンドウタイトル'])['滞在時間'].sum().reset_index()
+def merge_summaries(partials):
+    """
+    日ごとの部分集計 (summary_cache.summarize_file の結果) を合算し、
+    analyze_log_file と同じ形 (usage_summary, app_total_usage) にする。
+    """
+    usage = {}
+    for part in partials:
+        for app, title, seconds in part["usage"]:
+            usage[(app, title)] = usage.get((app, title), 0.0) + seconds
 
-    # アプリごとの合計時間を計算
+    usage_summary = pd.DataFrame(
+        [(app, title, seconds) for (app, title), seconds in usage.items()],
+        columns=['アプリ名', 'ウィンドウタイトル', '滞在時間'])
+    usage_summary['滞在時間'] = pd.to_timedelta(usage_summary['滞在時間'], unit='s')
     app_total_usage = usage_summary.groupby('アプリ名')['滞在時間'].sum().sort_values(ascending=False)
+    return usage_summary, app_total_usage
+
+def log_paths(dates):
+    """日付のリストを、存在するログの参照先（圧縮・アーカイブ済みの日を含む）のリストにする。"""
+    paths = [find_log(d) for d in dates]
+    return [p for p in paths if p]
+
+def collect_day_summaries(dates, workers=MAX_WORKERS, idle_threshold=IDLE_THRESHOLD_SECONDS):
+    """
+    複数日のログを日ごとに集計し、(ログの参照先, 集計) のリストを日付順に返す。存在しない日は飛ばす。
+    過去の日は集計キャッシュを使い、今日の分とキャッシュに無い日だけを並列に解析する。
+    dates は date のリスト。
+    """
+    paths = log_paths(dates)
+    if not paths:
+        return []
+
+    cache = SummaryCache(SUMMARY_CACHE_FILE)
+    today = datetime.now().strftime('%Y%m%d')
+    partials = {}
+    misses = []
+    for path in paths:
+        summary = cache.get(path, idle_threshold) if day_of(path) != today else None
+        if summary is None:
+            misses.append((path, archive_stat(path)))
+        else:
+            partials[path] = summary
+    print(f"{len(paths)} 日分のログを集計します（キャッシュ済み {len(partials)} 日）。")
+
+    miss_paths = [path for path, _ in misses]
+    summarize = partial(summarize_file, idle_threshold=idle_threshold)
+    if len(miss_paths) <= SERIAL_THRESHOLD:
+        results = [summarize(p) for p in miss_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(summarize, miss_paths))
+    for (path, stat), summary in zip(misses, results):
+        partials[path] = summary
+        # Today's file is still growing: never worth caching
+        if day_of(path) != today:
+            cache.put(path, summary, stat, idle_threshold)
+    cache.save()
+    return [(p, partials[p]) for p in paths]
+
+def analyze_log_range(dates, workers=MAX_WORKERS, idle_threshold=IDLE_THRESHOLD_SECONDS, day_summaries=None):
+    """複数日のログを集計して合算し、analyze_log_file と同じ形で返す。"""
+    if day_summaries is None:
+        day_summaries = collect_day_summaries(dates, workers, idle_threshold)
+    if not day_summaries:
+        print("情報: 指定した期間のログファイルがありません。")
+        return None
+    return merge_summaries([summary for _, summary in day_summaries])
+
+def rebuild_cache(idle_threshold=IDLE_THRESHOLD_SECONDS):
+    """今日以外のすべてのログの集計キャッシュを作り直す。"""
+    today = datetime.now().strftime('%Y%m%d')
+    paths = [p for p in all_logs() if day_of(p) != today]
+    count = SummaryCache(SUMMARY_CACHE_FILE).rebuild(paths, idle_threshold)
+    print(f"{count} ファイルの集計キャッシュを作り直しました: {SUMMARY_CACHE_FILE}")
+
+def resolve_dates(args):
+    """引数から集計する日付の範囲 (最初の日, 最後の日) を決める。範囲指定が無ければ None。"""
+    today = datetime.now().date()
+    if args.last_week:
+        return today - timedelta(days=6), today
+    if args.month:
+        first = datetime.strptime(args.month, "%Y%m").date()
+        next_month = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return first, min(next_month - timedelta(days=1), today)
+    if args.date_from or args.date_to:
+        end = datetime.strptime(args.date_to, "%Y%m%d").date() if args.date_to else today
+        start = datetime.strptime(args.date_from, "%Y%m%d").date() if args.date_from else end
+        return start, end
+    return None
+
+def analyze_db(db_path, start, end, idle_threshold=IDLE_THRESHOLD_SECONDS):
+    """
+    SQLiteの操作ログから、analyze_log_file と同じ形の集計を返す。
+    start/end は datetime（end は含まない）。
+    """
+    from activity_store import ActivityStore
+
+    if not os.path.exists(db_path):
+        print(f"エラー: データベース '{db_path}' が見つかりません。")
+        return None
+    store = ActivityStore(db_path)
+    try:
+        rows = store.usage_summary(start, end, idle_threshold)
+    finally:
+        store.close()
 
+    usage_summary = pd.DataFrame(rows, columns=['アプリ名', 'ウィンドウタイトル', '滞在時間'])
+    usage_summary['滞在時間'] = pd.to_timedelta(usage_summary['滞在時間'], unit='s')
+    app_total_usage = usage_summary.groupby('アプリ名')['滞在時間'].sum().sort_values(ascending=False)
     return usage_summary, app_total_usage
 
-def generate_llm_prompt(df_summary):
+def classify_usage(usage_summary, classifier):
+    """
+    (アプリ名, タイトル) ごとの集計に、分類ルールでプロジェクト・チケット・分類の列を付けて返す。
+    集計は組ごとに1行なので、ルールの照合は異なるタイトルの数だけで済む。
+    """
+    classified = usage_summary.copy()
+    results = classifier.classify_many(zip(classified['アプリ名'], classified['ウィンドウタイトル']))
+    for column, values in zip(['プロジェクト', 'チケット', '分類'], zip(*results) if results else ([], [], [])):
+        classified[column] = pd.Series(values, index=classified.index, dtype="object")
+    return classified
+
+def generate_llm_prompt(df_summary, max_tokens=PROMPT_MAX_TOKENS):
     """
     LLMへの入力プロンプトを生成する。
+    滞在時間の長い順に、近いタイトルをまとめ、max_tokens（概算）に収まらない分は「その他」にまとめる。
     """
     if df_summary is None or df_summary.empty:
         return "分析するログデータがありません。"
-
-    prompt = """あなたは優秀な業務アシスタントです。
-以下のPC操作ログから、本日の作業内容を要約してください。
-
-【ログデータ】
-タイムスタンプ,アプリ名,ウィンドウタイトル
-"""
-    # 元のログデータをプロンプトに含める（ここではサマリーデータで代用）
-    # 実際の活用では、元のCSVデータを貼り付けても良い
-    for index, row in df_summary.iterrows():
-        app = row['アプリ名']
-        title = row['ウィンドウタイトル']
-        duration = format_timedelta(row['滞在時間'])
-        prompt += f"（滞在時間: {duration}）, {app}, {title}\n"
-
-    prompt += """
-【要約フォーマット案】
-- **主な活動**: （例: 資料作成、プログラミング、情報収集など）
-- **使用した主要アプリケーション**: （例: WINWORD.EXE, Code.exe, chrome.exe）
-- **タスクごとの時間配分（推定）**:
-  - 「○○」に関する資料作成: 約XX時間XX分
-  - 「△△」機能の実装: 約XX時間XX分
-  - Webでの調査: 約XX時間XX分
-- **気付き・提案**: （例: 特定のアプリの使用時間が長いようです。集中して作業できています。）
-
-上記のフォーマットを参考に、ログの内容を解釈して一日の作業サマリーを作成してください。
-"""
-    return prompt
+    usage = zip(df_summary['アプリ名'], df_summary['ウィンドウタイトル'], df_summary['滞在時間'].dt.total_seconds())
+    return build_prompt(stream_day_prompt(usage, max_tokens))
 
 
 def main():
@@ -105,13 +271,69 @@ def main():
         default=datetime.now().strftime("%Y%m%d"),
         help="分析したいログの日付をYYYYMMDD形式で指定します。（例: 20251202）"
     )
+    parser.add_argument(
+        "--db",
+        help="CSVの代わりにSQLiteデータベース（activity_store.py で作成）から集計します。"
+    )
+    range_group = parser.add_mutually_exclusive_group()
+    range_group.add_argument("--last-week", action="store_true", help="今日までの7日間を集計します。")
+    range_group.add_argument(
+        "--month",
+        nargs='?',
+        const=datetime.now().strftime("%Y%m"),
+        help="指定した月（YYYYMM、省略時は今月）を集計します。"
+    )
+    parser.add_argument("--from", dest="date_from", help="集計の開始日（YYYYMMDD）")
+    parser.add_argument("--to", dest="date_to", help="集計の終了日（YYYYMMDD、含む。省略時は今日）")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="並列に解析するプロセス数")
+    parser.add_argument("--rebuild-cache", action="store_true", help="過去のログの集計キャッシュを作り直して終了します。")
+    parser.add_argument(
+        "--idle-threshold",
+        type=float,
+        default=IDLE_THRESHOLD_SECONDS / 60,
+        help="これより長い区間（分）は離席とみなして打ち切ります。0 で打ち切りません。"
+    )
+    parser.add_argument("--sessions", action="store_true", help="連続した同じ作業をまとめたセッション表も表示します。")
+    parser.add_argument("--classify", nargs="?", const=TITLE_RULES_FILE, metavar="RULES",
+                        help=f"分類ルールでタイトルをプロジェクト・チケット・分類に振り分けて集計します（既定: {TITLE_RULES_FILE}）")
+    parser.add_argument("--weekly", action="store_true", help="期間のプロンプトを日ごとではなく週ごとにまとめます。")
+    parser.add_argument("--prompt-tokens", type=int, default=PROMPT_MAX_TOKENS,
+                        help=f"LLM用プロンプトの長さの上限（トークン数の概算、既定: {PROMPT_MAX_TOKENS}）")
     args = parser.parse_args()
+    idle_threshold = args.idle_threshold * 60 or None
 
-    log_file_pattern = f"log_{args.date}.csv"
+    if args.rebuild_cache:
+        rebuild_cache(idle_threshold)
+        return
 
-    print(f"--- {args.date} のログ分析結果 ---")
+    date_range = resolve_dates(args)
+    day_summaries = None
+    if date_range is None:
+        log_file_pattern = f"{LOG_FILE_PREFIX}{args.date}.csv"
 
-    result = analyze_log_file(log_file_pattern)
+        print(f"--- {args.date} のログ分析結果 ---")
+
+        if args.db:
+            day = datetime.strptime(args.date, "%Y%m%d")
+            result = analyze_db(args.db, day, day + timedelta(days=1), idle_threshold)
+        else:
+            result = analyze_log_file(find_log(args.date) or log_file_pattern, idle_threshold)
+        session_paths = log_paths([args.date])
+    else:
+        start, end = date_range
+        if start > end:
+            print("エラー: 開始日が終了日より後になっています。")
+            return
+        print(f"--- {start.strftime('%Y%m%d')} 〜 {end.strftime('%Y%m%d')} のログ分析結果 ---")
+
+        dates = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        if args.db:
+            first = datetime.combine(start, datetime.min.time())
+            result = analyze_db(args.db, first, first + timedelta(days=len(dates)), idle_threshold)
+        else:
+            day_summaries = collect_day_summaries(dates, workers=args.workers, idle_threshold=idle_threshold)
+            result = analyze_log_range(dates, day_summaries=day_summaries)
+        session_paths = log_paths(dates)
 
     if result is None:
         return
@@ -134,11 +356,50 @@ def main():
         for index, row in usage_summary_sorted.iterrows():
             print(f"- {row['アプリ名']} - \"{row['ウィンドウタイトル']}\": {format_timedelta(row['滞在時間'])}")
 
+    if args.classify:
+        try:
+            classifier = TitleClassifier.load(args.classify)
+        except (OSError, ValueError) as e:
+            print(f"\nエラー: 分類ルールを読み込めませんでした ({args.classify}): {e}")
+        else:
+            classified = classify_usage(usage_summary, classifier)
+            for column in ['プロジェクト', 'チケット', '分類']:
+                print(f"\n[{column}別 合計時間]")
+                totals = classified.groupby(column)['滞在時間'].sum().sort_values(ascending=False)
+                if totals.empty:
+                    print("データがありません。")
+                for name, total_time in totals.items():
+                    print(f"- {name}: {format_timedelta(total_time)}")
+            unclassified = classified.loc[classified[['プロジェクト', 'チケット', '分類']].isna().all(axis=1), '滞在時間'].sum()
+            print(f"\n(未分類: {format_timedelta(unclassified)})")
+
+    if args.sessions:
+        print("\n[セッション]")
+        intervals = load_intervals(session_paths)
+        if intervals is None or intervals.empty:
+            print("データがありません。")
+        else:
+            for row in sessionize(intervals, idle_threshold).itertuples(index=False):
+                task = f" [{row.タスク名}]" if isinstance(row.タスク名, str) and row.タスク名 else ""
+                print(f"- {row.開始:%Y-%m-%d %H:%M:%S} 〜 {row.終了:%H:%M:%S} ({format_timedelta(row.滞在時間)}) "
+                      f"{row.アプリ名} - \"{row.ウィンドウタイトル}\"{task}")
+
     print("\n" + "="*50)
     print("【LLM要約用プロンプト】")
     print("="*50)
-    llm_prompt = generate_llm_prompt(usage_summary)
-    print(llm_prompt)
+    if day_summaries:
+        # Multi-day prompt built from the per-day aggregates, never from raw rows
+        days = [(datetime.strptime(day_of(path), "%Y%m%d").date(), summary) for path, summary in day_summaries]
+        chunks = stream_range_prompt(days, args.prompt_tokens, weekly=args.weekly)
+    elif usage_summary.empty:
+        chunks = ["分析するログデータがありません。"]
+    else:
+        usage = zip(usage_summary['アプリ名'], usage_summary['ウィンドウタイトル'],
+                    usage_summary['滞在時間'].dt.total_seconds())
+        chunks = stream_day_prompt(usage, args.prompt_tokens)
+    for chunk in chunks:
+        print(chunk, end="")
+    print()
 
 
 if __name__ == "__main__":
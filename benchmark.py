@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+from log_generator import generate_logs, build_tasks
+from log_schema import read_records, TIMESTAMP_FORMAT
+from interval_log import IntervalLogWriter
+from aggregator import TaskDurationAggregator
+from summary_cache import summarize_file
+
+# --- 設定 ---
+BENCHMARK_RESULTS_DIR = "benchmark_results"  # 結果のJSONの置き場所
+BENCHMARK_DAYS = 120  # 生成するログの日数（暦日、約4か月）
+BENCHMARK_SEED = 1  # 毎回同じログで比べるための乱数の種
+BENCHMARK_START = date(2024, 1, 1)  # 生成するログの最初の日（固定して結果を比べられるようにする）
+BENCHMARK_REPEAT = 5  # 各計測の繰り返し回数（中央値を使う）
+WRITER_ROWS = 20000  # 書き込み速度の計測で書く行数
+PROGRESS_TICKETS = 50  # 進捗バーを計算するチケット数（Hub UI の一覧の行数）
+REGRESSION_RATIO = 1.2  # --compare でこれ以上遅くなった項目を警告する
+# --- 設定ここまで ---
+
+
+def measure(func, repeat=BENCHMARK_REPEAT, number=1, setup=None):
+    """
+    func を number 回呼ぶ計測を repeat 回行い、1回あたりのミリ秒（中央値・最小・最大）を返す。
+    計測中は GC を止める（timeit と同じ）。setup は各回の前に計測の外で呼ばれる。
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            elapsed = time.perf_counter() - start
+        finally:
+            if gc_enabled:
+                gc.enable()
+        times.append(elapsed / number * 1000)
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "max_ms": max(times),
+            "repeat": repeat, "number": number}
+
+
+# --- Benchmarks: each takes the dataset and returns a result dict (or raises ImportError to skip) ---
+def bench_analyze_log_file(data, repeat):
+    from analyze_logs import analyze_log_file
+    result = measure(lambda: analyze_log_file(data["largest"]), repeat)
+    days = data["paths"]
+    total = measure(lambda: [analyze_log_file(path) for path in days], max(1, repeat // 2))
+    result["all_days_ms"] = total["median_ms"]
+    result["per_day_ms"] = total["median_ms"] / len(days)
+    return result
+
+
+def bench_generate_llm_prompt(data, repeat):
+    from analyze_logs import analyze_log_file, generate_llm_prompt
+    usage_summary, _ = analyze_log_file(data["largest"])
+    result = measure(lambda: generate_llm_prompt(usage_summary), repeat)
+    result["entries"] = len(usage_summary)
+    return result
+
+
+def bench_range_prompt(data, repeat):
+    from prompt_builder import stream_range_prompt, build_prompt
+    days = [(datetime.strptime(os.path.basename(path)[4:12], "%Y%m%d").date(), summarize_file(path))
+            for path in data["paths"]]
+    result = measure(lambda: build_prompt(stream_range_prompt(days)), repeat)
+    result["days"] = len(days)
+    return result
+
+
+def bench_summarize_file(data, repeat):
+    """過去の日の集計（集計キャッシュに入る前の1日分の1パス集計）。"""
+    result = measure(lambda: summarize_file(data["largest"]), repeat)
+    result["rows"] = data["largest_rows"]
+    return result
+
+
+def _seed_totals(path):
+    # Same as logger_daemon.LoggerService._seed: today's totals from one pass over the file
+    totals = TaskDurationAggregator()
+    for record in read_records(path):
+        totals.add_interval(record.app, record.task or None, record.seconds)
+    return totals
+
+
+def bench_progress(data, repeat):
+    """Hub UI の進捗表示: 今日のタスク別合計の作成（起動時）と、切り替え1件ごとの更新・バーの再計算。"""
+    from hub_ui import progress_cells
+    from events import WindowSwitched
+    # Estimates of 0-4 hours; 0 means "no estimate" (the activity bar)
+    tickets = [(key, 3600.0 * (i % 5)) for i, key in enumerate(build_tasks(random.Random(0), PROGRESS_TICKETS))]
+    result = measure(lambda: _seed_totals(data["largest"]), repeat)
+    totals = _seed_totals(data["largest"])
+    event = WindowSwitched(datetime(2024, 1, 1, 18).strftime(TIMESTAMP_FORMAT), 1, "title", "app.exe", "work",
+                           tickets[0][0])
+
+    def update():
+        totals.on_event(event)
+        for key, estimate in tickets:
+            progress_cells(totals.task_totals.get(key, 0.0), estimate)
+
+    result["seed_ms"] = result["median_ms"]
+    update_result = measure(update, repeat, number=1000)
+    result["update_ms"] = update_result["median_ms"]
+    result["tickets"] = len(tickets)
+    return result
+
+
+def bench_writer(data, repeat):
+    """ログ書き込みの速度（行/秒）。既定のまとめ書きと、1行ごとに書き出す場合。"""
+    rows = [[datetime(2024, 1, 1, 9, 0, i % 60).strftime(TIMESTAMP_FORMAT), "Code.exe", f"ファイル{i % 300}.py - Code",
+             1234, "work", "ALPHA-1"] for i in range(WRITER_ROWS)]
+    result = {}
+    for name, options in (("batched", {}), ("every_row", {"flush_max_rows": 1})):
+        path = os.path.join(data["work_dir"], f"writer_{name}.csv")
+
+        def remove():
+            if os.path.exists(path):
+                os.remove(path)
+
+        def write():
+            writer = IntervalLogWriter(**options)
+            writer.open(path)
+            for row in rows:
+                writer.write(row)
+            writer.close()
+
+        timing = measure(write, max(1, repeat // 2), setup=remove)
+        result[f"{name}_ms"] = timing["median_ms"]
+        result[f"{name}_rows_per_s"] = WRITER_ROWS / (timing["median_ms"] / 1000)
+    result["median_ms"] = result["batched_ms"]
+    result["rows"] = WRITER_ROWS
+    return result
+
+
+BENCHMARKS = [
+    ("analyze_log_file", bench_analyze_log_file),
+    ("generate_llm_prompt", bench_generate_llm_prompt),
+    ("range_prompt", bench_range_prompt),
+    ("summarize_file", bench_summarize_file),
+    ("progress", bench_progress),
+    ("writer", bench_writer),
+]
+
+
+def git_revision():
+    """計測したコミット（作業ツリーに変更があれば -dirty を付ける）。git が無ければ None。"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def prepare_data(data_dir, days=BENCHMARK_DAYS, seed=BENCHMARK_SEED):
+    """data_dir に合成ログを作り（既にあれば使い回す）、計測に使う情報をまとめる。"""
+    paths = sorted(os.path.join(data_dir, name) for name in os.listdir(data_dir)
+                   if name.startswith("log_") and name.endswith(".csv")) if os.path.isdir(data_dir) else []
+    if not paths:
+        print(f"合成ログを生成しています ({days}日分, seed={seed}) ...")
+        paths = generate_logs(data_dir, days, BENCHMARK_START, seed)
+    largest = max(paths, key=os.path.getsize)
+    return {
+        "paths": paths,
+        "largest": largest,
+        "largest_rows": sum(1 for _ in read_records(largest)),
+        "rows": sum(1 for path in paths for _ in read_records(path)),
+        "bytes": sum(os.path.getsize(path) for path in paths),
+    }
+
+
+def run_benchmarks(data, names=None, repeat=BENCHMARK_REPEAT):
+    results = {}
+    for name, bench in BENCHMARKS:
+        if names and name not in names:
+            continue
+        print(f"  {name} ...", end="", flush=True)
+        try:
+            # The code under test prints progress ("新しいログファイルを作成します" etc.)
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[name] = bench(data, repeat)
+        except ImportError as e:
+            # e.g. pandas is not installed: record the skip so the files stay comparable
+            results[name] = {"skipped": str(e)}
+            print(f" スキップ ({e})")
+            continue
+        print(f" {results[name]['median_ms']:.2f}ms")
+    return results
+
+
+def compare(results, baseline, ratio=REGRESSION_RATIO):
+    """前の結果と比べて表示し、ratio 倍以上遅くなった項目の名前を返す。"""
+    slower = []
+    print(f"\n前回 ({baseline.get('commit')}, {baseline.get('timestamp')}) との比較:")
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name, {})
+        if "median_ms" not in result or "median_ms" not in before:
+            continue
+        change = result["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        mark = "  <-- 遅くなりました" if change >= ratio else ""
+        print(f"  {name:<20}{before['median_ms']:>10.2f}ms -> {result['median_ms']:>10.2f}ms  (x{change:.2f}){mark}")
+        if change >= ratio:
+            slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成ログを使って解析・プロンプト生成・進捗計算・書き込みを計測します。")
+    parser.add_argument("names", nargs="*", help=f"計測する項目（省略時はすべて）: {', '.join(n for n, _ in BENCHMARKS)}")
+    parser.add_argument("--data-dir", help="合成ログの場所（無ければ生成する。省略時は一時ディレクトリ）")
+    parser.add_argument("--days", type=int, default=BENCHMARK_DAYS, help="生成する日数")
+    parser.add_argument("--repeat", type=int, default=BENCHMARK_REPEAT, help="各計測の繰り返し回数")
+    parser.add_argument("--output", help=f"結果のJSON（省略時は {BENCHMARK_RESULTS_DIR}/日時_コミット.json）")
+    parser.add_argument("--compare", help="比べる前回の結果のJSON")
+    args = parser.parse_args()
+
+    unknown = set(args.names) - {name for name, _ in BENCHMARKS}
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory(prefix="ptimer_bench_") as work_dir:
+        data = prepare_data(args.data_dir or os.path.join(work_dir, "logs"), args.days)
+        data["work_dir"] = work_dir
+        print(f"{len(data['paths'])}日分・{data['rows']}行・{data['bytes'] / 1e6:.1f}MB のログで計測します。")
+        results = run_benchmarks(data, set(args.names), max(1, args.repeat))
+
+    commit = git_revision()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "dataset": {"days": len(data["paths"]), "rows": data["rows"], "bytes": data["bytes"],
+                    "largest_day_rows": data["largest_rows"], "seed": BENCHMARK_SEED},
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        BENCHMARK_RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            slower = compare(results, json.load(f))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
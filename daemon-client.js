@@ -0,0 +1,117 @@
+// ロガーデーモン（unified_logger.py / logger_daemon.py）との連携
+// デーモンが動いていれば、このページのタイマーはデーモンのポモドーロを表示・操作するだけの画面になる。
+// 状態はサーバーからのイベント（Server-Sent Events）で受け取り、ファイルやAPIを定期的に読みに行くことはしない。
+// デーモンは別のページ（file:// を含む）からの呼び出しを受け付けないので、連携するには
+// デーモンが配信するページ（http://127.0.0.1:8765/）で開く。
+class DaemonLink {
+    constructor(timer, baseUrl = location.protocol.startsWith('http') ? location.origin : 'http://127.0.0.1:8765') {
+        this.timer = timer;
+        this.baseUrl = baseUrl;
+        this.state = null;
+        this.receivedAt = 0;
+        this.ticker = null;
+        this.source = null;
+    }
+
+    async connect() {
+        try {
+            const response = await fetch(`${this.baseUrl}/api/state`);
+            if (!response.ok) return false;
+            this.applyState(await response.json());
+        } catch (e) {
+            // デーモンが無い: ページ単体のタイマーのまま使う
+            return false;
+        }
+        this.takeOverControls();
+        this.subscribe();
+        this.timer.showNotificationBar('ロガーと連携しました', 'info');
+        return true;
+    }
+
+    subscribe() {
+        // EventSource は切れても自動で再接続し、最初にスナップショットが届く
+        this.source = new EventSource(`${this.baseUrl}/api/events`);
+        this.source.onmessage = (message) => {
+            const event = JSON.parse(message.data);
+            if (event.type === 'Snapshot') {
+                this.applyState(event);
+            } else if (event.type === 'StateChanged' || event.type === 'LogPaused') {
+                this.refreshState();
+            }
+        };
+    }
+
+    async refreshState() {
+        try {
+            const response = await fetch(`${this.baseUrl}/api/state`);
+            if (response.ok) this.applyState(await response.json());
+        } catch (e) {
+            // 次のイベント（再接続時のスナップショット）で追いつく
+        }
+    }
+
+    async command(command, task = null) {
+        const response = await fetch(`${this.baseUrl}/api/command`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ command, task })
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            this.timer.showNotificationBar(`ロガーの操作に失敗しました: ${data.error}`, 'error');
+            return;
+        }
+        this.applyState(data);
+    }
+
+    takeOverControls() {
+        // スタート/一時停止・リセットはデーモンへの操作に置き換える（カウントダウンはデーモンが持つ）
+        this.timer.toggleTimer = () => {
+            if (this.state && this.state.state !== 'idle') {
+                this.command('stop');
+            } else if (this.timer.currentSession === 'work') {
+                this.command('start_work', this.timer.getCurrentActiveTask() || '作業');
+            } else {
+                this.command('start_break');
+            }
+        };
+        this.timer.resetTimer = () => this.command('stop');
+    }
+
+    applyState(state) {
+        this.state = state;
+        this.receivedAt = performance.now();
+        const running = state.state !== 'idle';
+
+        // isRunning は false のまま（カウントダウンはデーモン側にあり、ページを閉じても止まらない）
+        this.timer.currentSession = state.state === 'break' ? 'shortBreak' : 'work';
+        this.timer.startBtn.innerHTML = running
+            ? '<i class="fas fa-stop"></i> 停止'
+            : '<i class="fas fa-play"></i> スタート';
+        this.timer.startBtn.classList.toggle('running', running);
+        this.timer.timerCircle.classList.toggle('running', running);
+
+        clearInterval(this.ticker);
+        this.ticker = running ? setInterval(() => this.render(), 1000) : null;
+        this.render();
+    }
+
+    render() {
+        if (!this.state) return;
+        if (this.state.state === 'idle') {
+            this.timer.currentTime = this.timer.workDuration;
+        } else {
+            const elapsed = (performance.now() - this.receivedAt) / 1000;
+            this.timer.currentTime = Math.max(0, Math.round(this.state.remaining - elapsed));
+        }
+        this.timer.updateDisplay();
+    }
+}
+
+let daemonLink;
+
+document.addEventListener('DOMContentLoaded', () => {
+    // script.js の初期化（pomodoroTimer の作成）の後に実行される
+    daemonLink = new DaemonLink(pomodoroTimer);
+    daemonLink.connect();
+});
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+from collections import namedtuple
+
+# --- イベントの型 ---
+# ポモドーロの状態が変わった。at は締め切りによる切り替えならその予定時刻、操作による変更なら None
+StateChanged = namedtuple("StateChanged", ["old", "new", "task", "at"])
+# 作業中のタスク名が変わった
+TaskChanged = namedtuple("TaskChanged", ["old", "new"])
+# アクティブウィンドウが切り替わり、ログに記録された。classification は title_rules の分類（ルールが無ければ None）
+WindowSwitched = namedtuple("WindowSwitched",
+                            ["timestamp", "pid", "window_title", "process_name", "state", "task", "classification"],
+                            defaults=(None,))
+# ログ記録が一時停止／再開された
+LogPaused = namedtuple("LogPaused", ["paused"])
+# 日付が変わり、ログファイルが切り替わった
+DayRolledOver = namedtuple("DayRolledOver", ["old_file", "new_file"])
+
+EVENT_TYPES = (StateChanged, TaskChanged, WindowSwitched, LogPaused, DayRolledOver)
+
+
+class EventBus:
+    """
+    タイマーやロガーからのイベントを購読者に配るクラス。
+    購読はコールバック（発行したスレッドで呼ばれる）かキュー（別スレッドで取り出す）で行う。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []  # (event_types or None, callback)
+
+    def subscribe(self, callback, event_types=None):
+        """
+        callback(event) を登録する。event_types を省略すると全イベントを受け取る。
+        戻り値を unsubscribe() に渡すと解除できる。
+        """
+        entry = (tuple(event_types) if event_types else None, callback)
+        with self._lock:
+            # Copy-on-write so publish() can iterate without holding the lock
+            self._subscribers = self._subscribers + [entry]
+        return entry
+
+    def subscribe_queue(self, event_types=None, maxsize=0):
+        """イベントを受け取る Queue を作って返す（Tk など単一スレッドのUI向け）。"""
+        q = queue.Queue(maxsize)
+
+        def put(event):
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                pass  # A stalled consumer must never block the publisher
+
+        subscription = self.subscribe(put, event_types)
+        q.subscription = subscription
+        return q
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not subscription]
+
+    def publish(self, event):
+        for event_types, callback in self._subscribers:
+            if event_types is not None and not isinstance(event, event_types):
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"イベント処理でエラーが発生しました ({type(event).__name__}): {e}")
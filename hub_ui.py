@@ -6,12 +6,33 @@ import time
 import json
 import os
 import webbrowser
-from jira import JIRA, JIRAError
+import queue
 from unified_logger import UnifiedLogger
-import pandas as pd
-from datetime import datetime
+from events import StateChanged, LogPaused, WindowSwitched, DayRolledOver
+from logger_daemon import LoggerService, LoggerClient, bind_api_server, serve_api
+from issue_cache import IssueCache, PLAN_FRESH, PLAN_DELTA, PLAN_FULL
+from datetime import datetime, timedelta
 
 SETTINGS_FILE = "settings.json"
+EVENT_POLL_MS = 200  # ロガーからのイベントキューを確認する間隔（ミリ秒）
+LOG_VIEW_LINES = 20  # ログビューに表示する行数
+
+def progress_cells(duration, estimate):
+    """チケット一覧の進捗バーと時間の表示 (bar, time_text) を、作業秒数と見積もり秒数から作る。"""
+    time_text = f"{int(duration // 60)} min"
+
+    # Qualitative Bar
+    # Assume 10 chars. 100% = 10 blocks.
+    # If estimate is 0, we can't show %. Just show duration.
+    if estimate > 0:
+        filled = int(min(duration / estimate, 1.0) * 10)
+        bar = "█" * filled + "░" * (10 - filled)
+    elif duration > 0:
+        # No estimate: Show activity indicator if duration > 0
+        bar = "▒▒▒▒▒▒▒▒▒▒" # Indicates working but unknown progress
+    else:
+        bar = "░░░░░░░░░░"
+    return bar, time_text
 
 class HubUI(tk.Tk):
     def __init__(self):
@@ -20,15 +41,50 @@ class HubUI(tk.Tk):
         self.geometry("1100x700")
 
         self.load_settings()
-        self.logger = UnifiedLogger()
+        # One logger per machine: attach to a running one, otherwise host it (and its API) here
+        # The port is taken before the logger is built, so two processes never write the same log
+        try:
+            self.api_server = bind_api_server()
+        except OSError:
+            self.api_server = None
+            self.logger = LoggerClient()
+            self.activity = self.logger
+        else:
+            self.logger = UnifiedLogger()
+            self.activity = LoggerService(self.logger)
+            serve_api(self.api_server, self.activity)
+        # Subscribe before the logger starts so the first state (a client's snapshot) is not missed
+        self.ui_events = self.logger.bus.subscribe_queue((StateChanged, LogPaused, WindowSwitched, DayRolledOver))
         self.logger_thread = threading.Thread(target=self.logger.run, daemon=True)
         self.logger_thread.start()
 
-        # Initialize Jira Client
-        self.jira = None
+        # Initialize Jira Client (pages are fetched on a worker pool)
+        self.jira_fetcher = None
+        self.fetch_job = None
+        self.fetch_queue = queue.Queue()
+        self.issue_cache = IssueCache()
+
+        # Redraw the status only when the timer/logger says something changed
+        self.p_state = "idle"
+        self.p_task = None
+        self.log_paused = False
+        self._status_text = None
+        self._countdown_job = None
+        # Per-task seconds for today, refreshed from the logger when a switch is recorded
+        self.task_totals = {}
+        # Optional: take per-task sums from the SQLite store instead of the CSV
+        db_path = self.settings.get("activity_db")
+        self.activity_store = None
+        if db_path and os.path.exists(db_path):
+            from activity_store import ActivityStore
+            self.activity_store = ActivityStore(db_path)
 
         self.create_widgets()
-        self.start_log_updater()
+        # Last session's tickets, straight from disk (no network round trip)
+        if not self.settings.get("mock_mode"):
+            self.show_cached_tickets(self.build_jql())
+        self.load_activity()
+        self.process_events()
 
     def load_settings(self):
         if os.path.exists(SETTINGS_FILE):
@@ -76,6 +132,16 @@ class HubUI(tk.Tk):
 
         ttk.Button(filter_frame, text="Fetch", command=self.fetch_tickets).pack(side="left", padx=5)
 
+        # Changing a filter makes any in-flight fetch obsolete
+        self.project_var.trace_add("write", lambda *args: self.cancel_fetch())
+        self.status_var.trace_add("write", lambda *args: self.cancel_fetch())
+
+        # Fetch progress
+        self.fetch_progress = ttk.Progressbar(top_frame, length=120, mode="determinate")
+        self.fetch_progress.pack(side="left", padx=5)
+        self.fetch_status = ttk.Label(top_frame, text="")
+        self.fetch_status.pack(side="left")
+
         ttk.Button(top_frame, text="Settings", command=self.open_settings).pack(side="right", padx=5)
 
         # --- Left Column: Jira Tickets ---
@@ -134,17 +200,16 @@ class HubUI(tk.Tk):
             return True
 
         try:
-            self.jira = JIRA(
-                server=self.settings["jira_url"],
-                basic_auth=(self.settings["jira_email"], self.settings["jira_token"])
-            )
+            # Only needed once tickets are fetched from a real Jira
+            from jira_fetcher import JiraFetcher, JiraRestClient
+            client = JiraRestClient(self.settings["jira_url"], self.settings["jira_email"], self.settings["jira_token"])
+            self.jira_fetcher = JiraFetcher(client)
             return True
         except Exception as e:
             messagebox.showerror("Jira Error", f"Failed to connect: {e}")
             return False
 
-    def fetch_tickets(self):
-        # Build JQL
+    def build_jql(self):
         jql_parts = []
         project = self.project_var.get()
         status = self.status_var.get()
@@ -156,15 +221,26 @@ class HubUI(tk.Tk):
 
         # Default to current user if no filter
         if not jql_parts:
-            jql = "assignee = currentUser() ORDER BY updated DESC"
-        else:
-            jql = " AND ".join(jql_parts) + " ORDER BY updated DESC"
+            return "assignee = currentUser() ORDER BY updated DESC"
+        return " AND ".join(jql_parts) + " ORDER BY updated DESC"
 
-        # Clear existing
+    def show_cached_tickets(self, jql):
+        """キャッシュにある課題を表示する（ネットワークには出ない）。"""
         for item in self.tree_jira.get_children():
             self.tree_jira.delete(item)
+        cached = self.issue_cache.get(jql) or []
+        for key, summary, status, est in cached:
+            self.tree_jira.insert("", "end", iid=key, values=(key, summary, status, "░░░░░░░░░░", "0 min"), tags=(str(est),))
+        return cached
+
+    def fetch_tickets(self):
+        jql = self.build_jql()
 
         if self.settings.get("mock_mode"):
+            # Clear existing
+            for item in self.tree_jira.get_children():
+                self.tree_jira.delete(item)
+
             # Mock Data
             mock_tickets = [
                 ("PROJ-101", "Design new UI layout", "In Progress", 3600), # 1 hour est
@@ -173,75 +249,103 @@ class HubUI(tk.Tk):
                 ("PROJ-104", "Update dependency versions", "To Do", 0)
             ]
             for t in mock_tickets:
-                self.tree_jira.insert("", "end", values=(t[0], t[1], t[2], "░░░░░░░░░░", "0 min"), tags=(str(t[3]),))
+                self.tree_jira.insert("", "end", iid=t[0], values=(t[0], t[1], t[2], "░░░░░░░░░░", "0 min"), tags=(str(t[3]),))
                 # Store estimate in tags or hidden value? Tags is good for meta.
         else:
-            if not self.jira and not self.connect_jira():
-                return
-
-            try:
-                issues = self.jira.search_issues(jql)
-                for issue in issues:
-                    est = issue.fields.timeoriginalestimate or 0
-                    self.tree_jira.insert("", "end", values=(issue.key, issue.fields.summary, issue.fields.status.name, "░░░░░░░░░░", "0 min"), tags=(str(est),))
-            except JIRAError as e:
-                messagebox.showerror("Jira Error", f"Failed to fetch tickets: {e}")
+            # Stale-while-revalidate: render the cached list now, refresh in the background
+            cached = self.show_cached_tickets(jql)
+            plan = self.issue_cache.plan(jql)
+            if plan == PLAN_FRESH:
+                self.fetch_status.config(text=f"{len(cached)} issues (cached)")
+            else:
+                self.revalidate(jql, plan)
 
         # Update Time Spent after loading (requires parsing CSV)
         self.update_progress_from_logs()
 
-    def update_progress_from_logs(self):
-        log_file = self.logger.current_log_file
-        if not os.path.exists(log_file):
+    def revalidate(self, jql, plan):
+        if not self.jira_fetcher and not self.connect_jira():
             return
 
-        try:
-            df = pd.read_csv(log_file, encoding='utf-8-sig')
-            if 'タスク名' in df.columns:
-                df['Timestamp'] = pd.to_datetime(df['タイムスタンプ'])
-                # Calculate duration per row
-                df['Duration'] = df['Timestamp'].diff().shift(-1).dt.total_seconds()
-                # Fill NaN with 0 or assumption (e.g. 60s)
-                df['Duration'] = df['Duration'].fillna(0) # Last entry is 0 duration for now
-
-                # Filter by Task Name
-                task_durations = df.groupby('タスク名')['Duration'].sum()
-
-                # Update Treeview
+        # Pages stream in on worker threads; process_events() inserts them on the Tk thread
+        query = jql if plan == PLAN_FULL else self.issue_cache.delta_jql(jql)
+        self.fetch_progress.config(value=0, maximum=1)
+        self.fetch_status.config(text="Updating..." if plan == PLAN_DELTA else "Loading...")
+        job = self.jira_fetcher.fetch(
+            query,
+            on_page=lambda job, issues: self.fetch_queue.put(("page", job, issues)),
+            on_done=lambda job: self.fetch_queue.put(("done", job, None)),
+            on_error=lambda job, e: self.fetch_queue.put(("error", job, e)),
+        )
+        job.cache_jql = jql
+        job.full = plan == PLAN_FULL
+        job.synced_at = time.time()
+        job.received = []
+        self.fetch_job = job
+
+    def cancel_fetch(self):
+        if self.fetch_job is not None:
+            self.fetch_job.cancel()
+            self.fetch_job = None
+            self.fetch_status.config(text="Cancelled")
+
+    def handle_fetch_result(self, kind, job, payload):
+        if job is not self.fetch_job:
+            return  # Stale page from a cancelled or superseded fetch
+
+        if kind == "page":
+            for key, summary, status, est in payload:
+                values = (key, summary, status, "░░░░░░░░░░", "0 min")
+                if self.tree_jira.exists(key):
+                    self.tree_jira.item(key, values=values, tags=(str(est),))
+                else:
+                    self.tree_jira.insert("", "end", iid=key, values=values, tags=(str(est),))
+                # Keep the server's order (updated DESC): fresh rows float to the top
+                self.tree_jira.move(key, "", len(job.received))
+                job.received.append((key, summary, status, est))
+            total = job.total or job.loaded
+            self.fetch_progress.config(value=job.loaded, maximum=max(total, 1))
+            self.fetch_status.config(text=f"{job.loaded}/{total}")
+            # Show time spent for the rows that just arrived
+            self.update_progress_from_logs()
+        elif kind == "done":
+            self.fetch_job = None
+            if job.full:
+                # Drop cached rows that no longer match the query
+                seen = {issue[0] for issue in job.received}
                 for item in self.tree_jira.get_children():
-                    vals = self.tree_jira.item(item, "values")
-                    tags = self.tree_jira.item(item, "tags")
-                    key = vals[0]
-                    estimate = float(tags[0]) if tags and tags[0] != 'None' else 0
-
-                    duration = 0
-                    if key in task_durations:
-                        duration += task_durations[key]
-
-                    mins = int(duration // 60)
-                    time_text = f"{mins} min"
-
-                    # Qualitative Bar
-                    # Assume 10 chars. 100% = 10 blocks.
-                    # If estimate is 0, we can't show %. Just show duration.
-                    bar = ""
-                    if estimate > 0:
-                        percent = min(duration / estimate, 1.0)
-                        filled = int(percent * 10)
-                        bar = "█" * filled + "░" * (10 - filled)
-                    else:
-                        # No estimate: Show activity indicator if duration > 0
-                        if duration > 0:
-                            bar = "▒▒▒▒▒▒▒▒▒▒" # Indicates working but unknown progress
-                        else:
-                            bar = "░░░░░░░░░░"
-
-                    # Update row
-                    self.tree_jira.item(item, values=(key, vals[1], vals[2], bar, time_text))
+                    if item not in seen:
+                        self.tree_jira.delete(item)
+            self.issue_cache.store(job.cache_jql, job.received, job.full, job.synced_at)
+            self.fetch_status.config(text=f"{len(self.tree_jira.get_children())} issues")
+        elif kind == "error":
+            self.fetch_job = None
+            self.fetch_status.config(text="Error")
+            messagebox.showerror("Jira Error", f"Failed to fetch tickets: {payload}")
 
-        except Exception as e:
-            # print(f"Error calculating progress: {e}")
-            pass
+    def update_progress_from_logs(self):
+        if self.activity_store is not None:
+            today = datetime.combine(datetime.now().date(), datetime.min.time())
+            totals = self.activity_store.task_totals(today, today + timedelta(days=1))
+            task_duration = lambda key: totals.get(key, 0.0)
+        else:
+            # Totals are refreshed on WindowSwitched events; this only redraws the bars
+            task_duration = lambda key: self.task_totals.get(key, 0.0)
+
+        # Update Treeview
+        for item in self.tree_jira.get_children():
+            vals = self.tree_jira.item(item, "values")
+            tags = self.tree_jira.item(item, "tags")
+            key = vals[0]
+            estimate = float(tags[0]) if tags and tags[0] != 'None' else 0
+
+            duration = task_duration(key)
+
+            bar, time_text = progress_cells(duration, estimate)
+
+            # Update row only if something changed
+            if (vals[3], vals[4]) != (bar, time_text):
+                self.tree_jira.item(item, values=(key, vals[1], vals[2], bar, time_text))
 
     def on_ticket_double_click(self, event):
         self.start_work_on_ticket()
@@ -265,53 +369,113 @@ class HubUI(tk.Tk):
         key = self.tree_jira.item(selected[0], "values")[0]
         summary = self.tree_jira.item(selected[0], "values")[1]
 
+        # Its status is likely to change now; make the next Fetch revalidate it
+        self.issue_cache.invalidate_issue(key)
+
         # Start in Logger
         # We use the key as the "Task Name" for easy tracking
+        # The StateChanged event updates the status label
         self.logger.pomodoro.start_work(f"{key}")
-        self.status_label.config(text=f"Current: Working on {key}")
 
-    def start_log_updater(self):
-        self.update_log_view()
-        self.after(5000, self.start_log_updater) # Update every 5 seconds
-
-    def update_log_view(self):
-        log_file = self.logger.current_log_file
-        if not os.path.exists(log_file):
+    def load_activity(self):
+        """直近の記録とタスク別合計をロガーから取り、ログビューを作り直す（ファイルは読まない）。"""
+        try:
+            rows = self.activity.recent(LOG_VIEW_LINES)
+            self.task_totals = self.activity.totals()["tasks"]
+        except (OSError, ValueError) as e:
+            print(f"ロガーから記録を取得できませんでした: {e}")
             return
+        self.log_text.config(state="normal")
+        self.log_text.delete("1.0", "end")
+        self.log_text.config(state="disabled")
+        self.append_log_lines(self.format_activity(row) for row in rows)
+        self.update_progress_from_logs()
 
-        # Read last N lines
-        try:
-            with open(log_file, "r", encoding="utf-8-sig") as f:
-                lines = f.readlines()
-                last_lines = lines[-20:] # Show last 20
-
-            self.log_text.config(state="normal")
-            self.log_text.delete("1.0", "end")
-            for line in last_lines:
-                self.log_text.insert("end", line)
-            self.log_text.config(state="disabled")
-            self.log_text.see("end")
-
-            # Also update status label from logger state
-            p_state = self.logger.pomodoro.get_state()
-            task = p_state['task'] if p_state['task'] else "Idle"
-            state = p_state['state']
-
-            # Update status text
-            status_text = f"Current: {state.upper()} - {task}"
-            if state != "idle":
-                 mins = p_state['remaining_time'] // 60
-                 secs = p_state['remaining_time'] % 60
-                 status_text += f" ({mins:02d}:{secs:02d})"
+    @staticmethod
+    def format_activity(row):
+        fields = ("timestamp", "process_name", "window_title", "pid", "state", "task")
+        return ",".join("" if row.get(name) is None else str(row[name]) for name in fields)
+
+    def append_log_lines(self, lines):
+        self.log_text.config(state="normal")
+        for line in lines:
+            self.log_text.insert("end", line + "\n")
+        # Keep the widget at the last N lines by trimming from the top
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - LOG_VIEW_LINES
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+        self.log_text.config(state="disabled")
+        self.log_text.see("end")
+
+    def process_events(self):
+        changed = False
+        switched = []
+        new_day = False
+        while True:
+            try:
+                event = self.ui_events.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(event, StateChanged):
+                self.p_state = event.new
+                self.p_task = event.task
+                changed = True
+            elif isinstance(event, LogPaused):
+                self.log_paused = event.paused
+                changed = True
+            elif isinstance(event, WindowSwitched):
+                switched.append(event)
+            elif isinstance(event, DayRolledOver):
+                new_day = True
+        if changed:
+            self.refresh_status()
+        if new_day:
+            self.load_activity()
+        elif switched:
+            self.append_log_lines(self.format_activity(event._asdict()) for event in switched[-LOG_VIEW_LINES:])
+            try:
+                self.task_totals = self.activity.totals()["tasks"]
+            except (OSError, ValueError):
+                pass  # Keep the last totals until the logger answers again
+            self.update_progress_from_logs()
 
+        while True:
+            try:
+                kind, job, payload = self.fetch_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.handle_fetch_result(kind, job, payload)
+
+        self.after(EVENT_POLL_MS, self.process_events)
+
+    def refresh_status(self):
+        task = self.p_task if self.p_task else "Idle"
+        status_text = f"Current: {self.p_state.upper()} - {task}"
+        if self.p_state != "idle":
+            remaining = int(self.logger.pomodoro.remaining_time)
+            status_text += f" ({remaining // 60:02d}:{remaining % 60:02d})"
+        if self.log_paused:
+            status_text += " [LOG PAUSED]"
+        if status_text != self._status_text:
+            self._status_text = status_text
             self.status_label.config(text=status_text)
 
-            # Also trigger progress update
-            self.update_progress_from_logs()
-
-        except Exception as e:
-            # print(f"Log update error: {e}")
-            pass
+        # Keep the countdown ticking only while a phase is running
+        if self._countdown_job is not None:
+            self.after_cancel(self._countdown_job)
+            self._countdown_job = None
+        if self.p_state != "idle":
+            self._countdown_job = self.after(1000, self.refresh_status)
+
+    def close(self):
+        self.cancel_fetch()
+        if self.jira_fetcher:
+            self.jira_fetcher.shutdown()
+        # For a client this only disconnects; the logger keeps running in its own process
+        self.logger.stop()
+        if self.api_server is not None:
+            self.api_server.shutdown()
+        self.destroy()
 
     def open_settings(self):
         # Simple settings dialog
@@ -343,11 +507,29 @@ class HubUI(tk.Tk):
             self.settings["jira_token"] = token_entry.get()
             self.settings["mock_mode"] = mock_var.get()
             self.save_settings()
+            # Reconnect with the new credentials on the next fetch
+            self.cancel_fetch()
+            if self.jira_fetcher:
+                self.jira_fetcher.shutdown()
+            self.jira_fetcher = None
             win.destroy()
 
         ttk.Button(win, text="Save", command=save).grid(row=4, column=0, columnspan=2)
 
-if __name__ == "__main__":
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Jira のタスクと作業ログをまとめて表示します。")
+    parser.add_argument("--profile-startup", nargs="?", const="", metavar="JSON",
+                        help="起動せずに、段階ごとの import 時間と RSS を表示します（JSON を指定すると保存）")
+    args = parser.parse_args()
+    if args.profile_startup is not None:
+        import startup_profile
+        raise SystemExit(startup_profile.run(startup_profile.HUB_STAGES, args.profile_startup or None))
+
     app = HubUI()
-    app.protocol("WM_DELETE_WINDOW", lambda: (app.logger.stop(), app.destroy()))
+    app.protocol("WM_DELETE_WINDOW", app.close)
     app.mainloop()
+
+if __name__ == "__main__":
+    main()
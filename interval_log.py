@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import csv
+import glob
+import os
+import threading
+from collections import defaultdict
+
+from log_writer import LogWriter
+from log_schema import (POINT_HEADER, INTERVAL_HEADER, is_interval_header, read_header, read_records,
+                        seconds_between)
+
+
+def make_interval(point_row, end, header=POINT_HEADER):
+    """切り替え行 (point_row) を end（タイムスタンプ文字列）で閉じた区間行にする。"""
+    record = dict(zip(header, point_row))
+    start = record.get("タイムスタンプ", "")
+    return [start, end, seconds_between(start, end)] + [record.get(name, "") for name in INTERVAL_HEADER[3:]]
+
+
+class IntervalLogWriter(LogWriter):
+    """
+    切り替え行（POINT_HEADER の並び）を受け取り、区間行（INTERVAL_HEADER）として書くライター。
+    直前の切り替えは次の切り替えか close_interval()（一時停止・日付変更・終了）で閉じられる。
+    書き出しの待ち行列・フラッシュポリシーは LogWriter と同じ。
+    """
+
+    def __init__(self, point_header=POINT_HEADER, **kwargs):
+        self.point_header = list(point_header)
+        self._current = None  # Switch row whose interval is still open
+        self._interval_lock = threading.Lock()
+        super().__init__(INTERVAL_HEADER, **kwargs)
+
+    def write(self, row, state_changed=False):
+        with self._interval_lock:
+            previous, self._current = self._current, list(row)
+            if previous is not None:
+                super().write(make_interval(previous, self._current[0], self.point_header), state_changed)
+
+    def close_interval(self, end):
+        """開いている区間を end（タイムスタンプ文字列）で閉じる。閉じた区間が無ければ何もしない。"""
+        with self._interval_lock:
+            previous, self._current = self._current, None
+            if previous is not None:
+                super().write(make_interval(previous, end, self.point_header), state_changed=True)
+
+    def _prepare_file(self, path):
+        # Today's file may still be in the old format (e.g. right after upgrading)
+        if path and os.path.exists(path) and os.path.getsize(path) > 0:
+            header = read_header(path)
+            if header and not is_interval_header(header):
+                print(f"旧形式のログを区間形式に変換します: {path}")
+                convert_point_log(path)
+        super()._prepare_file(path)
+
+
+def sum_intervals(path, idle_threshold=None):
+    """
+    1パスで (アプリ, タイトル) 別・アプリ別・タスク別の合計秒数を返す。形式は問わない。
+    idle_threshold 秒を超える区間はその長さで打ち切る。
+    """
+    usage = defaultdict(float)
+    apps = defaultdict(float)
+    tasks = defaultdict(float)
+    for record in read_records(path):
+        seconds = min(record.seconds, idle_threshold) if idle_threshold else record.seconds
+        usage[(record.app, record.title)] += seconds
+        apps[record.app] += seconds
+        if record.task:
+            tasks[record.task] += seconds
+    return usage, apps, tasks
+
+
+def convert_point_log(src, dst=None):
+    """
+    旧形式（切り替え時刻のみ）のログを区間形式に変換する。dst を省略すると src を置き換える。
+    行は時刻順に並べ直してから閉じるので、元の集計 (sort + shift(-1)) と同じ秒数になる。
+    戻り値は書き出した行数。
+    """
+    with open(src, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        if is_interval_header(reader.fieldnames):
+            return 0
+        rows = [row for row in reader if row.get("タイムスタンプ")]
+    rows.sort(key=lambda row: row["タイムスタンプ"])
+
+    out_rows = []
+    for i, row in enumerate(rows):
+        end = rows[i + 1]["タイムスタンプ"] if i + 1 < len(rows) else row["タイムスタンプ"]
+        out_rows.append(make_interval([row.get(name) or "" for name in POINT_HEADER], end))
+
+    target = dst or src
+    tmp_path = target + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(INTERVAL_HEADER)
+        writer.writerows(out_rows)
+    os.replace(tmp_path, target)
+    return len(out_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="旧形式（切り替え時刻のみ）のログCSVを区間形式に変換します。")
+    parser.add_argument("pattern", nargs="?", default="log_*.csv", help="変換するファイルのglobパターン")
+    parser.add_argument("--suffix", default="",
+                        help="指定すると元のファイルを残し、この接尾辞を付けた別ファイルに書き出します（例: .interval.csv）")
+    args = parser.parse_args()
+
+    for path in sorted(glob.glob(args.pattern)):
+        dst = path[:-len(".csv")] + args.suffix if args.suffix and path.endswith(".csv") else None
+        count = convert_point_log(path, dst)
+        print(f"{path}: {count}行を変換しました。" if count else f"{path}: 変換不要（区間形式）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+# --- 設定 ---
+ISSUE_CACHE_FILE = "jira_cache.json"  # 課題キャッシュの保存先
+ISSUE_CACHE_FRESH_TTL = 5 * 60  # この時間内の再取得はネットワークに出ない（秒）
+ISSUE_CACHE_FULL_TTL = 24 * 60 * 60  # これより古ければ差分ではなく全件を取り直す（秒）
+ISSUE_CACHE_VERSION = 1
+# --- 設定ここまで ---
+
+PLAN_FRESH = "fresh"  # キャッシュのみで十分
+PLAN_DELTA = "delta"  # updated >= 前回同期 の差分だけ取得
+PLAN_FULL = "full"  # 全件取得
+
+_ORDER_BY = re.compile(r"\s+ORDER\s+BY\s+.*$", re.IGNORECASE)
+
+
+class IssueCache:
+    """
+    Jira課題のディスクキャッシュ。JQLごとの課題キー一覧と、課題キーごとの
+    概要・ステータス・見積 (timeoriginalestimate) を保持する。
+    表示はキャッシュから即座に行い、裏で差分 (updated >= 前回同期) を取り直す。
+    """
+
+    def __init__(self, path=ISSUE_CACHE_FILE, fresh_ttl=ISSUE_CACHE_FRESH_TTL, full_ttl=ISSUE_CACHE_FULL_TTL):
+        self.path = path
+        self.fresh_ttl = fresh_ttl
+        self.full_ttl = full_ttl
+        self.queries = {}  # jql -> {"keys": [...], "synced_at": epoch, "full_at": epoch}
+        self.issues = {}  # key -> {"summary", "status", "timeoriginalestimate"}
+        self.load()
+
+    # --- Persistence ---
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"課題キャッシュを読み込めませんでした。作り直します: {e}")
+            return
+        if data.get("version") != ISSUE_CACHE_VERSION:
+            return
+        self.queries = data.get("queries", {})
+        self.issues = data.get("issues", {})
+
+    def save(self):
+        data = {"version": ISSUE_CACHE_VERSION, "queries": self.queries, "issues": self.issues}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        # Atomic swap so a crash never leaves a half-written cache
+        os.replace(tmp_path, self.path)
+
+    # --- Reads ---
+    def get(self, jql):
+        """JQLのキャッシュ済み課題を (キー, 概要, ステータス, 見積秒数) のリストで返す。無ければ None。"""
+        query = self.queries.get(jql)
+        if query is None:
+            return None
+        result = []
+        for key in query["keys"]:
+            issue = self.issues.get(key)
+            if issue is not None:
+                result.append((key, issue["summary"], issue["status"], issue["timeoriginalestimate"]))
+        return result
+
+    def plan(self, jql, now=None):
+        """どう再検証すべきかを返す (PLAN_FRESH / PLAN_DELTA / PLAN_FULL)。"""
+        now = time.time() if now is None else now
+        query = self.queries.get(jql)
+        if query is None or now - query.get("full_at", 0) > self.full_ttl:
+            return PLAN_FULL
+        if now - query.get("synced_at", 0) > self.fresh_ttl:
+            return PLAN_DELTA
+        return PLAN_FRESH
+
+    def delta_jql(self, jql):
+        """前回同期以降に更新された課題だけを取るJQL。"""
+        query = self.queries[jql]
+        # One minute of overlap: Jira compares at minute precision
+        since = datetime.fromtimestamp(query["synced_at"]) - timedelta(minutes=1)
+        base = _ORDER_BY.sub("", jql).strip()
+        order = jql[len(_ORDER_BY.sub("", jql)):].strip()
+        delta = f'({base}) AND updated >= "{since.strftime("%Y/%m/%d %H:%M")}"'
+        return f"{delta} {order}".strip()
+
+    # --- Writes ---
+    def store(self, jql, issues, full, synced_at):
+        """
+        取得した課題を反映する。full なら一覧を置き換え、差分なら更新分を先頭に寄せる
+        （ORDER BY updated DESC の並びを保つ）。synced_at は取得を開始した時刻。
+        """
+        for key, summary, status, estimate in issues:
+            self.issues[key] = {"summary": summary, "status": status, "timeoriginalestimate": estimate}
+
+        keys = [issue[0] for issue in issues]
+        query = self.queries.get(jql)
+        if full or query is None:
+            self.queries[jql] = {"keys": keys, "synced_at": synced_at, "full_at": synced_at}
+        else:
+            updated = set(keys)
+            query["keys"] = keys + [k for k in query["keys"] if k not in updated]
+            query["synced_at"] = synced_at
+        self._drop_orphans()
+        self.save()
+
+    def invalidate_issue(self, key):
+        """
+        課題が変わりそうな時（作業開始など）に、それを含むJQLを次回必ず全件で取り直させる。
+        差分 (updated >= 前回同期) は JQL に当たらなくなった課題を返さないので、差分では一覧から消えない。
+        """
+        changed = False
+        for query in self.queries.values():
+            if key in query["keys"] and query.get("full_at", 0) > 0:
+                query["full_at"] = 0
+                changed = True
+        if changed:
+            self.save()
+
+    def _drop_orphans(self):
+        referenced = set()
+        for query in self.queries.values():
+            referenced.update(query["keys"])
+        for key in [k for k in self.issues if k not in referenced]:
+            del self.issues[key]
+
+
+def check_status_change(path):
+    """
+    作業開始で課題のステータスが変わり JQL に当たらなくなった時、次の同期で一覧から消えるかを確かめる。
+    path に一時的なキャッシュを作る。問題のリストを返す（空なら正常）。
+    """
+    jql = "assignee = currentUser() AND status = Open ORDER BY updated DESC"
+    cache = IssueCache(path)
+    now = time.time()
+    cache.store(jql, [("PROJ-1", "a", "Open", 3600), ("PROJ-2", "b", "Open", None)], True, now)
+    problems = []
+    cache.invalidate_issue("PROJ-1")
+    plan = cache.plan(jql, now + 1)
+    if plan != PLAN_FULL:
+        problems.append(f"invalidate_issue の後の同期が {plan} でした（{PLAN_FULL} であるべき）")
+    # PROJ-1 moved to "In Progress": the full query no longer returns it
+    cache.store(jql, [("PROJ-2", "b", "Open", None)], plan == PLAN_FULL, now + 1)
+    keys = [issue[0] for issue in IssueCache(path).get(jql)]
+    if keys != ["PROJ-2"]:
+        problems.append(f"同期後の一覧が {keys} でした（['PROJ-2'] であるべき）")
+    return problems
+
+
+def main():
+    import argparse
+    import tempfile
+    parser = argparse.ArgumentParser(description="課題キャッシュの動作を確かめます。")
+    parser.add_argument("--check", action="store_true", help="ステータスが変わった課題が次の同期で一覧から消えるか確かめます")
+    args = parser.parse_args()
+
+    if args.check:
+        with tempfile.TemporaryDirectory() as tmp:
+            problems = check_status_change(os.path.join(tmp, ISSUE_CACHE_FILE))
+        for problem in problems:
+            print(f"NG: {problem}")
+        print("OK" if not problems else f"{len(problems)}件の問題があります。")
+        raise SystemExit(1 if problems else 0)
+    parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- 設定 ---
+JIRA_PAGE_SIZE = 50  # 1回のリクエストで取得する課題数 (maxResults)
+JIRA_FETCH_WORKERS = 4  # 並列に取得するページ数
+JIRA_TIMEOUT = 30  # HTTPタイムアウト（秒）
+JIRA_FIELDS = ["summary", "status", "timeoriginalestimate"]  # 取得するフィールド
+# --- 設定ここまで ---
+
+
+class JiraError(Exception):
+    pass
+
+
+class JiraRestClient:
+    """
+    Jira REST API (/rest/api/2/search) を直接呼ぶ最小限のクライアント。
+    startAt / maxResults / fields を明示して、必要なページ・フィールドだけを取得する。
+    """
+
+    def __init__(self, server, email, token, timeout=JIRA_TIMEOUT):
+        self.server = server.rstrip("/")
+        self.timeout = timeout
+        credentials = base64.b64encode(f"{email}:{token}".encode("utf-8")).decode("ascii")
+        self._headers = {"Authorization": f"Basic {credentials}", "Accept": "application/json"}
+
+    def search(self, jql, start_at=0, max_results=JIRA_PAGE_SIZE, fields=JIRA_FIELDS):
+        query = urllib.parse.urlencode({
+            "jql": jql,
+            "startAt": start_at,
+            "maxResults": max_results,
+            "fields": ",".join(fields),
+        })
+        request = urllib.request.Request(f"{self.server}/rest/api/2/search?{query}", headers=self._headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            raise JiraError(f"HTTP {e.code}: {e.read().decode('utf-8', errors='replace')[:200]}") from e
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise JiraError(str(e)) from e
+
+
+def parse_issue(raw):
+    """検索結果の課題を (キー, 概要, ステータス, 見積秒数) に変換する。"""
+    fields = raw.get("fields") or {}
+    status = fields.get("status") or {}
+    return raw["key"], fields.get("summary") or "", status.get("name") or "", fields.get("timeoriginalestimate") or 0
+
+
+class FetchJob:
+    """1回分の検索。cancel() すると以降のページは取得も通知もされない。"""
+
+    def __init__(self, jql):
+        self.jql = jql
+        self.total = None
+        self.loaded = 0
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+
+class JiraFetcher:
+    """
+    ワーカープールで検索結果をページ単位に取得するクラス。
+    最初のページで総件数を知り、残りのページを並列に取得する。
+    on_page(job, issues) はページ順に（ワーカースレッドから）呼ばれるので、
+    UI側はキューなどでメインスレッドに渡すこと。
+    """
+
+    def __init__(self, client, workers=JIRA_FETCH_WORKERS, page_size=JIRA_PAGE_SIZE, fields=JIRA_FIELDS):
+        self.client = client
+        self.page_size = page_size
+        self.fields = fields
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="JiraFetch")
+        self._current = None
+
+    def fetch(self, jql, on_page, on_done=None, on_error=None):
+        """検索を開始して FetchJob を返す。実行中の検索は取り消される。"""
+        self.cancel()
+        job = FetchJob(jql)
+        self._current = job
+        state = {"pending": {}, "next": 0, "pages": None, "lock": threading.Lock(), "failed": False,
+                 "page_size": self.page_size}
+
+        def deliver(index, issues):
+            # Hand pages to the caller strictly in order, buffering early arrivals
+            with state["lock"]:
+                state["pending"][index] = issues
+                while state["next"] in state["pending"] and not job.cancelled:
+                    page = state["pending"].pop(state["next"])
+                    state["next"] += 1
+                    job.loaded += len(page)
+                    on_page(job, page)
+                finished = state["pages"] is not None and state["next"] >= state["pages"]
+            if finished and not job.cancelled and on_done:
+                on_done(job)
+
+        def fail(e):
+            with state["lock"]:
+                if state["failed"]:
+                    return
+                state["failed"] = True
+            job.cancel()
+            if on_error:
+                on_error(job, e)
+
+        def fetch_page(index):
+            if job.cancelled:
+                return
+            try:
+                page_size = state["page_size"]
+                result = self.client.search(jql, index * page_size, page_size, self.fields)
+            except Exception as e:
+                fail(e)
+                return
+            if job.cancelled:
+                return
+            issues = [parse_issue(raw) for raw in result.get("issues", [])]
+            if index == 0:
+                job.total = result.get("total", len(issues))
+                # Servers may cap maxResults below what we asked for
+                page_size = result.get("maxResults") or page_size
+                with state["lock"]:
+                    state["page_size"] = page_size
+                    state["pages"] = max(1, -(-job.total // page_size))
+                for later in range(1, state["pages"]):
+                    self._pool.submit(fetch_page, later)
+            deliver(index, issues)
+
+        self._pool.submit(fetch_page, 0)
+        return job
+
+    def cancel(self):
+        if self._current is not None:
+            self._current.cancel()
+            self._current = None
+
+    def shutdown(self):
+        self.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class LocalJiraServer:
+    """
+    テスト・計測用のローカルなJira代替サーバー。/rest/api/2/search だけを実装する。
+    issues は (キー, 概要, ステータス, 見積秒数) のリスト。delay で1ページごとの遅延を再現できる。
+    JQL は "project = X" の絞り込みだけを解釈する。
+    """
+
+    def __init__(self, issues, max_page_size=100, delay=0.0):
+        self.issues = list(issues)
+        self.max_page_size = max_page_size
+        self.delay = delay
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                if url.path != "/rest/api/2/search":
+                    self.send_error(404)
+                    return
+                params = urllib.parse.parse_qs(url.query)
+                server.requests.append(params)
+                body = json.dumps(server._search(params)).encode("utf-8")
+                if server.delay:
+                    time.sleep(server.delay)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _search(self, params):
+        jql = params.get("jql", [""])[0]
+        start_at = int(params.get("startAt", ["0"])[0])
+        max_results = min(int(params.get("maxResults", ["50"])[0]), self.max_page_size)
+        fields = params.get("fields", [""])[0].split(",")
+
+        issues = self.issues
+        if jql.startswith("project = "):
+            project = jql[len("project = "):].split()[0]
+            issues = [i for i in issues if i[0].startswith(project + "-")]
+
+        page = []
+        for key, summary, status, estimate in issues[start_at:start_at + max_results]:
+            all_fields = {"summary": summary, "status": {"name": status}, "timeoriginalestimate": estimate}
+            page.append({"key": key, "fields": {f: all_fields[f] for f in fields if f in all_fields}})
+        return {"startAt": start_at, "maxResults": max_results, "total": len(issues), "issues": page}
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# --- 設定 ---
+PROFILE_DIR = "profiles"  # レポートの保存先
+PROFILE_MODE = "sample"  # "sample": 全スレッドを定期的にサンプリング / "cprofile": 記録ループのスレッドを cProfile で計測
+SAMPLE_INTERVAL = 0.005  # サンプリング間隔（秒）
+PROFILE_MAX_SECONDS = 600  # 止め忘れた計測はこの秒数で自動的に止める（None なら止めない）
+PROFILE_TOP = 30  # レポートに載せる関数の数
+TRACEMALLOC_FRAMES = 10  # メモリの割り当て元として保存する呼び出し階層の深さ
+MEMORY_TOP = 25  # メモリの差分レポートに載せる行数
+# 待機中とみなすスレッドの末端の関数（"ファイル名:関数名"）。CPU を使っていないサンプルとして分けて数える
+IDLE_FRAMES = ("threading.py:wait", "threading.py:_wait_for_tstate_lock", "selectors.py:select",
+               "socket.py:accept", "socket.py:readinto", "queue.py:get", "socketserver.py:serve_forever")
+# --- 設定ここまで ---
+
+
+def _report_base(kind):
+    """PROFILE_DIR/kind_日時（拡張子なし）。同じ計測のファイルは同じ名前で拡張子だけを変える。"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    # Two reports within the same second must not overwrite each other
+    candidate, n = base, 1
+    while os.path.exists(candidate + ".txt"):
+        n += 1
+        candidate = f"{base}_{n}"
+    return candidate
+
+
+def _frame_label(filename, lineno, name):
+    return f"{os.path.basename(filename)}:{name}:{lineno}"
+
+
+class SamplingProfiler:
+    """
+    動いているすべてのスレッドのスタックを interval 秒ごとに sys._current_frames() で取って数える。
+    計測されるスレッドには何も仕掛けないので、止めたままにできない長期稼働のプロセスでも使える
+    （サンプリングのスレッドが GIL を少し取るだけ）。
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()  # (thread name, (frame label, ...) root first) -> samples
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._idle = set(IDLE_FRAMES)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        return self
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        names_at = 0.0
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            if now - names_at > 1.0:
+                # Thread names change rarely; refresh them once a second, not every sample
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                names_at = now
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(_frame_label(code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[(names.get(ident, str(ident)), tuple(stack))] += 1
+            self.samples += 1
+            if self.max_seconds and now - self.started_at > self.max_seconds:
+                print(f"[Profile] {self.max_seconds}秒経ったのでサンプリングを止めました（次の操作でレポートを保存します）。")
+                break
+        self.stopped_at = time.monotonic()
+
+    def is_idle(self, stack):
+        if not stack:
+            return True
+        filename, name, _ = stack[-1].rsplit(":", 2)
+        return f"{filename}:{name}" in self._idle
+
+    def report(self, top=PROFILE_TOP):
+        """スレッドごとのサンプル数と、CPU を使っていたサンプルの多い関数（自身・呼び出し先込み）の表。"""
+        duration = (self.stopped_at or time.monotonic()) - self.started_at
+        threads = Counter()
+        busy_threads = Counter()
+        self_counts = Counter()
+        total_counts = Counter()
+        busy = 0
+        for (thread, stack), count in self.stacks.items():
+            threads[thread] += count
+            if self.is_idle(stack):
+                continue
+            busy += count
+            busy_threads[thread] += count
+            self_counts[stack[-1]] += count
+            for label in set(stack):
+                total_counts[label] += count
+
+        out = io.StringIO()
+        out.write(f"サンプリング: {duration:.1f}秒, {self.samples}回 (間隔 {self.interval * 1000:g}ms)\n")
+        out.write(f"CPU を使っていたサンプル: {busy}（待機中のサンプルは除外）\n\n")
+        out.write("スレッド別（動作中 / 全サンプル）:\n")
+        for thread, count in threads.most_common():
+            out.write(f"  {thread:<30}{busy_threads[thread]:>8} / {count}\n")
+        for title, counts in (("自身で時間を使っている関数", self_counts), ("呼び出し先を含めた関数", total_counts)):
+            out.write(f"\n{title}（上位{top}）:\n")
+            for label, count in counts.most_common(top):
+                out.write(f"  {count / busy * 100 if busy else 0:6.1f}% {count:>7}  {label}\n")
+        return out.getvalue()
+
+    def folded(self):
+        """flamegraph.pl / speedscope で読める「スレッド;関数;関数 回数」形式（待機中のサンプルを含む）。"""
+        return "".join(f"{';'.join((thread,) + stack)} {count}\n"
+                       for (thread, stack), count in sorted(self.stacks.items()))
+
+
+class LoopProfiler:
+    """
+    記録ループのスレッドを cProfile で計測する。cProfile は有効にしたスレッドしか見えないので、
+    開始・停止は要求だけを出し、ループが次の周回の頭で poll() を呼んだ時に自分のスレッドで切り替える。
+    """
+
+    def __init__(self):
+        self.pending = False  # Checked by the loop on every iteration; True only while a switch is due
+        self._want = False
+        self._profile = None
+        self._result = None
+        self._done = threading.Event()
+        self.started_at = None
+        self.stopped_at = None
+
+    @property
+    def requested(self):
+        return self._want
+
+    def request(self, enable):
+        self._want = enable
+        self._done.clear()
+        self.pending = True
+
+    def poll(self):
+        """ループのスレッドから呼ぶ。要求に合わせて cProfile を開始・停止する。"""
+        import cProfile
+        self.pending = False
+        if self._want and self._profile is None:
+            self._profile = cProfile.Profile()
+            self.started_at = time.monotonic()
+            self._profile.enable()
+        elif not self._want and self._profile is not None:
+            self._profile.disable()
+            self.stopped_at = time.monotonic()
+            self._result, self._profile = self._profile, None
+        self._done.set()
+
+    def wait(self, timeout):
+        return self._done.wait(timeout)
+
+    def report(self, top=PROFILE_TOP):
+        import pstats
+        if self._result is None:
+            return "記録ループが計測中に一度も動かなかったため、結果がありません。\n"
+        out = io.StringIO()
+        out.write(f"cProfile（記録ループのスレッド）: {self.stopped_at - self.started_at:.1f}秒\n")
+        stats = pstats.Stats(self._result, stream=out)
+        for key in ("cumulative", "tottime"):
+            out.write(f"\n--- {key} 順 ---\n")
+            stats.sort_stats(key).print_stats(top)
+        return out.getvalue()
+
+    def dump(self, path):
+        if self._result is not None:
+            self._result.dump_stats(path)
+
+
+class LiveProfiler:
+    """
+    動いているロガーの中で、CPU の計測（サンプリングか cProfile）と tracemalloc のスナップショットを
+    要求に応じて取るクラス。トレイのメニューとホットキーから使う。レポートは PROFILE_DIR に日時付きで保存する。
+    wake は記録ループを起こす関数（cProfile の開始・停止をすぐにループのスレッドで行うため）。
+    """
+
+    def __init__(self, wake=None, mode=PROFILE_MODE):
+        self.wake = wake
+        self.mode = mode
+        self.loop = LoopProfiler()
+        self._sampler = None
+        self._lock = threading.Lock()
+        self._memory_baseline = None
+        self._memory_previous = None
+
+    @property
+    def active(self):
+        return self._sampler is not None or self.loop.requested
+
+    def toggle(self):
+        """計測中なら止めてレポートのパスを返し、止まっていれば始めて None を返す。"""
+        with self._lock:
+            if self.active:
+                return self._stop_locked()
+            self._start_locked()
+            return None
+
+    def _start_locked(self):
+        if self.mode == "cprofile":
+            self.loop.request(True)
+            if self.wake:
+                self.wake()
+        else:
+            self._sampler = SamplingProfiler()
+            self._sampler.start()
+        print(f"[Profile] 計測を開始しました（{self.mode}）。もう一度操作すると止めてレポートを保存します。")
+
+    def _stop_locked(self):
+        if self._sampler is not None:
+            sampler, self._sampler = self._sampler, None
+            sampler.stop()
+            base = _report_base("profile")
+            with open(base + ".folded", "w", encoding="utf-8") as f:
+                f.write(sampler.folded())
+            report = sampler.report()
+        else:
+            self.loop.request(False)
+            if self.wake:
+                self.wake()
+            # The loop switches cProfile off on its next iteration; it is awake now
+            if not self.loop.wait(5):
+                print("[Profile] 記録ループが応答しないため、ここまでの結果は保存できませんでした。")
+                return None
+            base = _report_base("profile")
+            self.loop.dump(base + ".pstats")
+            report = self.loop.report()
+        return self._write_report(base, report)
+
+    @staticmethod
+    def _write_report(base, report):
+        path = base + ".txt"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(report)
+        print(f"[Profile] 計測を止めました。レポート: {path}")
+        return path
+
+    def memory_snapshot(self):
+        """
+        tracemalloc のスナップショットを取り、前回と最初の回からの増加を行ごとにレポートする。
+        最初の呼び出しで追跡を始める（以降、割り当てが少し遅くなる）。レポートのパスを返す。
+        """
+        import tracemalloc
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._memory_baseline = self._memory_previous = None
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            current, peak = tracemalloc.get_traced_memory()
+            out = io.StringIO()
+            out.write(f"tracemalloc: 現在 {current / 1e6:.2f}MB, 最大 {peak / 1e6:.2f}MB"
+                      f"（追跡のためのメモリ {tracemalloc.get_tracemalloc_memory() / 1e6:.2f}MB）\n")
+            if self._memory_baseline is None:
+                out.write("\n最初のスナップショットです。次に取った時から増加分を表示します。\n")
+                self._write_top(out, "割り当ての多い行", snapshot.statistics("lineno"))
+                self._memory_baseline = snapshot
+            else:
+                self._write_top(out, "前回からの増加", snapshot.compare_to(self._memory_previous, "lineno"))
+                self._write_top(out, "最初の回からの増加", snapshot.compare_to(self._memory_baseline, "lineno"))
+                growth = snapshot.compare_to(self._memory_baseline, "traceback")
+                if growth and growth[0].size_diff > 0:
+                    out.write("\n最も増えた割り当ての呼び出し元:\n")
+                    out.write("\n".join(growth[0].traceback.format()) + "\n")
+            self._memory_previous = snapshot
+
+        path = _report_base("memory") + ".txt"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        print(f"[Profile] メモリのスナップショットを保存しました: {path}")
+        return path
+
+    @staticmethod
+    def _write_top(out, title, statistics, top=MEMORY_TOP):
+        out.write(f"\n{title}（上位{top}）:\n")
+        for stat in statistics[:top]:
+            out.write(f"  {stat}\n")
+
+    def stop(self):
+        """終了時: 計測中ならレポートを保存する。"""
+        with self._lock:
+            if self._sampler is not None:
+                self._stop_locked()
+            elif self.loop.requested:
+                # The loop is stopping and won't poll again: switch cProfile off from here
+                # (the calls recorded on the loop's thread so far are kept)
+                self.loop.request(False)
+                self.loop.poll()
+                base = _report_base("profile")
+                self.loop.dump(base + ".pstats")
+                self._write_report(base, self.loop.report())
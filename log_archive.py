@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import glob
+import importlib
+import io
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+# --- 設定 ---
+LOG_FILE_PREFIX = "log_"  # ログファイル名の接頭辞
+ARCHIVE_DIR = "archive"  # 圧縮した過去のログの置き場所
+ARCHIVE_COMPRESSION = "gz"  # "gz"（速い）/ "xz"（小さい）
+ARCHIVE_AFTER_DAYS = 1  # この日数より前の日を圧縮する（今日のファイルは決して触らない）
+RETENTION_DAYS = None  # これより古い日は削除する（None なら削除しない）
+# --- 設定ここまで ---
+
+MEMBER_SEPARATOR = "::"  # "archive/log_202401.zip::log_20240115.csv" で月アーカイブ内の1日を指す
+INDEX_MEMBER = "index.json"
+
+_DAY_FILE = re.compile(r"log_(\d{8})\.csv(?:\.(gz|xz))?$")
+_MONTH_FILE = re.compile(r"log_(\d{6})\.zip$")
+# Imported on first use: the logger itself only ever touches today's plain CSV
+_COMPRESSORS = {"gz": "gzip", "xz": "lzma"}
+
+
+def _opener(extension):
+    module = _COMPRESSORS.get(extension)
+    return importlib.import_module(module).open if module else None
+
+
+# --- Reading (used by every log reader) ---
+def open_binary(ref):
+    """
+    ログの参照先をバイナリで開く。参照先は通常のCSV、.csv.gz / .csv.xz、
+    または月アーカイブ内の1日 ("アーカイブ.zip::メンバー名")。展開はストリームで行い、ディスクには書かない。
+    """
+    if MEMBER_SEPARATOR in ref:
+        import zipfile
+        archive_path, member = ref.split(MEMBER_SEPARATOR, 1)
+        archive = zipfile.ZipFile(archive_path)
+        try:
+            stream = archive.open(member)
+        except Exception:
+            archive.close()
+            raise
+        # Close the archive together with the member stream
+        original_close = stream.close
+
+        def close():
+            original_close()
+            archive.close()
+        stream.close = close
+        return stream
+    extension = ref.rsplit(".", 1)[-1]
+    opener = _opener(extension)
+    return opener(ref, "rb") if opener else open(ref, "rb")
+
+
+def open_text(ref):
+    """open_binary() のテキスト版（UTF-8、BOMは読み飛ばす。csv モジュール用に改行は変換しない）。"""
+    return io.TextIOWrapper(open_binary(ref), encoding="utf-8-sig", newline="")
+
+
+def stat(ref):
+    """キャッシュのキー用の (mtime, size)。月アーカイブ内の日はアーカイブ自体の値。"""
+    st = os.stat(ref.split(MEMBER_SEPARATOR, 1)[0])
+    return st.st_mtime, st.st_size
+
+
+def day_of(ref):
+    """参照先の日付 (YYYYMMDD)。ログでなければ None。"""
+    match = _DAY_FILE.search(ref.split(MEMBER_SEPARATOR)[-1])
+    return match.group(1) if match else None
+
+
+def find_log(day, log_dir=".", archive_dir=None):
+    """
+    その日のログの参照先を返す (day は date または YYYYMMDD)。無ければ None。
+    作業ディレクトリのCSV、圧縮済みの日、月アーカイブの順に探す。
+    """
+    day = day if isinstance(day, str) else day.strftime("%Y%m%d")
+    archive_dir = archive_dir or os.path.join(log_dir, ARCHIVE_DIR)
+    name = f"{LOG_FILE_PREFIX}{day}.csv"
+    candidates = [os.path.join(log_dir, name)]
+    candidates += [os.path.join(archive_dir, f"{name}.{ext}") for ext in _COMPRESSORS]
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    month_path = os.path.join(archive_dir, f"{LOG_FILE_PREFIX}{day[:6]}.zip")
+    if os.path.exists(month_path) and name in read_month_index(month_path)["days"]:
+        return f"{month_path}{MEMBER_SEPARATOR}{name}"
+    return None
+
+
+def all_logs(log_dir=".", archive_dir=None):
+    """すべての日のログの参照先を日付順に返す（同じ日は展開済みのCSVを優先）。"""
+    archive_dir = archive_dir or os.path.join(log_dir, ARCHIVE_DIR)
+    found = {}
+    for path in sorted(glob.glob(os.path.join(archive_dir, f"{LOG_FILE_PREFIX}*.zip"))):
+        for name in read_month_index(path)["days"]:
+            found.setdefault(day_of(name), f"{path}{MEMBER_SEPARATOR}{name}")
+    for pattern in (os.path.join(archive_dir, f"{LOG_FILE_PREFIX}*.csv.*"), os.path.join(log_dir, f"{LOG_FILE_PREFIX}*.csv")):
+        for path in glob.glob(pattern):
+            day = day_of(path)
+            if day:
+                found[day] = path
+    return [found[day] for day in sorted(found)]
+
+
+def read_month_index(archive_path):
+    """月アーカイブの索引（日ごとのメンバー名・元のサイズ・行数）を返す。"""
+    import zipfile
+    with zipfile.ZipFile(archive_path) as archive:
+        try:
+            return json.loads(archive.read(INDEX_MEMBER).decode("utf-8"))
+        except KeyError:
+            # Archive without an index: the central directory still lists the days
+            return {"days": {n: {} for n in archive.namelist() if _DAY_FILE.match(n)}}
+
+
+# --- Archiving ---
+def _closed_days(log_dir, older_than_days, today):
+    cutoff = (today - timedelta(days=older_than_days - 1)).strftime("%Y%m%d")
+    for path in sorted(glob.glob(os.path.join(log_dir, f"{LOG_FILE_PREFIX}*.csv"))):
+        day = day_of(path)
+        if day and day < cutoff:
+            yield day, path
+
+
+def compress_day(path, archive_dir=ARCHIVE_DIR, compression=ARCHIVE_COMPRESSION):
+    """1日分のCSVを圧縮して archive_dir に移す。元のファイルは圧縮が完了してから削除する。"""
+    import shutil
+    os.makedirs(archive_dir, exist_ok=True)
+    target = os.path.join(archive_dir, os.path.basename(path) + "." + compression)
+    tmp_path = target + ".tmp"
+    with open(path, "rb") as src, _opener(compression)(tmp_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, target)
+    os.remove(path)
+    return target
+
+
+def pack_month(month, archive_dir=ARCHIVE_DIR, log_dir="."):
+    """
+    ある月 (YYYYMM) の日をすべて1つのZIP（LZMA圧縮、索引付き）にまとめる。
+    既存の月アーカイブがあれば中身を引き継ぐ。まとめた日の個別ファイルは削除する。
+    """
+    import shutil
+    import zipfile
+
+    target = os.path.join(archive_dir, f"{LOG_FILE_PREFIX}{month}.zip")
+    sources = [ref for ref in all_logs(log_dir, archive_dir) if (day_of(ref) or "").startswith(month)]
+    if not sources:
+        return None
+    os.makedirs(archive_dir, exist_ok=True)
+    tmp_path = target + ".tmp"
+    index = {"month": month, "days": {}}
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_LZMA) as archive:
+        for ref in sources:
+            name = f"{LOG_FILE_PREFIX}{day_of(ref)}.csv"
+            with open_binary(ref) as src, archive.open(name, "w") as dst:
+                shutil.copyfileobj(src, dst)
+            with open_binary(ref) as src:
+                rows = max(0, sum(1 for _ in src) - 1)
+            index["days"][name] = {"size": archive.getinfo(name).file_size, "rows": rows}
+        archive.writestr(INDEX_MEMBER, json.dumps(index, ensure_ascii=False))
+    os.replace(tmp_path, target)
+    for ref in sources:
+        if MEMBER_SEPARATOR not in ref:
+            os.remove(ref)
+    return target
+
+
+def apply_retention(retention_days, log_dir=".", archive_dir=ARCHIVE_DIR, today=None):
+    """retention_days より古い日を削除する。月アーカイブは月全体が古くなった時に削除する。戻り値は削除したパス。"""
+    today = today or datetime.now().date()
+    cutoff = (today - timedelta(days=retention_days)).strftime("%Y%m%d")
+    removed = []
+    patterns = [os.path.join(log_dir, f"{LOG_FILE_PREFIX}*.csv"), os.path.join(archive_dir, f"{LOG_FILE_PREFIX}*.csv.*")]
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            day = day_of(path)
+            if day and day < cutoff:
+                os.remove(path)
+                removed.append(path)
+    for path in glob.glob(os.path.join(archive_dir, f"{LOG_FILE_PREFIX}*.zip")):
+        match = _MONTH_FILE.search(path)
+        if match and match.group(1) + "31" < cutoff:
+            os.remove(path)
+            removed.append(path)
+    return removed
+
+
+def archive_logs(log_dir=".", archive_dir=None, compression=ARCHIVE_COMPRESSION, older_than_days=ARCHIVE_AFTER_DAYS,
+                 monthly=False, retention_days=RETENTION_DAYS, today=None):
+    """
+    閉じた日（older_than_days より前）を圧縮し、monthly なら終わった月を1つにまとめ、
+    保持期間を過ぎた日を削除する。今日のファイルは対象にしない。
+    """
+    today = today or datetime.now().date()
+    archive_dir = archive_dir or os.path.join(log_dir, ARCHIVE_DIR)
+    older_than_days = max(1, older_than_days)
+    for day, path in _closed_days(log_dir, older_than_days, today):
+        print(f"圧縮: {path} -> {compress_day(path, archive_dir, compression)}")
+
+    if monthly:
+        this_month = today.strftime("%Y%m")
+        months = sorted({day_of(ref)[:6] for ref in all_logs(log_dir, archive_dir)
+                         if MEMBER_SEPARATOR not in ref and os.path.dirname(ref) == archive_dir})
+        for month in months:
+            if month < this_month:
+                print(f"月アーカイブ: {pack_month(month, archive_dir, log_dir)}")
+
+    if retention_days:
+        for path in apply_retention(retention_days, log_dir, archive_dir, today):
+            print(f"削除（保持期間切れ）: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="過去の日次ログを圧縮・月ごとにまとめ、保持期間を過ぎたものを削除します。")
+    parser.add_argument("--compression", choices=sorted(_COMPRESSORS), default=ARCHIVE_COMPRESSION, help="圧縮形式")
+    parser.add_argument("--older-than", type=int, default=ARCHIVE_AFTER_DAYS, help="この日数より前の日を圧縮します")
+    parser.add_argument("--monthly", action="store_true", help="終わった月を1つのZIP（索引付き）にまとめます")
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS, help="これより古い日を削除します")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="圧縮したログの置き場所")
+    args = parser.parse_args()
+
+    archive_logs(archive_dir=args.archive_dir, compression=args.compression, older_than_days=args.older_than,
+                 monthly=args.monthly, retention_days=args.retention_days)
+
+
+if __name__ == "__main__":
+    main()
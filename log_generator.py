@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import csv
+import os
+import random
+from datetime import date, datetime, timedelta
+
+from log_schema import POINT_HEADER, INTERVAL_HEADER, TIMESTAMP_FORMAT, seconds_between
+
+# --- 設定 ---
+GENERATOR_DAYS = 90  # 生成する日数（暦日。週末は WEEKENDS が False なら飛ばす）
+GENERATOR_OUTPUT_DIR = "synthetic_logs"  # 生成したログの置き場所
+SWITCHES_PER_HOUR = 40  # 1時間あたりのウィンドウ切り替え回数の平均
+APP_COUNT = 12  # 使われるアプリの数
+TITLES_PER_APP = 150  # アプリごとのウィンドウタイトルの種類
+TASK_COUNT = 30  # ポモドーロに付けるタスク（チケット）の種類
+WORK_MINUTES = 25  # ポモドーロの作業時間（分）
+BREAK_MINUTES = 5  # 短い休憩（分）
+LONG_BREAK_MINUTES = 15  # 4回ごとの長い休憩（分）
+POMODORO_SHARE = 0.7  # 作業時間のうちポモドーロを回している割合（残りは idle のまま）
+WEEKENDS = False  # 週末も生成する
+CHECK_INTERVAL = 5  # ロガーのチェック間隔（秒）。切り替えはこの粒度で記録される
+# --- 設定ここまで ---
+
+# (process name, weight, title templates). {n} is a number, {w}/{p} are picked from the word lists
+_APP_CATALOG = [
+    ("chrome.exe", 10, ["{w}の調べ方 - Google 検索 - Google Chrome", "{p}-{n} {w}の不具合 - Jira - Google Chrome",
+                        "{w} | Qiita - Google Chrome", "受信トレイ ({n}) - Gmail - Google Chrome",
+                        "{w}について - Confluence - Google Chrome", "Pull Request #{n}: {w}の修正 - GitHub - Google Chrome"]),
+    ("Code.exe", 9, ["{w}.py - {p} - Visual Studio Code", "● {w}_test.py - {p} - Visual Studio Code",
+                     "{w}.js - {p} - Visual Studio Code", "設定 - Visual Studio Code"]),
+    ("EXCEL.EXE", 5, ["{w}_集計_{n}.xlsx - Excel", "{p} 見積もり {n}.xlsx - Excel", "工数管理表_{n}月.xlsx - Excel"]),
+    ("WINWORD.EXE", 4, ["{w}仕様書_v{n}.docx - Word", "議事録_{p}_{n}.docx - Word", "{w}手順書.docx - Word"]),
+    ("OUTLOOK.EXE", 5, ["受信トレイ - {n}件の未読 - Outlook", "RE: {w}の件 - メッセージ (HTML)", "予定表 - Outlook"]),
+    ("Teams.exe", 6, ["{w}定例 | Microsoft Teams", "チャット | {p}チーム | Microsoft Teams", "会議 {n} | Microsoft Teams"]),
+    ("slack.exe", 4, ["#{w} - {p} - Slack", "スレッド - #{w} - Slack", "ダイレクトメッセージ - Slack"]),
+    ("explorer.exe", 3, ["{w}", "ダウンロード", "{p}_{n}", "エクスプローラー"]),
+    ("POWERPNT.EXE", 2, ["{w}報告_{n}.pptx - PowerPoint", "{p}提案資料.pptx - PowerPoint"]),
+    ("WindowsTerminal.exe", 3, ["{w}: python manage.py", "PowerShell", "ubuntu - {p}"]),
+    ("notepad.exe", 1, ["{w}メモ.txt - メモ帳", "無題 - メモ帳"]),
+    ("msedge.exe", 2, ["{w} - 社内ポータル - Microsoft Edge", "勤怠入力 - Microsoft Edge"]),
+]
+_WORDS = ["ログイン", "検索", "集計", "請求", "在庫", "通知", "認証", "帳票", "画面遷移", "バッチ", "性能",
+          "移行", "API", "データベース", "キャッシュ", "設計", "レビュー", "テスト", "リリース", "障害対応"]
+_PROJECTS = ["ALPHA", "BETA", "GAMMA", "DELTA", "OMEGA"]
+_BREAK_APPS = ("chrome.exe", "slack.exe", "Teams.exe", "OUTLOOK.EXE", "msedge.exe")
+
+
+def _zipf_weights(count, exponent=1.1):
+    """よく使うものほど多く現れる（実際のウィンドウタイトルの出現頻度に近い）重み。"""
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def build_catalog(rng, app_count=APP_COUNT, titles_per_app=TITLES_PER_APP):
+    """アプリごとのタイトル一覧と重みを作る。カタログより多いアプリは tool{n}.exe として足す。"""
+    apps = []
+    for i in range(app_count):
+        if i < len(_APP_CATALOG):
+            name, weight, templates = _APP_CATALOG[i]
+        else:
+            name, weight, templates = f"tool{i}.exe", 1, [f"ツール{i} - {{w}}", f"ツール{i} - {{p}}-{{n}}"]
+        titles = []
+        seen = set()
+        # Templates times words/projects/numbers give far more combinations than needed
+        for _ in range(titles_per_app * 20):
+            if len(titles) >= titles_per_app:
+                break
+            title = rng.choice(templates).format(w=rng.choice(_WORDS), p=rng.choice(_PROJECTS),
+                                                 n=rng.randint(1, 999))
+            if title not in seen:
+                seen.add(title)
+                titles.append(title)
+        apps.append((name, weight, titles, _zipf_weights(len(titles))))
+    return apps
+
+
+def build_tasks(rng, task_count=TASK_COUNT):
+    """ポモドーロのタスク名（Hub UI と同じくチケットのキー）。"""
+    tasks = set()
+    while len(tasks) < task_count:
+        tasks.add(f"{rng.choice(_PROJECTS)}-{rng.randint(1, 400)}")
+    return sorted(tasks)
+
+
+def _pomodoro_plan(rng, start, end, tasks):
+    """
+    1日の (開始, 状態, タスク) の切り替え予定を返す。作業日のうち POMODORO_SHARE 程度を
+    25分作業・5分休憩（4回ごとに長い休憩）で回し、残りは idle（会議・雑務）にする。
+    """
+    plan = [(start, "idle", "")]
+    at = start
+    while at < end:
+        if rng.random() < POMODORO_SHARE:
+            task = tasks[min(int(rng.expovariate(1 / 4)), len(tasks) - 1)]
+            for cycle in range(1, rng.randint(2, 6)):
+                plan.append((at, "work", task))
+                at += timedelta(minutes=WORK_MINUTES)
+                plan.append((at, "break", task))
+                at += timedelta(minutes=LONG_BREAK_MINUTES if cycle % 4 == 0 else BREAK_MINUTES)
+                if at >= end:
+                    break
+            plan.append((at, "idle", ""))
+        at += timedelta(minutes=rng.randint(10, 60))
+    return [step for step in plan if step[0] < end]
+
+
+def generate_day(day, rng, catalog, tasks, switches_per_hour=SWITCHES_PER_HOUR):
+    """
+    1日分の切り替え行（POINT_HEADER の並び）を時刻順に返す。最後の要素は終業時刻の文字列。
+    出社・退社時刻は揺らし、昼休みは画面をそのままにした長い区間として残す（離席の打ち切りの確認用）。
+    """
+    start = datetime.combine(day, datetime.min.time()) + timedelta(minutes=8 * 60 + 30 + rng.randint(0, 60))
+    end = start + timedelta(hours=rng.uniform(7.5, 10))
+    lunch = datetime.combine(day, datetime.min.time()) + timedelta(hours=12, minutes=rng.randint(-15, 30))
+    plan = _pomodoro_plan(rng, start, end, tasks)
+    pids = {app[0]: rng.randint(1000, 30000) for app in catalog}
+    mean_dwell = 3600 / max(1, switches_per_hour)
+
+    rows = []
+    at = start
+    step = 0
+    state, task = "idle", ""
+    took_lunch = False
+    while at < end:
+        # Pomodoro transitions re-log the current window, like UnifiedLogger does
+        while step < len(plan) and plan[step][0] <= at:
+            _, new_state, new_task = plan[step]
+            step += 1
+            if (new_state, new_task) != (state, task) and rows:
+                rows.append([plan[step - 1][0].strftime(TIMESTAMP_FORMAT)] + rows[-1][1:4] + [new_state, new_task])
+            state, task = new_state, new_task
+
+        candidates = catalog
+        if state == "break":
+            candidates = [app for app in catalog if app[0] in _BREAK_APPS] or catalog
+        name, _, titles, weights = rng.choices(candidates, [app[1] for app in candidates])[0]
+        title = rng.choices(titles, weights)[0]
+        rows.append([at.strftime(TIMESTAMP_FORMAT), name, title, pids[name], state, task])
+
+        dwell = max(CHECK_INTERVAL, round(rng.expovariate(1 / mean_dwell) / CHECK_INTERVAL) * CHECK_INTERVAL)
+        if not took_lunch and at + timedelta(seconds=dwell) >= lunch:
+            # Lunch: the window stays as it is for about an hour
+            took_lunch = True
+            dwell = (lunch - at).total_seconds() + rng.randint(45, 70) * 60
+        at += timedelta(seconds=dwell)
+    return rows, min(at, end).strftime(TIMESTAMP_FORMAT)
+
+
+def write_day(path, rows, day_end, log_format="interval"):
+    """1日分を UnifiedLogger と同じ形式（BOM付き UTF-8）で書く。"""
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        if log_format == "point":
+            writer.writerow(POINT_HEADER)
+            writer.writerows(rows)
+            return
+        writer.writerow(INTERVAL_HEADER)
+        for row, following in zip(rows, rows[1:] + [[day_end]]):
+            writer.writerow([row[0], following[0], seconds_between(row[0], following[0])] + row[1:])
+
+
+def generate_logs(output_dir=GENERATOR_OUTPUT_DIR, days=GENERATOR_DAYS, start=None, seed=0,
+                  switches_per_hour=SWITCHES_PER_HOUR, app_count=APP_COUNT, titles_per_app=TITLES_PER_APP,
+                  task_count=TASK_COUNT, log_format="interval", weekends=WEEKENDS):
+    """
+    output_dir に log_YYYYMMDD.csv を days 日分生成し、パスのリストを返す。
+    同じ seed と設定なら同じ内容になる（ベンチマークの入力を毎回そろえるため）。
+    """
+    rng = random.Random(seed)
+    catalog = build_catalog(rng, app_count, titles_per_app)
+    tasks = build_tasks(rng, task_count)
+    start = start or date.today() - timedelta(days=days)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        if not weekends and day.weekday() >= 5:
+            continue
+        rows, day_end = generate_day(day, rng, catalog, tasks, switches_per_hour)
+        path = os.path.join(output_dir, f"log_{day.strftime('%Y%m%d')}.csv")
+        write_day(path, rows, day_end, log_format)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="計測・動作確認用に、実際のログと同じ形式の活動ログを生成します。")
+    parser.add_argument("--output-dir", default=GENERATOR_OUTPUT_DIR, help="出力先のディレクトリ")
+    parser.add_argument("--days", type=int, default=GENERATOR_DAYS, help="生成する日数（暦日）")
+    parser.add_argument("--start", help="最初の日 (YYYY-MM-DD)。省略時は今日から --days 日前")
+    parser.add_argument("--seed", type=int, default=0, help="乱数の種（同じなら同じログになる）")
+    parser.add_argument("--switches-per-hour", type=float, default=SWITCHES_PER_HOUR, help="1時間あたりの切り替え回数")
+    parser.add_argument("--apps", type=int, default=APP_COUNT, help="アプリの数")
+    parser.add_argument("--titles", type=int, default=TITLES_PER_APP, help="アプリごとのタイトルの種類")
+    parser.add_argument("--tasks", type=int, default=TASK_COUNT, help="タスクの種類")
+    parser.add_argument("--format", choices=("interval", "point"), default="interval",
+                        help="interval（現在の形式）/ point（切り替え時刻のみの旧形式）")
+    parser.add_argument("--weekends", action="store_true", help="週末も生成する")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, "%Y-%m-%d").date() if args.start else None
+    paths = generate_logs(args.output_dir, args.days, start, args.seed, args.switches_per_hour, args.apps,
+                          args.titles, args.tasks, args.format, args.weekends)
+    total = sum(os.path.getsize(path) for path in paths)
+    print(f"{len(paths)}日分のログを生成しました: {args.output_dir} ({total / 1e6:.1f}MB)")
+
+
+if __name__ == "__main__":
+    main()
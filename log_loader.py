@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from log_schema import read_header
+from log_archive import open_binary
+
+# --- 設定 ---
+LOADER_CHUNK_ROWS = 500_000  # これより大きいファイルは分割して読む（行数の目安）
+# --- 設定ここまで ---
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+TIMESTAMP_COLUMNS = ["タイムスタンプ", "開始", "終了"]
+CATEGORY_COLUMNS = ["アプリ名", "ウィンドウタイトル", "ポモドーロ状態", "タスク名"]
+INTEGER_COLUMNS = ["プロセスID", "秒数"]
+
+
+def _typed(df):
+    """読み込んだ列に型を付ける（時刻は固定書式、整数は最小の型へ）。"""
+    for column in TIMESTAMP_COLUMNS:
+        if column in df.columns:
+            # A fixed format skips per-row format inference
+            df[column] = pd.to_datetime(df[column], format=TIMESTAMP_FORMAT, errors="coerce")
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            # Missing pids become 0 so the column stays a plain (small) integer
+            df[column] = pd.to_numeric(df[column].fillna(0).astype("int64"), downcast="unsigned")
+    return df
+
+
+def iter_log_chunks(path, usecols=None, chunksize=LOADER_CHUNK_ROWS):
+    """ログCSVを型付きの DataFrame として chunksize 行ずつ返す。"""
+    header = read_header(path)
+    if not header:
+        return
+    if usecols is not None:
+        # Projection over both formats: ask only for the columns this file has
+        usecols = [c for c in header if c in set(usecols)]
+    columns = usecols or header
+    dtype = {c: "category" for c in CATEGORY_COLUMNS if c in columns}
+    dtype.update({c: "str" for c in TIMESTAMP_COLUMNS if c in columns})
+    # Parsed by the C reader; float64 only so that blank cells can be NaN
+    dtype.update({c: "float64" for c in INTEGER_COLUMNS if c in columns})
+
+    # Compressed and archived days are decompressed as a stream, never to disk
+    with open_binary(path) as f:
+        reader = pd.read_csv(f, encoding="utf-8-sig", usecols=usecols, dtype=dtype,
+                             keep_default_na=False, na_values=[""], chunksize=chunksize)
+        with reader:
+            for chunk in reader:
+                yield _typed(chunk)
+
+
+def load_log(path, usecols=None, chunksize=LOADER_CHUNK_ROWS):
+    """
+    ログCSV（旧形式・区間形式）を型付きで読み込む。
+    時刻列は datetime64、アプリ名・タイトル・状態・タスクは category、
+    プロセスID・秒数は収まる最小の符号なし整数になる。
+    usecols で必要な列だけを読む（ファイルに無い列は無視）。
+    大きなファイルは chunksize 行ずつ読み、カテゴリを合わせて連結する。
+    """
+    chunks = [chunk for chunk in iter_log_chunks(path, usecols=usecols, chunksize=chunksize) if not chunk.empty]
+    if not chunks:
+        raise pd.errors.EmptyDataError(f"{path} has no rows")
+    if len(chunks) == 1:
+        return chunks[0]
+
+    df = pd.concat(chunks, ignore_index=True)
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            # Each chunk has its own categories; union them instead of falling back to object
+            df[column] = union_categoricals([chunk[column] for chunk in chunks])
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], downcast="unsigned")
+    return df
+
+
+# --- Benchmark ---
+def write_sample_log(path, rows, seed=0):
+    """ベンチマーク用に区間形式のログを書き出す。"""
+    rng = random.Random(seed)
+    apps = ["chrome.exe", "Code.exe", "OUTLOOK.EXE", "Teams.exe", "explorer.exe", "WINWORD.EXE"]
+    tasks = ["", "PROJ-101", "PROJ-102", "PROJ-205"]
+    ts = datetime(2024, 1, 1, 8, 0, 0)
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["開始", "終了", "秒数", "アプリ名", "ウィンドウタイトル", "プロセスID", "ポモドーロ状態", "タスク名"])
+        for _ in range(rows):
+            app = rng.choice(apps)
+            seconds = int(rng.expovariate(1 / 30)) + 1
+            end = ts + timedelta(seconds=seconds)
+            writer.writerow([ts.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT), seconds, app,
+                             f"{app} - document {rng.randrange(200)}", 1000 + apps.index(app) * 4,
+                             rng.choice(["work", "break", "idle"]), rng.choice(tasks)])
+            ts = end
+
+
+def benchmark(path):
+    """既定の read_csv + to_datetime と load_log を比べ、時間とメモリを表示する。"""
+    start = time.perf_counter()
+    naive = pd.read_csv(path)
+    for column in TIMESTAMP_COLUMNS:
+        if column in naive.columns:
+            naive[column] = pd.to_datetime(naive[column])
+    naive_time = time.perf_counter() - start
+    naive_mem = naive.memory_usage(deep=True).sum()
+
+    start = time.perf_counter()
+    typed = load_log(path)
+    typed_time = time.perf_counter() - start
+    typed_mem = typed.memory_usage(deep=True).sum()
+
+    # What analyze_logs actually reads
+    start = time.perf_counter()
+    projected = load_log(path, usecols=["タイムスタンプ", "秒数", "アプリ名", "ウィンドウタイトル"])
+    projected_time = time.perf_counter() - start
+    projected_mem = projected.memory_usage(deep=True).sum()
+
+    print(f"rows: {len(typed)}")
+    print(f"read_csv + to_datetime:  {naive_time:.3f}s, {naive_mem / 1e6:.1f} MB")
+    print(f"load_log:                {typed_time:.3f}s, {typed_mem / 1e6:.1f} MB "
+          f"(x{naive_time / typed_time:.1f} faster, x{naive_mem / typed_mem:.1f} smaller)")
+    print(f"load_log(usecols=...):   {projected_time:.3f}s, {projected_mem / 1e6:.1f} MB "
+          f"(x{naive_time / projected_time:.1f} faster, x{naive_mem / projected_mem:.1f} smaller)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="型付きローダーと既定の read_csv を比較します。")
+    parser.add_argument("file", nargs="?", help="計測するログCSV（省略時は合成ログを作成）")
+    parser.add_argument("--rows", type=int, default=200_000, help="合成ログの行数")
+    args = parser.parse_args()
+
+    if args.file:
+        benchmark(args.file)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "log_bench.csv")
+        write_sample_log(path, args.rows)
+        benchmark(path)
+
+
+if __name__ == "__main__":
+    main()
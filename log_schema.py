@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import csv
+from collections import namedtuple
+from datetime import datetime
+
+from log_archive import open_text
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# A schema is identified by its header row (the signature)
+LogSchema = namedtuple("LogSchema", "version name header interval")
+
+SCHEMA_V1 = LogSchema(1, "pc_activity_logger",
+                      ("タイムスタンプ", "アプリ名", "ウィンドウタイトル", "プロセスID"), False)
+SCHEMA_V2 = LogSchema(2, "unified_logger",
+                      ("タイムスタンプ", "アプリ名", "ウィンドウタイトル", "プロセスID", "ポモドーロ状態", "タスク名"), False)
+SCHEMA_V3 = LogSchema(3, "interval",
+                      ("開始", "終了", "秒数", "アプリ名", "ウィンドウタイトル", "プロセスID", "ポモドーロ状態", "タスク名"), True)
+SCHEMAS = (SCHEMA_V1, SCHEMA_V2, SCHEMA_V3)
+CURRENT_SCHEMA = SCHEMA_V3
+
+POINT_HEADER = list(SCHEMA_V2.header)
+INTERVAL_HEADER = list(SCHEMA_V3.header)
+
+_BY_SIGNATURE = {schema.header: schema for schema in SCHEMAS}
+
+# Uniform record every reader gets, whatever the file's schema. Missing columns are
+# filled with cheap defaults ("" / None); seconds is always set.
+ActivityRecord = namedtuple("ActivityRecord", "start end seconds app title pid state task")
+
+
+class LogSchemaError(ValueError):
+    pass
+
+
+def detect_schema(header):
+    """ヘッダー行からログの形式を判定する。列の並びが違っても、必要な列があれば近い形式として扱う。"""
+    if not header:
+        raise LogSchemaError("header row is missing")
+    header = tuple(header)
+    schema = _BY_SIGNATURE.get(header)
+    if schema is not None:
+        return schema
+    # Reordered or extended headers: fall back on the columns that define the format
+    if "開始" in header and "秒数" in header:
+        return SCHEMA_V3
+    if "タイムスタンプ" in header:
+        return SCHEMA_V2 if "タスク名" in header else SCHEMA_V1
+    raise LogSchemaError(f"unknown log header: {','.join(header)}")
+
+
+def is_interval_header(header):
+    try:
+        return detect_schema(header).interval
+    except LogSchemaError:
+        return False
+
+
+def read_header(path):
+    """ログCSV（圧縮・アーカイブ内も可）のヘッダー行を返す。空のファイルなら None。"""
+    with open_text(path) as f:
+        return next(csv.reader(f), None)
+
+
+def seconds_between(start, end):
+    """2つのタイムスタンプ文字列の間の秒数（負にはしない）。"""
+    try:
+        seconds = (datetime.strptime(end, TIMESTAMP_FORMAT) - datetime.strptime(start, TIMESTAMP_FORMAT)).total_seconds()
+    except ValueError:
+        return 0
+    # A clock step backwards must not produce negative time
+    return max(0, int(seconds))
+
+
+def read_records(path):
+    """
+    ログCSVを形式に関わらず ActivityRecord の列として1パスで読む（並べ替えはしない）。
+    区間形式はそのまま、切り替え時刻のみの形式は1行先読みして次の行までを区間とする
+    （最後の行は 0 秒）。圧縮された日やアーカイブ内の日はストリームで展開して読む。
+    """
+    with open_text(path) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        schema = detect_schema(header)
+        index = {name: i for i, name in enumerate(header)}
+
+        def column(name):
+            i = index.get(name)
+            return (lambda row: row[i] if i < len(row) else "") if i is not None else (lambda row: "")
+
+        app, title, pid, state, task = (column(name) for name in
+                                        ("アプリ名", "ウィンドウタイトル", "プロセスID", "ポモドーロ状態", "タスク名"))
+
+        if schema.interval:
+            start, end, seconds = column("開始"), column("終了"), column("秒数")
+            for row in reader:
+                if not row:
+                    continue
+                try:
+                    duration = float(seconds(row) or 0)
+                except ValueError:
+                    continue
+                yield ActivityRecord(start(row), end(row), duration, app(row), title(row),
+                                     pid(row) or None, state(row), task(row))
+            return
+
+        timestamp = column("タイムスタンプ")
+
+        def close(row, end):
+            begin = timestamp(row)
+            return ActivityRecord(begin, end, seconds_between(begin, end), app(row), title(row),
+                                  pid(row) or None, state(row), task(row))
+
+        previous = None
+        for row in reader:
+            if not row or not timestamp(row):
+                continue
+            if previous is not None:
+                yield close(previous, timestamp(row))
+            previous = row
+        if previous is not None:
+            yield close(previous, timestamp(previous))
+
+
+def read_many(paths):
+    """複数のログ（形式が混在していてよい）を続けて読む。"""
+    for path in paths:
+        yield from read_records(path)
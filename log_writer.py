@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import os
+import queue
+import threading
+import time
+
+import metrics
+
+# --- 設定 ---
+FLUSH_MAX_ROWS = 20  # この行数が溜まったら書き出す
+FLUSH_MAX_LATENCY = 10.0  # 行がキューに留まる最大時間（秒）
+FLUSH_ON_STATE_CHANGE = True  # ポモドーロ状態の変化時は即座に書き出す
+FSYNC_ON_FLUSH = False  # 書き出しのたびにディスクへ同期する（遅いが最も安全）
+# --- 設定ここまで ---
+
+_CMD_OPEN = "open"
+_CMD_ROW = "row"
+_CMD_FLUSH = "flush"
+_CMD_CLOSE = "close"
+
+
+class LogWriter:
+    """
+    日次ログCSVへの書き込みをまとめて行うクラス。
+    ファイルハンドルを開いたまま保持し、キューに溜まった行を専用スレッドが
+    フラッシュポリシー（行数・最大遅延・状態変化）に従ってまとめて書き出す。
+    """
+
+    def __init__(self, header, flush_max_rows=FLUSH_MAX_ROWS, flush_max_latency=FLUSH_MAX_LATENCY,
+                 flush_on_state_change=FLUSH_ON_STATE_CHANGE, fsync=FSYNC_ON_FLUSH):
+        self.header = list(header)
+        self.flush_max_rows = max(1, flush_max_rows)
+        self.flush_max_latency = flush_max_latency
+        self.flush_on_state_change = flush_on_state_change
+        self.fsync = fsync
+
+        self.path = None
+        self._queue = queue.Queue()
+        self._closed = threading.Event()
+        self._lock = threading.Lock()  # Serializes enqueue against close()
+
+        # Owned by the writer thread only
+        self._target = None  # File the queued rows belong to; follows _CMD_OPEN, not self.path
+        self._file = None
+        self._csv = None
+        self._pending = []
+        self._oldest_pending = None
+
+        self._thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+        self._thread.start()
+
+    # --- Public API (any thread) ---
+    def open(self, path):
+        """書き込み先を切り替える。それ以前に投入された行は旧ファイルに書かれる。"""
+        with self._lock:
+            self.path = path
+            if self._closed.is_set():
+                self._prepare_file(path)
+                return
+            self._queue.put((_CMD_OPEN, path))
+
+    def write(self, row, state_changed=False):
+        """1行をキューに投入する。close()後は同期的に追記する。"""
+        with self._lock:
+            if self._closed.is_set():
+                # Late writers (e.g. the logging loop racing stop()) must not lose rows
+                self._append_direct(self.path, [row])
+                return
+            self._queue.put((_CMD_ROW, row, state_changed and self.flush_on_state_change))
+
+    def flush(self, timeout=None):
+        """キュー内の行をすべて書き出し、完了まで待つ。"""
+        done = threading.Event()
+        with self._lock:
+            if self._closed.is_set():
+                return True
+            self._queue.put((_CMD_FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """残りの行を書き出してファイルを閉じる。複数回呼んでも安全。"""
+        done = threading.Event()
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._queue.put((_CMD_CLOSE, done))
+            self._closed.set()
+        done.wait(timeout)
+        self._thread.join(timeout)
+
+    def close_interval(self, end):
+        """開いている区間を閉じる（interval_log.IntervalLogWriter 用）。切り替え行だけを書く形式では何もしない。"""
+        pass
+
+    # --- Writer thread ---
+    def _run(self):
+        while True:
+            try:
+                cmd = self._queue.get(timeout=self._next_timeout())
+            except queue.Empty:
+                self._commit()
+                continue
+
+            kind = cmd[0]
+            if kind == _CMD_ROW:
+                self._pending.append(cmd[1])
+                if self._oldest_pending is None:
+                    self._oldest_pending = time.monotonic()
+                if cmd[2] or len(self._pending) >= self.flush_max_rows:
+                    self._commit()
+                elif self._next_timeout() == 0:
+                    self._commit()
+            elif kind == _CMD_OPEN:
+                # Day rollover: everything queued so far belongs to the old file
+                self._commit()
+                self._close_file()
+                self._target = cmd[1]
+                self._open_file(self._target)
+            elif kind == _CMD_FLUSH:
+                self._commit()
+                cmd[1].set()
+            elif kind == _CMD_CLOSE:
+                self._commit()
+                self._close_file()
+                cmd[1].set()
+                return
+
+    def _next_timeout(self):
+        if self._oldest_pending is None:
+            return None
+        return max(0, self._oldest_pending + self.flush_max_latency - time.monotonic())
+
+    def _commit(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        self._oldest_pending = None
+        try:
+            with metrics.timer("writer.batch"):
+                self._write_batch(rows)
+            metrics.inc("writer.rows", len(rows))
+            metrics.set_gauge("writer.queue_depth", self._queue.qsize())
+        except Exception as e:
+            metrics.inc("writer.errors")
+            print(f"ログの書き込みに失敗しました: {e}")
+            self._close_file()
+            # Retry once through a fresh handle so a transient error doesn't drop the batch
+            try:
+                self._append_direct(self._target, rows)
+            except Exception as e2:
+                print(f"ログの再書き込みにも失敗しました ({len(rows)}行を破棄): {e2}")
+
+    # --- Storage (overridden by other backends, e.g. activity_store.SqliteLogWriter) ---
+    def _write_batch(self, rows):
+        if self._file is None:
+            self._open_file(self._target)
+        self._csv.writerows(rows)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _open_file(self, path):
+        self._prepare_file(path)
+        self._file = open(path, mode='a', newline='', encoding='utf-8-sig')
+        self._csv = csv.writer(self._file)
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+        self._file = None
+        self._csv = None
+
+    def _prepare_file(self, path):
+        """ファイルが無ければヘッダー付きで作成する。"""
+        if path and not os.path.exists(path):
+            print(f"新しいログファイルを作成します: {path}")
+            with open(path, mode='w', newline='', encoding='utf-8-sig') as f:
+                csv.writer(f).writerow(self.header)
+
+    def _append_direct(self, path, rows):
+        self._prepare_file(path)
+        with open(path, mode='a', newline='', encoding='utf-8-sig') as f:
+            csv.writer(f).writerows(rows)
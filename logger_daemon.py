@@ -0,0 +1,586 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from aggregator import TaskDurationAggregator
+from events import EventBus, EVENT_TYPES, StateChanged, WindowSwitched, LogPaused, DayRolledOver
+from log_schema import read_records, LogSchemaError
+from title_rules import Classification
+
+# --- 設定 ---
+DAEMON_HOST = "127.0.0.1"  # ローカルからのみ接続を受け付ける
+DAEMON_PORT = 8765  # ロガーのAPIのポート（1台につきロガーは1つ）
+RECENT_ACTIVITY_SIZE = 100  # /api/recent で返せる直近の記録の数
+EVENT_KEEPALIVE = 15  # イベントが無い時に接続確認を送る間隔（秒）
+REQUEST_TIMEOUT = 2  # クライアントからの1回の問い合わせの待ち時間（秒）
+RECONNECT_DELAY = 3  # デーモンとの接続が切れた時に再接続するまでの時間（秒）
+# ブラウザから呼べるページの Origin（ポートは問わない）。file:// や sandbox の "null" は許可しない:
+# どのサイトからでも作れる Origin なので。ブラウザのタイマーはこのAPIが配信する http://127.0.0.1:8765/ で開く
+ALLOWED_ORIGINS = ("http://localhost", "http://127.0.0.1")
+# --- 設定ここまで ---
+
+COMMANDS = ("start_work", "start_break", "stop", "pause", "resume", "toggle_pause", "toggle_profile",
+            "memory_snapshot")
+MAX_BODY_BYTES = 64 * 1024
+# The browser timer, served from the daemon so that its Origin is this server's own
+STATIC_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_FILES = {
+    "/": ("index.html", "text/html; charset=utf-8"),
+    "/index.html": ("index.html", "text/html; charset=utf-8"),
+    "/mini-timer.html": ("mini-timer.html", "text/html; charset=utf-8"),
+    "/styles.css": ("styles.css", "text/css; charset=utf-8"),
+    "/script.js": ("script.js", "text/javascript; charset=utf-8"),
+    "/daemon-client.js": ("daemon-client.js", "text/javascript; charset=utf-8"),
+    "/redmine-integration.js": ("redmine-integration.js", "text/javascript; charset=utf-8"),
+    "/icon.png": ("icon.png", "image/png"),
+}
+_EVENTS_BY_NAME = {event_type.__name__: event_type for event_type in EVENT_TYPES}
+
+
+def event_to_dict(event):
+    """イベント (namedtuple) を JSON にできる dict にする。"""
+    data = {"type": type(event).__name__}
+    for name, value in event._asdict().items():
+        data[name] = value._asdict() if isinstance(value, Classification) else value
+    return data
+
+
+def event_from_dict(data):
+    """event_to_dict() の逆。知らない種類なら None。"""
+    event_type = _EVENTS_BY_NAME.get(data.get("type"))
+    if event_type is None:
+        return None
+    values = {name: data.get(name) for name in event_type._fields}
+    if isinstance(values.get("classification"), dict):
+        values["classification"] = Classification(**values["classification"])
+    return event_type(**values)
+
+
+class LoggerService:
+    """
+    動いている UnifiedLogger の状態・直近の記録・タスク別合計をまとめて答えるクラス。
+    記録と合計はイベントで更新するので、問い合わせでログファイルを読み直すことはない
+    （起動時に今日のファイルを1回だけ読む）。API サーバーと、ロガーを同じプロセスに持つ Hub が使う。
+    """
+
+    def __init__(self, logger, recent_size=RECENT_ACTIVITY_SIZE):
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=recent_size)
+        self._totals = TaskDurationAggregator()
+        self._seed(logger.current_log_file)
+        logger.bus.subscribe(self._on_event, (WindowSwitched, LogPaused, DayRolledOver))
+
+    def _seed(self, path):
+        if not os.path.exists(path):
+            return
+        try:
+            for record in read_records(path):
+                self._totals.add_interval(record.app, record.task or None, record.seconds)
+                self._recent.append(WindowSwitched(record.start, record.pid, record.title, record.app,
+                                                   record.state, record.task))
+        except (OSError, LogSchemaError) as e:
+            print(f"今日のログを読み込めませんでした ({path}): {e}")
+
+    def _on_event(self, event):
+        with self._lock:
+            if isinstance(event, DayRolledOver):
+                self._totals.reset()
+                return
+            if isinstance(event, LogPaused):
+                # The paused span belongs to no window; the next switch after resuming starts anew
+                if event.paused:
+                    self._totals.pause(datetime.now())
+                return
+            self._recent.append(event)
+            self._totals.on_event(event)
+
+    # --- Queries ---
+    def state(self):
+        pomodoro = self.logger.pomodoro.get_state()
+        with self._lock:
+            window = event_to_dict(self._recent[-1]) if self._recent else None
+        return {
+            "state": pomodoro["state"],
+            "task": pomodoro["task"],
+            "remaining": self.logger.pomodoro.remaining_time,
+            "paused": self.logger.is_paused.is_set(),
+            "log_file": self.logger.current_log_file,
+            "window": window,
+        }
+
+    def recent(self, limit=RECENT_ACTIVITY_SIZE):
+        """直近の記録（古い順）。"""
+        with self._lock:
+            events = list(self._recent)[-limit:] if limit > 0 else []
+        return [event_to_dict(event) for event in events]
+
+    def totals(self):
+        """今日のタスク別・アプリ別の合計秒数。"""
+        with self._lock:
+            return {"tasks": dict(self._totals.task_totals), "apps": dict(self._totals.app_totals)}
+
+    def diagnostics(self):
+        """ロガーの計測値（metrics.snapshot の形）。"""
+        return self.logger.diagnostics()
+
+    # --- Commands ---
+    def command(self, name, task=None):
+        """操作を実行して、実行後の状態を返す。知らない操作・足りない引数は ValueError。"""
+        if name not in COMMANDS:
+            raise ValueError(f"unknown command: {name}")
+        if name == "start_work":
+            if not task:
+                raise ValueError("start_work needs a task")
+            self.logger.pomodoro.start_work(task)
+        elif name == "start_break":
+            self.logger.pomodoro.start_break()
+        elif name == "stop":
+            self.logger.pomodoro.stop()
+        elif name == "toggle_profile":
+            self.logger.toggle_profiling()
+        elif name == "memory_snapshot":
+            self.logger.memory_snapshot_action()
+        elif name == "toggle_pause" or (name == "pause") != self.logger.is_paused.is_set():
+            self.logger.toggle_pause()
+        return self.state()
+
+
+# --- Server ---
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "ptimer-logger"
+
+    def log_message(self, format, *args):
+        pass  # Requests are routine; errors are printed where they happen
+
+    def _allowed(self):
+        # Only pages from local files/hosts may call in (no cross-site requests, no DNS rebinding)
+        host = (self.headers.get("Host") or "").rsplit(":", 1)[0]
+        if host not in ("127.0.0.1", "localhost", "[::1]"):
+            return False
+        origin = self.headers.get("Origin")
+        if origin is None:
+            return True
+        try:
+            parsed = urlparse(origin)
+            parsed.port  # Raises ValueError for anything but a number
+        except ValueError:
+            return False
+        # Compare scheme and host exactly; a prefix test would let "http://localhost.evil.example" in
+        return f"{parsed.scheme}://{parsed.hostname}" in ALLOWED_ORIGINS and not parsed.path
+
+    def _cors_headers(self):
+        origin = self.headers.get("Origin")
+        if origin and self._allowed():
+            self.send_header("Access-Control-Allow-Origin", origin)
+            self.send_header("Vary", "Origin")
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self._cors_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_static(self, name, content_type):
+        try:
+            with open(os.path.join(STATIC_DIR, name), "rb") as f:
+                body = f.read()
+        except OSError:
+            self._send_json(404, {"error": "not found"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_OPTIONS(self):
+        if not self._allowed():
+            self._send_json(403, {"error": "forbidden"})
+            return
+        self.send_response(204)
+        self._cors_headers()
+        self.send_header("Access-Control-Allow-Methods", "GET, POST")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self.end_headers()
+
+    def do_GET(self):
+        if not self._allowed():
+            self._send_json(403, {"error": "forbidden"})
+            return
+        url = urlparse(self.path)
+        service = self.server.service
+        if url.path == "/api/state":
+            self._send_json(200, service.state())
+        elif url.path == "/api/recent":
+            try:
+                limit = int(parse_qs(url.query).get("limit", [RECENT_ACTIVITY_SIZE])[0])
+            except ValueError:
+                self._send_json(400, {"error": "limit must be an integer"})
+                return
+            self._send_json(200, service.recent(limit))
+        elif url.path == "/api/totals":
+            self._send_json(200, service.totals())
+        elif url.path == "/api/metrics":
+            self._send_json(200, service.diagnostics())
+        elif url.path == "/api/events":
+            self._stream_events()
+        elif url.path in STATIC_FILES:
+            self._send_static(*STATIC_FILES[url.path])
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._allowed():
+            self._send_json(403, {"error": "forbidden"})
+            return
+        if urlparse(self.path).path != "/api/command":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                raise ValueError("request body is too large")
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            state = self.server.service.command(payload.get("command"), payload.get("task"))
+        except (ValueError, AttributeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self._send_json(200, state)
+
+    def _stream_events(self):
+        """Server-Sent Events: 最初に状態のスナップショット、その後はイベントを届いた順に送る。"""
+        events = self.server.service.logger.bus.subscribe_queue(maxsize=1000)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-store")
+            self._cors_headers()
+            self.end_headers()
+            self._send_event({"type": "Snapshot", **self.server.service.state()})
+            while not self.server.closing.is_set():
+                try:
+                    event = events.get(timeout=EVENT_KEEPALIVE)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                self._send_event(event_to_dict(event))
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass  # The client went away
+        finally:
+            self.server.service.logger.bus.unsubscribe(events.subscription)
+
+    def _send_event(self, data):
+        self.wfile.write(b"data: " + json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+
+class LoggerAPIServer(ThreadingHTTPServer):
+    """LoggerService をローカルの HTTP で公開するサーバー。ポートを取れたプロセスがその PC のロガーになる。"""
+
+    daemon_threads = True
+    # On Windows SO_REUSEADDR lets a second process bind the same port, which would defeat
+    # the one-logger-per-machine check
+    allow_reuse_address = os.name != "nt"
+
+    def __init__(self, service, host=DAEMON_HOST, port=DAEMON_PORT):
+        self.service = service
+        self.closing = threading.Event()
+        super().__init__((host, port), _Handler)
+
+    def shutdown(self):
+        self.closing.set()
+        super().shutdown()
+        self.server_close()
+
+
+def bind_api_server(host=DAEMON_HOST, port=DAEMON_PORT):
+    """
+    API のポートを取る（まだ応答はしない）。ポートが使用中なら OSError。
+    ポートを取れたプロセスだけがロガーを作るように、UnifiedLogger を作る前に呼ぶ。
+    """
+    return LoggerAPIServer(None, host, port)
+
+
+def serve_api(server, service):
+    """bind_api_server() で取ったポートで service の API を別スレッドで開始し、server を返す。"""
+    server.service = service
+    host, port = server.server_address[:2]
+    threading.Thread(target=server.serve_forever, name="LoggerAPI", daemon=True).start()
+    print(f"ロガーAPI: http://{host}:{port}/api/state（ブラウザのタイマー: http://{host}:{port}/）")
+    return server
+
+
+def start_api_server(service, host=DAEMON_HOST, port=DAEMON_PORT):
+    """API サーバーを別スレッドで起動して返す。ポートが使用中なら OSError。"""
+    return serve_api(bind_api_server(host, port), service)
+
+
+def daemon_running(host=DAEMON_HOST, port=DAEMON_PORT):
+    """その PC でロガー（API）が既に動いていれば True。起動時に呼ぶので HTTP は使わず、接続できるかだけを見る。"""
+    try:
+        with socket.create_connection((host, port), timeout=REQUEST_TIMEOUT):
+            return True
+    except OSError:
+        return False
+
+
+# --- Client ---
+class RemotePomodoro:
+    """デーモンのポモドーロタイマーを PomodoroTimer と同じ名前で操作する。残り時間は最後に受け取った状態から計算する。"""
+
+    STATE_IDLE = "idle"
+    STATE_WORK = "work"
+    STATE_BREAK = "break"
+
+    def __init__(self, client):
+        self.client = client
+
+    def start_work(self, task_name):
+        self.client.command("start_work", task=task_name)
+
+    def start_break(self):
+        self.client.command("start_break")
+
+    def stop(self):
+        self.client.command("stop")
+
+    def shutdown(self):
+        pass  # The timer belongs to the daemon
+
+    @property
+    def remaining_time(self):
+        state, received_at = self.client.cached_state()
+        if state.get("state", self.STATE_IDLE) == self.STATE_IDLE:
+            return 0
+        return max(0.0, state.get("remaining", 0) - (time.monotonic() - received_at))
+
+    def get_state(self):
+        state, _ = self.client.cached_state()
+        return {"state": state.get("state", self.STATE_IDLE), "remaining_time": int(self.remaining_time),
+                "task": state.get("task")}
+
+
+class LoggerClient:
+    """
+    動いているロガー（デーモン）に HTTP でつなぐ薄いクライアント。
+    UnifiedLogger と同じように bus / pomodoro / toggle_pause() / stop() が使え、
+    デーモンのイベントは run() が受け取ってこのプロセスの bus に発行し直す（ファイルは読まない）。
+    stop() はこのクライアントだけを終了し、デーモンは動き続ける。
+    """
+
+    def __init__(self, host=DAEMON_HOST, port=DAEMON_PORT, bus=None):
+        self.base_url = f"http://{host}:{port}"
+        self.bus = bus or EventBus()
+        self.pomodoro = RemotePomodoro(self)
+        self.icon = None  # Set by setup_tray
+        self.is_running = threading.Event()
+        self._tooltip = None
+        self._state_lock = threading.Lock()
+        self._state = {}
+        self._state_at = time.monotonic()
+        self._stream = None
+        self.state()  # Fails early (OSError) when no daemon is running
+
+    def _request(self, path, payload=None):
+        import urllib.error
+        import urllib.request
+
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data,
+                                         headers={"Content-Type": "application/json"} if data else {})
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode("utf-8")).get("error")
+            except ValueError:
+                message = e.reason
+            raise ValueError(message) from None
+
+    def _remember(self, state):
+        with self._state_lock:
+            self._state = state
+            self._state_at = time.monotonic()
+        return state
+
+    def cached_state(self):
+        """最後に受け取った状態と、受け取った時刻 (monotonic)。"""
+        with self._state_lock:
+            return self._state, self._state_at
+
+    # --- Same queries as LoggerService ---
+    def state(self):
+        return self._remember(self._request("/api/state"))
+
+    def recent(self, limit=RECENT_ACTIVITY_SIZE):
+        return self._request(f"/api/recent?limit={int(limit)}")
+
+    def totals(self):
+        return self._request("/api/totals")
+
+    def diagnostics(self):
+        return self._request("/api/metrics")
+
+    def command(self, name, task=None):
+        return self._remember(self._request("/api/command", {"command": name, "task": task}))
+
+    @property
+    def current_log_file(self):
+        return self.cached_state()[0].get("log_file")
+
+    # --- Same actions as UnifiedLogger ---
+    def toggle_pause(self):
+        self.command("toggle_pause")
+
+    def start_work_action(self):
+        print("\n[Pomodoro] Enter task name in console:")
+
+        def ask_task():
+            try:
+                task_name = input("Task Name > ")
+            except Exception as e:
+                print(f"Error reading input: {e}")
+                task_name = ""
+            self.pomodoro.start_work(task_name or "Default Task")
+
+        threading.Thread(target=ask_task).start()
+
+    def start_break_action(self):
+        self.pomodoro.start_break()
+
+    def stop_timer_action(self):
+        self.pomodoro.stop()
+
+    def toggle_profiling(self):
+        # Profiles the daemon, which does the logging; reports are saved next to its logs
+        self.command("toggle_profile")
+
+    def memory_snapshot_action(self):
+        self.command("memory_snapshot")
+
+    def run(self):
+        """デーモンのイベントを受け取り続ける。切れたら RECONNECT_DELAY 秒後につなぎ直す。"""
+        import urllib.request
+
+        self.is_running.set()
+        while self.is_running.is_set():
+            try:
+                self._stream = urllib.request.urlopen(self.base_url + "/api/events", timeout=EVENT_KEEPALIVE * 2)
+                with self._stream:
+                    self._read_stream(self._stream)
+            except (OSError, ValueError) as e:
+                if self.is_running.is_set():
+                    print(f"ロガーとの接続が切れました。再接続します: {e}")
+            self._stream = None
+            if not self.is_running.is_set():
+                break
+            time.sleep(RECONNECT_DELAY)
+
+    def _read_stream(self, stream):
+        for line in stream:
+            if not self.is_running.is_set():
+                return
+            if line.startswith(b"data: "):
+                self._handle(json.loads(line[len(b"data: "):].decode("utf-8")))
+            if self.icon:
+                self._update_tooltip()
+
+    def _handle(self, data):
+        if data.get("type") == "Snapshot":
+            # (Re)connected: bring subscribers up to date with the daemon
+            data.pop("type")
+            old = self.cached_state()[0].get("state")
+            state = self._remember(data)
+            self.bus.publish(StateChanged(old, state["state"], state["task"], None))
+            self.bus.publish(LogPaused(state["paused"]))
+            return
+        event = event_from_dict(data)
+        if event is None:
+            return
+        if isinstance(event, (StateChanged, LogPaused, DayRolledOver)):
+            # The remaining time and file name come with the state, not with the event
+            self.state()
+        self.bus.publish(event)
+
+    def _update_tooltip(self):
+        state = self.pomodoro.get_state()
+        status = f"State: {state['state']}"
+        if state["state"] != RemotePomodoro.STATE_IDLE:
+            remaining = state["remaining_time"]
+            status += f" ({remaining // 60:02d}:{remaining % 60:02d})"
+        if self.cached_state()[0].get("paused"):
+            status += " [LOG PAUSED]"
+        if status != self._tooltip:
+            self._tooltip = status
+            self.icon.title = status
+
+    def stop(self):
+        self.is_running.clear()
+        stream = self._stream
+        if stream is not None:
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="動いているロガーの状態を表示・操作します（ロガーは unified_logger.py で起動）。")
+    parser.add_argument("command", nargs="?", default="state", choices=("state", "recent", "totals", "metrics", "events") + COMMANDS,
+                        help="表示する内容、または実行する操作")
+    parser.add_argument("task", nargs="?", help="start_work のタスク名")
+    parser.add_argument("--port", type=int, default=DAEMON_PORT, help="ロガーAPIのポート")
+    parser.add_argument("--limit", type=int, default=20, help="recent で表示する件数")
+    args = parser.parse_args()
+
+    try:
+        client = LoggerClient(port=args.port)
+    except OSError:
+        print(f"ロガーが動いていません（ポート {args.port}）。")
+        return
+    if args.command == "events":
+        client.bus.subscribe(lambda event: print(event_to_dict(event)))
+        try:
+            client.run()
+        except KeyboardInterrupt:
+            client.stop()
+        return
+    try:
+        if args.command == "state":
+            result = client.state()
+        elif args.command == "recent":
+            result = client.recent(args.limit)
+        elif args.command == "totals":
+            result = client.totals()
+        elif args.command == "metrics":
+            import metrics
+            print(metrics.format_report(client.diagnostics()))
+            return
+        else:
+            result = client.command(args.command, args.task)
+    except ValueError as e:
+        print(f"エラー: {e}")
+        return
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
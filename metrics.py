@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import json
+import os
+import threading
+import time
+
+# --- 設定 ---
+METRICS_ENABLED = False  # 起動時から計測する（トレイの Diagnostics からも途中で有効にできる）
+METRICS_FILE = "logger_metrics.json"  # 定期的に書き出す計測値のファイル
+METRICS_INTERVAL = 60  # 計測値をファイルに書き出す間隔（秒）
+LOOP_BUDGET = 1.0  # 記録ループ1回の処理がこれ（秒）を超えたら超過として数える
+# ヒストグラムの区切り（ミリ秒）。最後の区切りより長いものは +Inf に入る
+HISTOGRAM_BOUNDS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# --- 設定ここまで ---
+
+
+class Histogram:
+    """
+    固定の区切りに数えるだけの遅延ヒストグラム（1回の記録は bisect 1回と加算数回）。
+    値を保持しないので、何日動かしてもメモリは増えない。パーセンタイルは区切りの上端で近似する。
+    """
+
+    def __init__(self, bounds_ms=HISTOGRAM_BOUNDS_MS):
+        self.bounds = [bound / 1000 for bound in bounds_ms]
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """fraction (0〜1) のパーセンタイルの近似値（秒）。その値を含む区切りの上端（最後は最大値）。"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        ms = lambda seconds: None if seconds is None else round(seconds * 1000, 3)
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "min_ms": ms(self.min), "max_ms": ms(self.max),
+            "p50_ms": ms(self.percentile(0.5)), "p90_ms": ms(self.percentile(0.9)),
+            "p99_ms": ms(self.percentile(0.99)),
+            "buckets": {("+Inf" if i == len(self.bounds) else f"<={self.bounds[i] * 1000:g}ms"): count
+                        for i, count in enumerate(self.counts) if count},
+        }
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "start")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsRegistry:
+    """
+    カウンター・ゲージ・ヒストグラムを名前で持つ入れ物。どのスレッドから記録してもよい。
+    書き出しスレッドが interval 秒ごとに snapshot() を path へ JSON で保存する（原子的に置き換える）。
+    """
+
+    def __init__(self, path=METRICS_FILE, interval=METRICS_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Recording (any thread) ---
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def max_gauge(self, name, value):
+        """ゲージを value との大きい方にする（最大の遅れなど）。"""
+        with self._lock:
+            if value > self.gauges.get(name, value - 1):
+                self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    # --- Reading ---
+    def snapshot(self):
+        with self._lock:
+            return {
+                "enabled": True,
+                "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+                "written_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {name: h.snapshot() for name, h in sorted(self.histograms.items())},
+            }
+
+    def write(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"計測値を書き出せませんでした ({self.path}): {e}")
+
+    # --- Periodic file ---
+    def start(self):
+        if self._thread is None and self.path and self.interval:
+            self._thread = threading.Thread(target=self._run, name="MetricsWriter", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(2)
+            self._thread = None
+        self.write()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+
+# The hot paths call the module functions below. While metrics are disabled each one is a
+# single global check (and timer() hands back a shared no-op context manager). Each reads
+# the global once: disable() may clear it from another thread between two reads.
+_registry = None
+
+
+def enabled():
+    return _registry is not None
+
+
+def enable(path=METRICS_FILE, interval=METRICS_INTERVAL):
+    """計測を始めて、定期的なファイル書き出しを開始する。既に有効ならそのまま返す。"""
+    global _registry
+    if _registry is None:
+        registry = MetricsRegistry(path, interval)
+        registry.start()
+        _registry = registry
+        print(f"計測を開始しました（{interval}秒ごとに {path} へ書き出します）。")
+    return _registry
+
+
+def disable():
+    """計測を止め、最後の値をファイルに書き出す。"""
+    global _registry
+    registry, _registry = _registry, None
+    if registry is not None:
+        registry.stop()
+
+
+def registry():
+    return _registry
+
+
+def inc(name, amount=1):
+    registry = _registry
+    if registry is not None:
+        registry.inc(name, amount)
+
+
+def set_gauge(name, value):
+    registry = _registry
+    if registry is not None:
+        registry.set_gauge(name, value)
+
+
+def max_gauge(name, value):
+    registry = _registry
+    if registry is not None:
+        registry.max_gauge(name, value)
+
+
+def observe(name, seconds):
+    registry = _registry
+    if registry is not None:
+        registry.observe(name, seconds)
+
+
+def timer(name):
+    """with timer("name"): ... の区間の時間をヒストグラムに記録する。無効なら何もしない。"""
+    registry = _registry
+    return _NULL_TIMER if registry is None else _Timer(registry, name)
+
+
+def snapshot():
+    """現在の計測値。無効なら {"enabled": False}。"""
+    registry = _registry
+    return registry.snapshot() if registry is not None else {"enabled": False}
+
+
+def format_report(data=None):
+    """snapshot() の内容を人が読む表にする（トレイの Diagnostics・コンソール用）。"""
+    data = data if data is not None else snapshot()
+    if not data.get("enabled"):
+        return "計測は無効です（unified_logger.py --metrics で起動するか、トレイの Diagnostics で有効になります）。"
+    lines = [f"計測開始: {data['started_at']}（{data['uptime_seconds'] / 60:.1f}分）", ""]
+    # Full-width headers take two columns each, hence the narrower pads
+    lines.append(f"{'ヒストグラム':<26}{'回数':>6}{'平均':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'最大':>8}")
+    fmt = lambda value: "-" if value is None else f"{value:.2f}ms"
+    for name, h in data["histograms"].items():
+        lines.append(f"{name:<32}{h['count']:>8}{fmt(h['mean_ms']):>10}{fmt(h['p50_ms']):>10}"
+                     f"{fmt(h['p90_ms']):>10}{fmt(h['p99_ms']):>10}{fmt(h['max_ms']):>10}")
+    if data["counters"]:
+        lines += ["", "カウンター:"] + [f"  {name}: {value}" for name, value in sorted(data["counters"].items())]
+    if data["gauges"]:
+        lines += ["", "ゲージ:"] + [f"  {name}: {value:.3f}" if isinstance(value, float) else f"  {name}: {value}"
+                                  for name, value in sorted(data["gauges"].items())]
+    return "\n".join(lines)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="ロガーが書き出した計測値のファイルを表にして表示します。")
+    parser.add_argument("path", nargs="?", default=METRICS_FILE, help="計測値のファイル")
+    parser.add_argument("--benchmark", action="store_true", help="無効時・有効時の記録1回あたりのコストを測ります")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+        return
+    try:
+        with open(args.path, encoding="utf-8") as f:
+            print(format_report(json.load(f)))
+    except (OSError, ValueError) as e:
+        print(f"計測値のファイルを読み込めませんでした ({args.path}): {e}")
+
+
+def benchmark(rounds=200000):
+    """timer() と inc() の1回あたりのコスト（無効時・有効時）を表示する。"""
+    def run():
+        start = time.perf_counter()
+        for _ in range(rounds):
+            with timer("benchmark.timer"):
+                pass
+            inc("benchmark.counter")
+        return (time.perf_counter() - start) / rounds * 1e9
+
+    global _registry
+    was_enabled = _registry
+    if was_enabled is None:
+        print(f"無効時: {run():.0f}ns / 回 (timer + inc)")
+    _registry = was_enabled or MetricsRegistry(path=None)
+    print(f"有効時: {run():.0f}ns / 回 (timer + inc)")
+    _registry = was_enabled
+
+
+if __name__ == "__main__":
+    main()
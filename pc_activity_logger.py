@@ -1,16 +1,13 @@
 # -*- coding: utf-8 -*-
 
 import time
-import csv
-import os
-import psutil
-import win32gui
-import win32process
-from datetime import datetime
 import threading
 from pystray import MenuItem as item
 import pystray
 from PIL import Image
+from log_writer import LogWriter
+from log_schema import SCHEMA_V1
+from window_source import default_window_source
 
 # --- 設定 ---
 CHECK_INTERVAL = 5  # アクティブウィンドウのチェック間隔（秒）
@@ -18,29 +15,31 @@ LOG_FILE_PREFIX = "log_"  # ログファイル名の接頭辞
 ICON_FILE = "icon.png"  # トレイアイコンのファイル名
 # --- 設定ここまで ---
 
+LOG_HEADER = list(SCHEMA_V1.header)
+
 class ActivityLogger:
     """
     ユーザーのPC操作（アクティブウィンドウ）を記録するクラス。
     日次でログファイルを自動的に切り替え、バックグラウンドスレッドで実行される。
+    window_source を渡すとアクティブウィンドウの取得元を差し替えられる。
     """
 
-    def __init__(self):
+    def __init__(self, window_source=None):
+        self.window_source = window_source or default_window_source()
         self.current_log_file = self._get_log_file_path()
         self.last_window_title = None
+        self.writer = LogWriter(LOG_HEADER)
         self._initialize_log_file()
         self.is_running = threading.Event()
         self.is_paused = threading.Event()
 
     def _get_log_file_path(self):
-        today = datetime.now().strftime("%Y%m%d")
+        today = self.window_source.now().strftime("%Y%m%d")
         return f"{LOG_FILE_PREFIX}{today}.csv"
 
     def _initialize_log_file(self):
-        if not os.path.exists(self.current_log_file):
-            print(f"新しいログファイルを作成します: {self.current_log_file}")
-            with open(self.current_log_file, mode='w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow(["タイムスタンプ", "アプリ名", "ウィンドウタイトル", "プロセスID"])
+        # 新規ファイルならヘッダーは書き込みスレッドが付与する
+        self.writer.open(self.current_log_file)
 
     def _ensure_correct_log_file(self):
         new_log_file = self._get_log_file_path()
@@ -50,20 +49,11 @@ class ActivityLogger:
             self._initialize_log_file()
 
     def get_active_window_info(self):
-        try:
-            hwnd = win32gui.GetForegroundWindow()
-            pid = win32process.GetWindowThreadProcessId(hwnd)[-1]
-            window_title = win32gui.GetWindowText(hwnd)
-            process_name = psutil.Process(pid).name()
-            return pid, window_title, process_name
-        except (psutil.NoSuchProcess, Exception):
-            return None, "Unknown", "Unknown"
+        return self.window_source.get_active_window()
 
     def log_activity(self, pid, window_title, process_name):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(self.current_log_file, mode='a', newline='', encoding='utf-8-sig') as f:
-            writer = csv.writer(f)
-            writer.writerow([timestamp, process_name, window_title, pid])
+        timestamp = self.window_source.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.writer.write([timestamp, process_name, window_title, pid])
         print(f"記録: [{timestamp}] {process_name} - {window_title}")
 
     def run(self):
@@ -79,10 +69,13 @@ class ActivityLogger:
                 self.log_activity(pid, window_title, process_name)
                 self.last_window_title = window_title
 
-            time.sleep(CHECK_INTERVAL)
+            self.window_source.wait_for_change(CHECK_INTERVAL)
 
     def stop(self):
         self.is_running.clear()
+        self.window_source.close()
+        # 未書き込みの行をすべて書き出してから終了する
+        self.writer.close()
 
     def toggle_pause(self):
         if self.is_paused.is_set():
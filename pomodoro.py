@@ -1,8 +1,28 @@
 # -*- coding: utf-8 -*-
 import time
 import threading
+import random
+import io
+import contextlib
+import metrics
+from events import StateChanged, TaskChanged
+
+# --- 設定 ---
+MAX_WAIT = 30  # タイマースレッドが一度に眠る最大時間（秒）。スリープ復帰の検出間隔になる
+SUSPEND_GAP_THRESHOLD = 10  # 予定より何秒以上遅れて起きたらスリープ復帰とみなすか
+SUSPEND_POLICY = "pause"  # "pause": スリープ中はタイマーを止める / "continue": 経過時間として数える
+# --- 設定ここまで ---
+
 
 class PomodoroTimer:
+    """
+    単調増加クロック上の絶対締め切りで動くポモドーロタイマー。
+    残り時間は問い合わせのたびに締め切りから計算し、フェーズの切り替え
+    （作業→休憩→停止）は専用スレッドが Condition で締め切りまで待って行う。
+    clock と start_thread=False を指定すると、偽の時計で手動で進められる（advance()）。
+    bus を渡すと状態やタスクの変化を StateChanged / TaskChanged イベントとして発行する。
+    """
+
     STATE_IDLE = "idle"
     STATE_WORK = "work"
     STATE_BREAK = "break"
@@ -11,74 +31,239 @@ class PomodoroTimer:
     WORK_DURATION = 25 * 60
     BREAK_DURATION = 5 * 60
 
-    def __init__(self):
+    def __init__(self, clock=time.monotonic, start_thread=True, suspend_policy=SUSPEND_POLICY, bus=None):
+        self.clock = clock
+        self.bus = bus
+        self.suspend_policy = suspend_policy
         self.state = self.STATE_IDLE
-        self.remaining_time = 0
         self.current_task = None
+        self.deadline = None  # Absolute time on self.clock when the current phase ends
         self.lock = threading.Lock()
-        self.last_tick_time = None
+        self._cond = threading.Condition(self.lock)
+        self._closed = False
+        # Called as on_transition(old_state, new_state, scheduled_at) outside the lock
+        self.on_transition = None
+        self._thread = None
+        if start_thread:
+            self._thread = threading.Thread(target=self._run, name="PomodoroTimer", daemon=True)
+            self._thread.start()
 
-    def start_work(self, task_name):
-        with self.lock:
+    # --- Commands ---
+    def start_work(self, task_name, start=None):
+        with self._cond:
+            old, old_task = self.state, self.current_task
             self.state = self.STATE_WORK
-            self.remaining_time = self.WORK_DURATION
             self.current_task = task_name
-            self.last_tick_time = time.time()
+            self.deadline = (self.clock() if start is None else start) + self.WORK_DURATION
+            self._cond.notify_all()
             print(f"[Pomodoro] Started work on: {task_name}")
+        self._notify(old, self.STATE_WORK, None, old_task, task_name)
 
-    def start_break(self):
-        with self.lock:
+    def start_break(self, start=None):
+        with self._cond:
+            old, old_task = self.state, self.current_task
             self.state = self.STATE_BREAK
-            self.remaining_time = self.BREAK_DURATION
             self.current_task = None
-            self.last_tick_time = time.time()
+            self.deadline = (self.clock() if start is None else start) + self.BREAK_DURATION
+            self._cond.notify_all()
             print("[Pomodoro] Started break.")
+        self._notify(old, self.STATE_BREAK, None, old_task, None)
 
     def stop(self):
-        with self.lock:
+        with self._cond:
+            old, old_task = self.state, self.current_task
             self.state = self.STATE_IDLE
-            self.remaining_time = 0
             self.current_task = None
+            self.deadline = None
+            self._cond.notify_all()
             print("[Pomodoro] Timer stopped.")
+        self._notify(old, self.STATE_IDLE, None, old_task, None)
 
-    def tick(self):
-        """Called periodically to update the timer."""
+    def shutdown(self):
+        """タイマースレッドを終了する。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(1)
+
+    # --- Queries ---
+    @property
+    def remaining_time(self):
+        """現在のフェーズの残り秒数（小数）。停止中は0。"""
         with self.lock:
-            if self.state == self.STATE_IDLE:
-                return
+            return self._remaining_locked()
 
-            now = time.time()
-            if self.last_tick_time is None:
-                self.last_tick_time = now
-                return
+    def seconds_until_deadline(self):
+        """現在のフェーズが終わるまでの秒数（小数）。停止中は None。"""
+        with self.lock:
+            if self.deadline is None:
+                return None
+            return self._remaining_locked()
+
+    def get_state(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "remaining_time": int(self._remaining_locked()),
+                "task": self.current_task
+            }
+
+    def _remaining_locked(self):
+        if self.deadline is None:
+            return 0
+        return max(0.0, self.deadline - self.clock())
+
+    # --- Transitions ---
+    def advance(self):
+        """締め切りを過ぎたフェーズをすべて切り替える。偽の時計で進める場合に呼ぶ。"""
+        fired = []
+        with self._cond:
+            self._fire_due_locked(fired)
+        for transition in fired:
+            self._notify(*transition)
+
+    def tick(self):
+        """互換用。切り替えはタイマースレッドが行うため、呼ぶ必要は無い。"""
+        self.advance()
 
-            elapsed = now - self.last_tick_time
-            self.last_tick_time = now
+    def handle_resume(self, gap):
+        """
+        スリープ復帰時の処理。gap はスリープしていた秒数。
+        "pause" ポリシーでは締め切りを gap だけ後ろにずらし、スリープ中を数えない。
+        """
+        with self._cond:
+            if self.deadline is None:
+                return
+            print(f"[Pomodoro] Resumed after {int(gap)}s suspend ({self.suspend_policy}).")
+            if self.suspend_policy == "pause":
+                self.deadline += gap
+            self._cond.notify_all()
 
-            if self.remaining_time > 0:
-                self.remaining_time -= elapsed
-                if self.remaining_time <= 0:
-                    self.remaining_time = 0
-                    self._on_timer_complete()
+    def _fire_due_locked(self, fired):
+        now = self.clock()
+        # A long suspend under the "continue" policy can pass several deadlines at once
+        while self.deadline is not None and now >= self.deadline:
+            at = self.deadline
+            old, old_task = self.state, self.current_task
+            self._on_timer_complete()
+            fired.append((old, self.state, at, old_task, self.current_task))
 
     def _on_timer_complete(self):
-        # This method is called inside the lock from tick()
+        # Called inside the lock. The next deadline is chained off the previous one
+        # (not "now") so late wakeups never accumulate drift.
         if self.state == self.STATE_WORK:
             print("[Pomodoro] Work finished! Starting break.")
             self.state = self.STATE_BREAK
-            self.remaining_time = self.BREAK_DURATION
-            # Note: We continue in the same tick cycle for the next state?
-            # Or just wait for next tick?
-            # It's fine to wait for next tick for accuracy, though technically we "start" now.
+            self.deadline += self.BREAK_DURATION
         elif self.state == self.STATE_BREAK:
-             print("[Pomodoro] Break finished!")
-             self.state = self.STATE_IDLE
-             self.current_task = None
+            print("[Pomodoro] Break finished!")
+            self.state = self.STATE_IDLE
+            self.current_task = None
+            self.deadline = None
 
-    def get_state(self):
-        with self.lock:
-            return {
-                "state": self.state,
-                "remaining_time": int(self.remaining_time),
-                "task": self.current_task
-            }
+    def _notify(self, old, new, at, old_task, new_task):
+        if self.on_transition is not None:
+            self.on_transition(old, new, at)
+        if self.bus is not None:
+            # Commands (at is None) always publish: restarting a phase resets the countdown
+            if old != new or at is None:
+                self.bus.publish(StateChanged(old, new, new_task, at))
+            if old_task != new_task:
+                self.bus.publish(TaskChanged(old_task, new_task))
+
+    def _run(self):
+        while True:
+            fired = []
+            with self._cond:
+                if self._closed:
+                    return
+                wait = MAX_WAIT if self.deadline is None else min(self._remaining_locked(), MAX_WAIT)
+                before = self.clock()
+                self._cond.wait(wait)
+                if self._closed:
+                    return
+                # Monotonic clocks that keep counting through sleep (Windows) show up as
+                # a wait that overran by far more than scheduling jitter.
+                gap = self.clock() - before - wait
+            if gap > SUSPEND_GAP_THRESHOLD:
+                metrics.inc("pomodoro.resumes")
+                self.handle_resume(gap)
+            elif gap > 0:
+                metrics.observe("pomodoro.wake_drift", gap)
+            with self._cond:
+                self._fire_due_locked(fired)
+                fired_at = self.clock()
+            for transition in fired:
+                if metrics.enabled():
+                    self._record_transition(fired_at - transition[2])
+                self._notify(*transition)
+
+    @staticmethod
+    def _record_transition(lateness):
+        # How long after its deadline a phase actually switched (wait jitter plus lock contention)
+        metrics.inc("pomodoro.transitions")
+        metrics.observe("pomodoro.transition_lateness", lateness)
+        metrics.max_gauge("pomodoro.transition_lateness_max_ms", lateness * 1000)
+
+
+class FakeClock:
+    """テスト用の手動で進める時計。"""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def verify_no_drift(days=7, max_step=7.0, seed=0):
+    """
+    偽の時計で作業→休憩のサイクルを days 日分、不規則な間隔で進めて、
+    すべての切り替えが予定の絶対時刻ちょうどに起きることを確かめる。
+    各サイクルは前の休憩の終了時刻から開始するので、誤差があれば累積する。
+    戻り値は (サイクル数, 最大ずれ秒数)。
+    """
+    rng = random.Random(seed)
+    clock = FakeClock()
+    timer = PomodoroTimer(clock=clock, start_thread=False)
+    cycle = timer.WORK_DURATION + timer.BREAK_DURATION
+    transitions = []
+
+    def record(old, new, at):
+        if at is not None:  # Only deadline-driven transitions, not commands
+            transitions.append((new, at))
+
+    timer.on_transition = record
+    cycles = int(days * 86400 // cycle)
+    max_error = 0.0
+    # Silence the per-transition prints while simulating days of cycles
+    with contextlib.redirect_stdout(io.StringIO()):
+        for n in range(cycles):
+            start = n * cycle
+            timer.start_work("drift-check", start=start)
+            while timer.state != timer.STATE_IDLE:
+                clock.advance(rng.uniform(0.001, max_step))
+                timer.advance()
+                if timer.state == timer.STATE_WORK:
+                    expected_remaining = start + timer.WORK_DURATION - clock.now
+                    max_error = max(max_error, abs(timer.remaining_time - expected_remaining))
+
+    expected = []
+    for n in range(cycles):
+        expected.append((timer.STATE_BREAK, n * cycle + timer.WORK_DURATION))
+        expected.append((timer.STATE_IDLE, (n + 1) * cycle))
+    if len(transitions) != len(expected):
+        raise AssertionError(f"{len(transitions)} transitions, expected {len(expected)}")
+    for (state, at), (exp_state, exp_at) in zip(transitions, expected):
+        if state != exp_state:
+            raise AssertionError(f"unexpected transition to {state} at {at}, expected {exp_state}")
+        max_error = max(max_error, abs(at - exp_at))
+    return cycles, max_error
+
+if __name__ == "__main__":
+    cycles, error = verify_no_drift()
+    print(f"{cycles} cycles simulated, max drift {error:.9f}s")
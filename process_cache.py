@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import time
+from collections import OrderedDict
+
+# --- 設定 ---
+PROCESS_CACHE_SIZE = 256  # キャッシュするプロセス数の上限
+PROCESS_CACHE_SWEEP_INTERVAL = 60  # 終了したプロセスを掃除する間隔（秒）
+# --- 設定ここまで ---
+
+
+class ProcessNameCache:
+    """
+    pid → プロセス名 の上限付きLRUキャッシュ。
+    プロセスの起動時刻 (create_time) も保持し、PIDが再利用された場合は取り直す。
+    終了したプロセスは定期的に取り除く。
+    """
+
+    UNKNOWN = "Unknown"
+
+    def __init__(self, max_size=PROCESS_CACHE_SIZE, sweep_interval=PROCESS_CACHE_SWEEP_INTERVAL):
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self._entries = OrderedDict()  # pid -> (create_time, name)
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def get_name(self, pid):
+        import psutil  # Deferred to the first lookup; cached in sys.modules afterwards
+
+        self._maybe_sweep()
+        try:
+            # Process() resolves create_time once; name() is the expensive call we avoid
+            process = psutil.Process(pid)
+            create_time = process.create_time()
+        except psutil.NoSuchProcess:
+            self._entries.pop(pid, None)
+            return self.UNKNOWN
+
+        entry = self._entries.get(pid)
+        if entry is not None and entry[0] == create_time:
+            self._entries.move_to_end(pid)
+            self.hits += 1
+            return entry[1]
+
+        try:
+            name = process.name()
+        except psutil.NoSuchProcess:
+            self._entries.pop(pid, None)
+            return self.UNKNOWN
+
+        self.misses += 1
+        self._entries[pid] = (create_time, name)
+        self._entries.move_to_end(pid)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return name
+
+    def invalidate(self, pid):
+        self._entries.pop(pid, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        import psutil
+        for pid in [pid for pid in self._entries if not psutil.pid_exists(pid)]:
+            del self._entries[pid]
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+import re
+from collections import defaultdict
+
+# --- 設定 ---
+PROMPT_MAX_TOKENS = 3000  # プロンプト全体の目安の上限（トークン数の概算）
+PROMPT_MIN_ENTRY_SECONDS = 60  # これより短い項目は個別に出さず「その他」にまとめる
+PROMPT_DAY_TOP_ENTRIES = 5  # 期間のプロンプトで、1日ごとに挙げる項目数
+# タブのタイトルが "ページ - サイト名" になるブラウザ（小文字）。これらだけサイト単位にまとめる
+BROWSER_APPS = ("chrome.exe", "msedge.exe", "firefox.exe", "brave.exe", "opera.exe", "iexplore.exe")
+# --- 設定ここまで ---
+
+HEADER_DAY = """あなたは優秀な業務アシスタントです。
+以下のPC操作ログから、本日の作業内容を要約してください。
+
+【ログデータ】
+（滞在時間）, アプリ名, ウィンドウタイトル
+"""
+
+HEADER_RANGE = """あなたは優秀な業務アシスタントです。
+以下の{start}〜{end}のPC操作ログ（集計済み）から、期間中の作業内容を要約してください。
+
+"""
+
+FOOTER_DAY = """
+【要約フォーマット案】
+- **主な活動**: （例: 資料作成、プログラミング、情報収集など）
+- **使用した主要アプリケーション**: （例: WINWORD.EXE, Code.exe, chrome.exe）
+- **タスクごとの時間配分（推定）**:
+  - 「○○」に関する資料作成: 約XX時間XX分
+  - 「△△」機能の実装: 約XX時間XX分
+  - Webでの調査: 約XX時間XX分
+- **気付き・提案**: （例: 特定のアプリの使用時間が長いようです。集中して作業できています。）
+
+上記のフォーマットを参考に、ログの内容を解釈して一日の作業サマリーを作成してください。
+"""
+
+FOOTER_RANGE = """
+【要約フォーマット案】
+- **期間の主な活動**: （例: 〇〇機能の実装、△△の資料作成）
+- **日ごと・週ごとの傾向**: （例: 月曜は会議が多い、後半は実装に集中）
+- **使用した主要アプリケーション**と時間配分
+- **気付き・提案**
+
+上記のフォーマットを参考に、期間の作業サマリーを作成してください。
+"""
+
+# Browser and editor decorations that make the same page/document look like many titles
+_TITLE_SUFFIXES = re.compile(
+    r"\s+[-–—|]\s+(Google Chrome|Microsoft\u200b?\s*Edge|Mozilla Firefox|Brave|Opera|Visual Studio Code|"
+    r"Word|Excel|PowerPoint|Outlook)$", re.IGNORECASE)
+_NOISE = re.compile(r"^\(\d+\)\s*|[●*]\s*|\s*\(\d+\)$")  # unread counters, unsaved markers
+_NUMBERS = re.compile(r"\d+")
+
+
+def estimate_tokens(text):
+    """トークン数の概算（ASCII は約4文字で1トークン、それ以外は1文字1トークン）。"""
+    ascii_count = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_count + 3) // 4 + (len(text) - ascii_count)
+
+
+def format_seconds(seconds):
+    """秒数を「H時間M分S秒」の形式にする。"""
+    total_seconds = int(seconds)
+    hours, remainder = divmod(total_seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    parts = []
+    if hours > 0:
+        parts.append(f"{hours}時間")
+    if minutes > 0:
+        parts.append(f"{minutes}分")
+    if secs > 0 or not parts:
+        parts.append(f"{secs}秒")
+    return "".join(parts)
+
+
+def title_key(title, app=None):
+    """
+    ほぼ同じタイトルをまとめるためのキー。ブラウザ名などの接尾辞・未読数・未保存記号を除き、
+    ブラウザ (BROWSER_APPS) のタブはサイト単位、それ以外のアプリは先頭の部分（文書・ファイル名）、
+    数字だけが違うタイトルは1つにまとめる。
+    """
+    title = _TITLE_SUFFIXES.sub("", (title or "").strip())
+    title = _NOISE.sub("", title).strip()
+    parts = re.split(r"\s+[-–—|]\s+", title)
+    if len(parts) > 1:
+        # Browsers: "Page - Site", the last segment names the site. Other apps lead with the
+        # document ("report.docx - Project", "main.py - repo")
+        title = parts[-1] if (app or "").lower() in BROWSER_APPS else parts[0]
+    return _NUMBERS.sub("#", title).lower()
+
+
+def collapse_titles(usage):
+    """
+    (アプリ名, タイトル, 秒数) の列を、近いタイトルをまとめた
+    (秒数, アプリ名, 代表タイトル, まとめた件数) のリストにする（長い順）。
+    代表タイトルはそのグループで最も長く使われたタイトル。
+    """
+    groups = {}
+    for app, title, seconds in usage:
+        key = (app, title_key(title, app))
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [seconds, app, title, 1, seconds]
+        else:
+            group[0] += seconds
+            group[3] += 1
+            if seconds > group[4]:
+                group[2], group[4] = title, seconds
+    entries = [(g[0], g[1], g[2], g[3]) for g in groups.values()]
+    entries.sort(key=lambda entry: entry[0], reverse=True)
+    return entries
+
+
+def _entry_line(seconds, app, title, count):
+    more = f"（ほか{count - 1}件）" if count > 1 else ""
+    return f"（滞在時間: {format_seconds(seconds)}）, {app}, {title}{more}\n"
+
+
+def _rest_line(seconds, count):
+    return f"（滞在時間: {format_seconds(seconds)}）, その他のアプリ, {count}件\n"
+
+
+# Cost kept back for the final "その他のアプリ" line (its numbers are at most this long)
+_REST_LINE_TOKENS = estimate_tokens(_rest_line(9999 * 3600 + 59 * 60 + 59, 9999999))
+
+
+def stream_entries(usage, max_tokens, min_seconds=PROMPT_MIN_ENTRY_SECONDS):
+    """
+    集計を長い順に1行ずつ返す。max_tokens を超える分と min_seconds 未満の項目は
+    アプリごとの「その他」行にまとめて最後に出す（その行も入らなければ全体で1行）。
+    返す行の合計は max_tokens（概算）を超えない。
+    """
+    others = defaultdict(lambda: [0.0, 0])  # app -> [seconds, entries]
+    used = 0
+    # The closing roll-up line must still fit after the entries and per-app lines
+    limit = max_tokens - _REST_LINE_TOKENS
+    for seconds, app, title, count in collapse_titles(usage):
+        line = _entry_line(seconds, app, title, count) if seconds >= min_seconds else None
+        cost = estimate_tokens(line) if line else 0
+        if line and used + cost <= limit:
+            used += cost
+            yield line
+        else:
+            others[app][0] += seconds
+            others[app][1] += count
+
+    rest_seconds = 0.0
+    rest_count = 0
+    for app, (seconds, count) in sorted(others.items(), key=lambda item: item[1][0], reverse=True):
+        line = f"（滞在時間: {format_seconds(seconds)}）, {app}, その他{count}件\n"
+        cost = estimate_tokens(line)
+        if used + cost <= limit:
+            used += cost
+            yield line
+        else:
+            rest_seconds += seconds
+            rest_count += count
+    if rest_count:
+        line = _rest_line(rest_seconds, rest_count)
+        if used + estimate_tokens(line) <= max_tokens:
+            yield line
+
+
+def stream_day_prompt(usage, max_tokens=PROMPT_MAX_TOKENS):
+    """1日分のプロンプトを少しずつ返す。usage は (アプリ名, タイトル, 秒数) の列。"""
+    usage = list(usage)
+    if not usage:
+        yield "分析するログデータがありません。"
+        return
+    budget = max_tokens - estimate_tokens(HEADER_DAY) - estimate_tokens(FOOTER_DAY)
+    yield HEADER_DAY
+    yield from stream_entries(usage, max(0, budget))
+    yield FOOTER_DAY
+
+
+_OMITTED = "- （以降は省略）\n"
+
+
+def stream_range_prompt(days, max_tokens=PROMPT_MAX_TOKENS, weekly=False, top_entries=PROMPT_DAY_TOP_ENTRIES):
+    """
+    複数日のプロンプトを少しずつ返す。days は (日付 date, 集計) の列で、集計は
+    summary_cache.summarize_file の形（usage / apps / tasks）。生の行は読まない。
+    weekly なら日ごとではなく週（月曜始まり）ごとにまとめる。
+    予算は 期間全体の上位項目 → 期間ごとの内訳 の順に使う。
+    """
+    days = sorted(days, key=lambda day: day[0])
+    if not days:
+        yield "分析するログデータがありません。"
+        return
+    header = HEADER_RANGE.format(start=days[0][0].strftime("%Y/%m/%d"), end=days[-1][0].strftime("%Y/%m/%d"))
+    remaining = max_tokens - estimate_tokens(header) - estimate_tokens(FOOTER_RANGE)
+    yield header
+
+    usage = defaultdict(float)
+    tasks = defaultdict(float)
+    for _, summary in days:
+        for app, title, seconds in summary["usage"]:
+            usage[(app, title)] += seconds
+        for task, seconds in (summary.get("tasks") or {}).items():
+            tasks[task] += seconds
+
+    if tasks:
+        section = "【タスク別の合計】\n" + "".join(
+            f"- {task}: {format_seconds(seconds)}\n"
+            for task, seconds in sorted(tasks.items(), key=lambda item: item[1], reverse=True)[:top_entries * 2])
+        if estimate_tokens(section) <= remaining // 4:
+            remaining -= estimate_tokens(section)
+            yield section
+
+    ranking_header = "\n【期間全体の上位】\n（滞在時間）, アプリ名, ウィンドウタイトル\n"
+    period_header = "\n【週ごとのアプリ別時間】\n" if weekly else "\n【日ごとのアプリ別時間】\n"
+    remaining -= estimate_tokens(ranking_header) + estimate_tokens(period_header)
+    # Half of what is left for the overall ranking, the rest for the per-period breakdown
+    overall_budget = max(0, remaining // 2)
+    yield ranking_header
+    used = 0
+    for line in stream_entries(((app, title, s) for (app, title), s in usage.items()), overall_budget):
+        used += estimate_tokens(line)
+        yield line
+    remaining -= used
+
+    periods = defaultdict(lambda: defaultdict(float))
+    labels = {}
+    for day, summary in days:
+        if weekly:
+            year, week, _ = day.isocalendar()
+            key = (year, week)
+            labels.setdefault(key, f"{year}年第{week}週（{day.strftime('%m/%d')}〜）")
+        else:
+            key = day
+            labels[key] = day.strftime("%Y/%m/%d (%a)")
+        for app, seconds in (summary.get("apps") or {}).items():
+            periods[key][app] += seconds
+
+    yield period_header
+    for key in sorted(periods):
+        apps = sorted(periods[key].items(), key=lambda item: item[1], reverse=True)
+        total = sum(seconds for _, seconds in apps)
+        line = f"- {labels[key]} 合計{format_seconds(total)}: " + ", ".join(
+            f"{app} {format_seconds(seconds)}" for app, seconds in apps[:top_entries]) + "\n"
+        cost = estimate_tokens(line)
+        if cost + estimate_tokens(_OMITTED) > remaining:
+            if estimate_tokens(_OMITTED) <= remaining:
+                yield _OMITTED
+            break
+        remaining -= cost
+        yield line
+    yield FOOTER_RANGE
+
+
+def build_prompt(chunks):
+    """stream_*_prompt の結果を1つの文字列にする。"""
+    return "".join(chunks)
+
+
+def check_budget(budgets=(400, 800, 1600, 3000), entries=2000, seed=0):
+    """
+    項目が予算に収まらず「その他」にまとめられる量の集計で、1日分・期間のプロンプトが
+    max_tokens（概算）を超えないかを確かめる。問題のリストを返す（空なら正常）。
+    """
+    import random
+    from datetime import date, timedelta
+    rng = random.Random(seed)
+    apps = [f"app{i}.exe" for i in range(60)]
+    usage = [(rng.choice(apps), "".join(rng.choices("abcdefghij", k=8)) + ".docx", rng.uniform(30, 7200))
+             for i in range(entries)]
+    days = [(date(2026, 1, 1) + timedelta(days=d), {
+        "usage": usage[d::7], "tasks": {f"PROJ-{i}": rng.uniform(60, 3600) for i in range(20)},
+        "apps": {app: rng.uniform(60, 3600) for app in apps}}) for d in range(7)]
+    problems = []
+    for budget in budgets:
+        for kind, prompt in (("1日", build_prompt(stream_day_prompt(usage, budget))),
+                             ("期間", build_prompt(stream_range_prompt(days, budget)))):
+            cost = estimate_tokens(prompt)
+            if "その他" not in prompt and "省略" not in prompt:
+                problems.append(f"{kind} budget={budget}: 項目が打ち切られませんでした（確認にならない）")
+            if cost > budget:
+                problems.append(f"{kind} budget={budget}: {cost}トークンで予算を超えました")
+    return problems
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="LLM用プロンプトの組み立てを確かめます。")
+    parser.add_argument("--check", action="store_true", help="打ち切りが起きる量の集計でプロンプトが予算に収まるか確かめます")
+    args = parser.parse_args()
+
+    if args.check:
+        problems = check_budget()
+        for problem in problems:
+            print(f"NG: {problem}")
+        print("OK" if not problems else f"{len(problems)}件の問題があります。")
+        raise SystemExit(1 if problems else 0)
+    parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+# --- 設定 ---
+MIN_POLL_INTERVAL = 1.0  # ウィンドウ切り替え直後のチェック間隔（秒）
+MAX_POLL_INTERVAL = 5.0  # ウィンドウが変わらない時のチェック間隔の上限（秒）
+BACKOFF_FACTOR = 1.5  # 変化が無いたびに間隔を何倍にするか
+DEADLINE_SLACK = 0.05  # 締め切りの少し後に起きて、確実に経過後に判定する（秒）
+# --- 設定ここまで ---
+
+
+class AdaptiveScheduler:
+    """
+    ログ記録ループの次の起床までの時間を決めるクラス。
+    切り替え直後は短い間隔で確認し、変化が無ければ徐々に間隔を延ばす。
+    ポモドーロの締め切りや日付の変わり目より後まで眠ることはない。
+    """
+
+    def __init__(self, min_interval=MIN_POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL,
+                 backoff=BACKOFF_FACTOR, clock=time.monotonic, now=datetime.now):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = backoff
+        self.clock = clock
+        self.now = now
+        self.interval = min_interval
+        self.total_wakeups = 0
+        self._wakeups = deque()  # monotonic times of recent wakeups
+        self._started_at = clock()
+
+    def record_sample(self, switched):
+        """サンプリング結果を反映する。切り替えがあれば最短間隔に戻す。"""
+        if switched:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+    def next_timeout(self, deadline_in=None, poll=True):
+        """
+        次に起きるまでの秒数を返す。
+        deadline_in はポモドーロの締め切りまでの秒数（タイマー停止中は None）。
+        poll=False（記録の一時停止中や、イベント駆動のソース）ではウィンドウを
+        見に行く必要が無いので、締め切りか日付変更まで眠る。
+        """
+        timeout = self.seconds_until_midnight() + DEADLINE_SLACK
+        if poll:
+            timeout = min(timeout, self.interval)
+        if deadline_in is not None:
+            timeout = min(timeout, max(0.0, deadline_in) + DEADLINE_SLACK)
+        return timeout
+
+    def seconds_until_midnight(self):
+        now = self.now()
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (midnight - now).total_seconds()
+
+    def record_wakeup(self):
+        now = self.clock()
+        self.total_wakeups += 1
+        self._wakeups.append(now)
+        while self._wakeups and self._wakeups[0] < now - 60:
+            self._wakeups.popleft()
+
+    def wakeups_per_minute(self):
+        """直近1分間の起床回数。"""
+        now = self.clock()
+        while self._wakeups and self._wakeups[0] < now - 60:
+            self._wakeups.popleft()
+        return len(self._wakeups)
+
+    def average_wakeups_per_minute(self):
+        elapsed = self.clock() - self._started_at
+        if elapsed <= 0:
+            return 0.0
+        return self.total_wakeups * 60.0 / elapsed
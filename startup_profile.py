@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+import unicodedata
+
+# --- 設定 ---
+STARTUP_TOP_MODULES = 15  # 表示する重いモジュールの数
+STARTUP_BUDGET_MS = None  # 最初の段階（ロガーの中核）の import 時間の上限（ミリ秒）。None なら確認しない
+# 最初の段階で読み込まれていたら警告するモジュール（使う時に読み込むもの）
+STARTUP_LAZY_MODULES = ("pandas", "numpy", "pystray", "PIL", "keyboard", "psutil", "jira_fetcher",
+                        "activity_store", "sqlite3")
+# --- 設定ここまで ---
+
+# 段階の名前と、その段階で import するモジュール
+LOGGER_STAGES = [
+    ("unified_logger", ["unified_logger"]),
+    ("API", ["logger_daemon"]),
+    ("window/psutil", ["psutil"]),
+    ("tray/hotkeys", ["pystray", "PIL.Image", "keyboard"]),
+]
+HUB_STAGES = [
+    ("hub_ui", ["hub_ui"]),
+    ("API", ["logger_daemon"]),
+    ("jira", ["jira_fetcher"]),
+    ("analysis", ["pandas"]),
+]
+
+STAGE_MARKER = "@@stage "
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+# Runs in a fresh interpreter under -X importtime. RSS is read without psutil so that
+# measuring does not load the very module being measured.
+_CHILD = r'''
+import json, os, sys, time
+
+def rss():
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in ("PeakWorkingSetSize", "WorkingSetSize",
+                "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+def mark(data):
+    sys.stderr.write("@@stage " + json.dumps(data) + "\n")
+    sys.stderr.flush()
+
+mark({"stage": "python", "seconds": 0.0, "rss": rss(), "modules": len(sys.modules), "missing": []})
+for name, modules in json.loads(sys.argv[1]):
+    before = set(sys.modules)
+    missing = []
+    start = time.perf_counter()
+    for module in modules:
+        try:
+            __import__(module)
+        except ImportError:
+            missing.append(module)
+    seconds = time.perf_counter() - start
+    mark({"stage": name, "seconds": seconds, "rss": rss(), "modules": len(sys.modules),
+          "missing": missing, "loaded": sorted(set(sys.modules) - before)})
+'''
+
+
+def profile_startup(stages, cwd=None):
+    """
+    新しい Python で stages を順に import し、段階ごとの時間・RSS と、
+    モジュールごとの import 時間（-X importtime）を返す。
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", _CHILD, json.dumps(stages)],
+                            cwd=cwd, capture_output=True, text=True, encoding="utf-8", errors="replace")
+    profile = {"stages": [], "modules": []}
+    stage = None
+    for line in result.stderr.splitlines():
+        if line.startswith(STAGE_MARKER):
+            profile["stages"].append(json.loads(line[len(STAGE_MARKER):]))
+            stage = profile["stages"][-1]["stage"]
+            continue
+        match = _IMPORT_LINE.match(line)
+        if match:
+            # Lines come before the marker that closes their stage
+            profile["modules"].append({"module": match.group(4), "self_us": int(match.group(1)),
+                                       "cumulative_us": int(match.group(2)), "depth": len(match.group(3)) // 2,
+                                       "after": stage})
+    # Attribute each module to the stage that followed the preceding marker
+    names = [s["stage"] for s in profile["stages"]]
+    for module in profile["modules"]:
+        index = names.index(module.pop("after")) + 1 if module["after"] in names else 0
+        module["stage"] = names[index] if index < len(names) else None
+    if result.returncode != 0 and not profile["stages"]:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "profile failed")
+    return profile
+
+
+def check_profile(profile, lazy_modules=STARTUP_LAZY_MODULES, budget_ms=STARTUP_BUDGET_MS):
+    """最初の段階について、読み込まれてはいけないモジュールと時間の超過を問題のリストで返す。"""
+    if len(profile["stages"]) < 2:
+        return []
+    core = profile["stages"][1]
+    loaded = set(core.get("loaded", []))
+    problems = [f"{core['stage']} で {name} が読み込まれています（使う時に読み込むべきモジュール）"
+                for name in lazy_modules if name in loaded]
+    if budget_ms is not None and core["seconds"] * 1000 > budget_ms:
+        problems.append(f"{core['stage']} の import に {core['seconds'] * 1000:.0f}ms かかりました（上限 {budget_ms}ms）")
+    return problems
+
+
+def _width(text):
+    return sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
+
+
+def _rjust(text, width):
+    # Full-width characters take two columns in a terminal
+    return " " * max(0, width - _width(text)) + text
+
+
+def print_report(profile, top=STARTUP_TOP_MODULES):
+    print("[起動プロファイル]")
+    print("段階" + " " * 12 + "".join(_rjust(title, width) for title, width in
+                                       (("時間", 10), ("RSS", 10), ("増分", 10), ("モジュール", 12))))
+    previous = None
+    for stage in profile["stages"]:
+        rss = stage["rss"] / 1e6
+        delta = f"+{rss - previous['rss'] / 1e6:.1f}MB" if previous else ""
+        modules = f"+{stage['modules'] - previous['modules']}" if previous else str(stage["modules"])
+        missing = f"  (未インストール: {', '.join(stage['missing'])})" if stage.get("missing") else ""
+        print(f"{stage['stage']:<16}{stage['seconds'] * 1000:>8.1f}ms{rss:>8.1f}MB{delta:>10}{modules:>12}{missing}")
+        previous = stage
+
+    print(f"\n重いモジュール（自身の import 時間、上位{top}）:")
+    for module in sorted(profile["modules"], key=lambda m: m["self_us"], reverse=True)[:top]:
+        print(f"  {module['self_us'] / 1000:7.1f}ms (累積 {module['cumulative_us'] / 1000:7.1f}ms)  "
+              f"{module['module']}  [{module['stage']}]")
+
+
+def run(stages, output=None, budget_ms=STARTUP_BUDGET_MS):
+    """プロファイルを取って表示し、問題があれば 1、無ければ 0 を返す（--profile-startup 用）。"""
+    profile = profile_startup(stages)
+    print_report(profile)
+    problems = check_profile(profile, budget_ms=budget_ms)
+    for problem in problems:
+        print(f"警告: {problem}")
+    if output:
+        profile["problems"] = problems
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(profile, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {output}")
+    return 1 if problems else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時の import 時間とメモリ (RSS) を段階ごとに計測します。")
+    parser.add_argument("entry", nargs="?", choices=("logger", "hub"), default="logger", help="計測する入口")
+    parser.add_argument("--output", help="結果を JSON で保存するファイル")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS, help="最初の段階の import 時間の上限")
+    args = parser.parse_args()
+    sys.exit(run(LOGGER_STAGES if args.entry == "logger" else HUB_STAGES, args.output, args.budget_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+from interval_log import sum_intervals
+from log_archive import stat as archive_stat
+
+# --- 設定 ---
+SUMMARY_CACHE_FILE = "log_summary_cache.json"  # ログと同じ場所に置く集計キャッシュ
+SUMMARY_CACHE_VERSION = 1  # 集計の中身や形式を変えたら上げる（古いエントリは無効になる）
+# --- 設定ここまで ---
+
+
+def summarize_file(path, idle_threshold=None):
+    """1日分のログを1パスで集計する。結果はJSONにそのまま保存できる形。"""
+    usage, apps, tasks = sum_intervals(path, idle_threshold)
+    return {
+        "usage": [[app, title, seconds] for (app, title), seconds in usage.items()],
+        "apps": dict(apps),
+        "tasks": dict(tasks),
+    }
+
+
+class SummaryCache:
+    """
+    過去のログファイルごとの集計（アプリ・タイトル・タスク別の秒数）を保存するキャッシュ。
+    エントリはパスをキーにし、mtime・サイズ・形式バージョン・離席の打ち切り秒数が一致する時だけ使う。
+    ファイルが書き換えられれば自動的に集計し直される。
+    """
+
+    def __init__(self, path=SUMMARY_CACHE_FILE):
+        self.path = path
+        self.entries = {}  # abspath -> {"mtime", "size", "version", "idle_threshold", "summary"}
+        self._dirty = False
+        self.load()
+
+    # --- Persistence ---
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"集計キャッシュを読み込めませんでした。作り直します: {e}")
+            return
+        self.entries = data.get("files", {})
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.entries}, f, ensure_ascii=False)
+        # Atomic swap so a crash never leaves a half-written cache
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    # --- Entries ---
+    def get(self, log_path, idle_threshold=None):
+        """ファイルが前回の集計時から変わっていなければ集計結果を返す。無ければ None。"""
+        entry = self.entries.get(os.path.abspath(log_path))
+        if entry is None or entry.get("version") != SUMMARY_CACHE_VERSION:
+            return None
+        if entry.get("idle_threshold") != idle_threshold:
+            return None
+        try:
+            mtime, size = archive_stat(log_path)
+        except OSError:
+            return None
+        if entry.get("mtime") != mtime or entry.get("size") != size:
+            return None
+        return entry["summary"]
+
+    def put(self, log_path, summary, stat=None, idle_threshold=None):
+        """
+        集計結果を保存する。stat は集計を始める前に取った (mtime, size)（途中で追記されても古い値で記録する）。
+        圧縮された日・月アーカイブ内の日も log_archive の参照先のまま渡せる。
+        """
+        mtime, size = stat or archive_stat(log_path)
+        self.entries[os.path.abspath(log_path)] = {
+            "mtime": mtime,
+            "size": size,
+            "version": SUMMARY_CACHE_VERSION,
+            "idle_threshold": idle_threshold,
+            "summary": summary,
+        }
+        self._dirty = True
+
+    def summarize(self, log_path, cacheable=True, idle_threshold=None):
+        """キャッシュにあればそれを、無ければ集計して（cacheable なら保存して）返す。"""
+        if cacheable:
+            summary = self.get(log_path, idle_threshold)
+            if summary is not None:
+                return summary
+        stat = archive_stat(log_path)
+        summary = summarize_file(log_path, idle_threshold)
+        if cacheable:
+            self.put(log_path, summary, stat, idle_threshold)
+        return summary
+
+    def rebuild(self, paths, idle_threshold=None):
+        """指定したファイルを集計し直してキャッシュを作り直す。戻り値は集計したファイル数。"""
+        self.entries = {}
+        self._dirty = True
+        for path in paths:
+            stat = archive_stat(path)
+            self.put(path, summarize_file(path, idle_threshold), stat, idle_threshold)
+        self.save()
+        return len(paths)
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import random
+import re
+import time
+from collections import namedtuple
+
+# --- 設定 ---
+TITLE_RULES_FILE = "title_rules.json"  # ウィンドウタイトルの分類ルール（無ければ分類しない）
+TITLE_CACHE_SIZE = 4096  # 分類結果を覚えておくタイトル数の上限
+JIRA_KEY_PATTERN = r"\b([A-Z][A-Z0-9]+-\d+)\b"  # ルールでチケットが決まらない時にタイトルから拾うキー
+# --- 設定ここまで ---
+
+# project / ticket / category are None when nothing matched; rule is the matching rule's name
+Classification = namedtuple("Classification", "project ticket category rule")
+UNCLASSIFIED = Classification(None, None, None, None)
+
+_FIELDS = ("project", "ticket", "category")
+_QUANTIFIERS = "?*{"
+_SPECIAL = ".^$+()[]|"
+_VERBOSE_FLAG = re.compile(r"\(\?[a-zA-Z]*x")
+# Escapes followed by the digits of a code point or a group number: (allowed digits, max count)
+_DIGIT_ESCAPES = {"x": ("0123456789abcdefABCDEF", 2), "u": ("0123456789abcdefABCDEF", 4),
+                  "U": ("0123456789abcdefABCDEF", 8), "0": ("01234567", 2)}
+_DIGIT_ESCAPES.update((d, ("0123456789", 2)) for d in "123456789")  # \12 backreference, \123 octal
+
+
+class TitleRuleError(ValueError):
+    pass
+
+
+def _rule_pattern(rule):
+    """1つのルールを正規表現の文字列にする。keyword / keywords は大文字小文字を区別しない部分一致。"""
+    keywords = rule.get("keywords") or ([rule["keyword"]] if rule.get("keyword") else [])
+    if keywords:
+        return "(?i:" + "|".join(re.escape(k) for k in keywords) + ")"
+    pattern = rule.get("pattern")
+    if not pattern:
+        raise TitleRuleError(f"rule has neither pattern nor keyword: {rule}")
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        raise TitleRuleError(f"invalid pattern {pattern!r}: {e}") from None
+    return pattern
+
+
+def required_literals(rule):
+    """
+    ルールが当たるタイトルには、返す文字列（小文字）のどれかが必ず含まれる。決められなければ None。
+    keyword(s) はそのまま、pattern は選択 (|) を含まない場合に限り、
+    グループの外の連続した通常文字から最長のものを取る。
+    """
+    keywords = rule.get("keywords") or ([rule["keyword"]] if rule.get("keyword") else [])
+    if keywords:
+        return tuple(k.lower() for k in keywords)
+    pattern = rule.get("pattern") or ""
+    if "|" in pattern or _VERBOSE_FLAG.search(pattern):
+        return None
+    runs, run, depth, i = [], "", 0, 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\" and i + 1 < len(pattern):
+            nxt = pattern[i + 1]
+            i += 2
+            if nxt.isalnum():
+                # \d, \b, \w ...: a character class or an assertion, not a literal. \x41, \N{...}
+                # and backreferences end the run too, and their digits/name are not literal text
+                runs.append(run)
+                run = ""
+                if nxt in _DIGIT_ESCAPES:
+                    digits, limit = _DIGIT_ESCAPES[nxt]
+                    end = i
+                    while end < len(pattern) and end - i < limit and pattern[end] in digits:
+                        end += 1
+                    i = end
+                elif nxt == "N" and pattern.startswith("{", i):
+                    i = pattern.find("}", i) + 1 or len(pattern)
+            elif depth == 0:
+                run += nxt
+            continue
+        if ch in _QUANTIFIERS:
+            # The preceding character is optional
+            runs.append(run[:-1])
+            run = ""
+            if ch == "{":
+                i = pattern.find("}", i) if "}" in pattern[i:] else len(pattern)
+        elif ch in _SPECIAL:
+            runs.append(run)
+            run = ""
+            if ch == "(":
+                depth += 1
+            elif ch == ")":
+                depth = max(0, depth - 1)
+            elif ch == "[":
+                i = pattern.find("]", i + 2) if "]" in pattern[i + 2:] else len(pattern)
+        elif depth == 0:
+            run += ch
+        i += 1
+    runs.append(run)
+    literal = max(runs, key=len)
+    return (literal.lower(),) if len(literal) >= 2 else None
+
+
+class TitleClassifier:
+    """
+    ウィンドウタイトルをプロジェクト・チケット・分類（"meeting" など）に振り分けるルールエンジン。
+    ルールはコンパイル時に「当たるなら必ず含まれる文字列」を取り出して索引にしておき、
+    照合ではタイトルに含まれる文字列から候補のルールだけを選んで、並び順に正規表現で確かめる。
+    結果は (アプリ名, タイトル) ごとに覚えておく。
+
+    ルールは dict で、pattern（正規表現）か keyword / keywords（部分一致）のどちらかと、
+    project / ticket / category / app（アプリ名の完全一致、大文字小文字は無視）/ name を持てる。
+    pattern の名前付きグループ (?P<ticket>...) / (?P<project>...) / (?P<category>...) は
+    当たった文字列がその値になる。チケットが決まらなければタイトル中の Jira キーを使い、
+    プロジェクトが決まらなければチケットキーの接頭辞を使う。
+    """
+
+    def __init__(self, rules=(), cache_size=TITLE_CACHE_SIZE, jira_key_pattern=JIRA_KEY_PATTERN):
+        self.rules = [dict(rule) for rule in rules]
+        self.cache_size = cache_size
+        self._jira_key = re.compile(jira_key_pattern) if jira_key_pattern else None
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+        self._compile()
+
+    @classmethod
+    def load(cls, path=TITLE_RULES_FILE, **kwargs):
+        """ルールファイル（JSONのリスト、または {"rules": [...]}）から作る。"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("rules", []) if isinstance(data, dict) else data, **kwargs)
+
+    def _compile(self):
+        self._regexes = [re.compile(_rule_pattern(rule)) for rule in self.rules]
+        self._literals = [required_literals(rule) for rule in self.rules]
+        self._index_by_app = {}
+        self._cache.clear()
+
+    def _index(self, app):
+        """
+        そのアプリに効くルールの索引: (文字列, ルール番号) の一覧と、文字列で絞れないルール番号の集合。
+        アプリごとに初回だけ作る。
+        """
+        key = app.lower()
+        index = self._index_by_app.get(key)
+        if index is None:
+            literals, always = [], set()
+            for i, rule in enumerate(self.rules):
+                if rule.get("app") and rule["app"].lower() != key:
+                    continue
+                if self._literals[i]:
+                    literals.extend((literal, i) for literal in self._literals[i])
+                else:
+                    always.add(i)
+            index = self._index_by_app[key] = (literals, frozenset(always))
+        return index
+
+    def _first_match(self, app, title):
+        """並び順で最初に当たるルールの (番号, match) を返す。無ければ (None, None)。"""
+        literals, always = self._index(app)
+        lowered = title.lower()
+        # Substring tests are cheap; only rules whose literal occurs are run as regexes
+        candidates = always.union([i for literal, i in literals if literal in lowered])
+        for i in sorted(candidates):
+            match = self._regexes[i].search(title)
+            if match:
+                return i, match
+        return None, None
+
+    def classify(self, app, title):
+        """(アプリ名, タイトル) の Classification を返す。同じ組は2回目以降キャッシュから返す。"""
+        key = (app, title)
+        result = self._cache.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = self._classify(app or "", title or "")
+        if len(self._cache) >= self.cache_size:
+            # Titles repeat within a day; starting over is cheaper than tracking recency
+            self._cache.clear()
+        self._cache[key] = result
+        return result
+
+    def classify_many(self, pairs):
+        """(アプリ名, タイトル) の列をまとめて分類する（重複する組は1回だけ照合する）。"""
+        return [self.classify(app, title) for app, title in pairs]
+
+    def _classify(self, app, title):
+        values = dict.fromkeys(_FIELDS)
+        name = None
+        i, match = self._first_match(app, title)
+        if match:
+            rule = self.rules[i]
+            name = rule.get("name") or rule.get("pattern") or rule.get("keyword") or ",".join(rule.get("keywords", []))
+            groups = match.groupdict()
+            for field in _FIELDS:
+                values[field] = groups.get(field) or rule.get(field)
+        if values["ticket"] is None and self._jira_key is not None:
+            found = self._jira_key.search(title)
+            if found:
+                values["ticket"] = found.group(1)
+        if values["project"] is None and values["ticket"] and "-" in values["ticket"]:
+            values["project"] = values["ticket"].rsplit("-", 1)[0]
+        if name is None and values["ticket"] is None:
+            return UNCLASSIFIED
+        return Classification(values["project"], values["ticket"], values["category"], name)
+
+    def __len__(self):
+        return len(self.rules)
+
+
+def load_classifier(path=TITLE_RULES_FILE):
+    """ルールファイルがあれば TitleClassifier を返す。無い・壊れている場合は None。"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return TitleClassifier.load(path)
+    except (OSError, ValueError) as e:
+        print(f"分類ルールを読み込めませんでした ({path}): {e}")
+        return None
+
+
+def describe(classification):
+    """コンソール表示用の短い文字列（分類されていなければ空）。"""
+    parts = [v for v in (classification.ticket or classification.project, classification.category) if v]
+    return "/".join(parts)
+
+
+def check_index(classifier, pairs):
+    """
+    索引で候補を絞った照合が、全ルールを並び順に正規表現で照合した場合と同じルールを選ぶか確かめる。
+    食い違った (アプリ名, タイトル, 索引の結果, 全ルールの結果) のリストを返す（ルールの番号、無ければ None）。
+    """
+    mismatches = []
+    for app, title in pairs:
+        app, title = app or "", title or ""
+        expected = next((i for i, (rule, regex) in enumerate(zip(classifier.rules, classifier._regexes))
+                         if (not rule.get("app") or rule["app"].lower() == app.lower()) and regex.search(title)),
+                        None)
+        found, _ = classifier._first_match(app, title)
+        if found != expected:
+            mismatches.append((app, title, found, expected))
+    return mismatches
+
+
+# --- Benchmark ---
+def _sample_rules(count, rng):
+    rules = [{"name": "meeting", "keywords": ["Zoom", "Teams 会議", "Google Meet"], "category": "meeting"},
+             {"name": "dev", "pattern": r"(?P<ticket>PROJ-\d+).*Visual Studio Code", "category": "development"}]
+    for i in range(count - len(rules)):
+        if i % 2:
+            rules.append({"keyword": f"customer{i}", "project": f"CUST{i}"})
+        else:
+            rules.append({"pattern": rf"\bspec[-_ ]{i}\b", "project": f"SPEC{i}", "category": "document"})
+    rng.shuffle(rules)
+    return rules
+
+
+def _sample_titles(count, distinct, rng):
+    apps = ["chrome.exe", "Code.exe", "OUTLOOK.EXE", "Teams.exe", "WINWORD.EXE"]
+    pool = []
+    for i in range(distinct):
+        kind = rng.randrange(4)
+        if kind == 0:
+            title = f"PROJ-{rng.randrange(500)} fix parser - app.py - Visual Studio Code"
+        elif kind == 1:
+            title = f"customer{rng.randrange(400)} 提案書 v{i}.docx - Word"
+        elif kind == 2:
+            title = f"spec-{rng.randrange(400)} review - Google Chrome"
+        else:
+            title = f"受信トレイ ({i}) - Outlook"
+        pool.append((rng.choice(apps), title))
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def benchmark(rule_counts=(10, 100, 500), title_count=100_000, distinct=2_000, seed=0):
+    """ルール数ごとに、全ルールを順に照合する場合と索引付きのエンジン（キャッシュ無し・有り）の速度を比べる。"""
+    rng = random.Random(seed)
+    titles = _sample_titles(title_count, distinct, rng)
+    unique = list(dict.fromkeys(titles))
+    print(f"titles: {title_count} ({len(unique)} distinct)")
+    for count in rule_counts:
+        rules = _sample_rules(count, rng)
+
+        compiled = [(re.compile(_rule_pattern(r)), r) for r in rules]
+        start = time.perf_counter()
+        for app, title in unique:
+            for regex, rule in compiled:
+                if (not rule.get("app") or rule["app"].lower() == app.lower()) and regex.search(title):
+                    break
+        naive = time.perf_counter() - start
+
+        start = time.perf_counter()
+        classifier = TitleClassifier(rules)
+        build = time.perf_counter() - start
+        classifier.cache_size = 0  # Every lookup misses
+        start = time.perf_counter()
+        for app, title in unique:
+            classifier._classify(app, title)
+        indexed = time.perf_counter() - start
+
+        mismatches = check_index(classifier, unique)
+        if mismatches:
+            print(f"rules={count:4d}: 索引の結果が全ルールの照合と{len(mismatches)}件食い違いました（例: {mismatches[0]}）")
+
+        classifier = TitleClassifier(rules)
+        start = time.perf_counter()
+        classifier.classify_many(titles)
+        cached = time.perf_counter() - start
+        print(f"rules={count:4d}: compile {build * 1e3:.1f}ms | "
+              f"per-rule loop {naive / len(unique) * 1e6:.1f}us/title | "
+              f"indexed {indexed / len(unique) * 1e6:.1f}us/title | "
+              f"indexed+cache {cached / title_count * 1e6:.2f}us/title "
+              f"({title_count / cached:,.0f} titles/s, hit rate {classifier.hits / title_count:.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ウィンドウタイトルの分類ルールを試す・速度を計測します。")
+    parser.add_argument("titles", nargs="*", help="分類するタイトル（\"アプリ名:タイトル\" でアプリも指定）")
+    parser.add_argument("--rules", default=TITLE_RULES_FILE, help="ルールファイル")
+    parser.add_argument("--benchmark", action="store_true", help="ルール数 × タイトル数の速度を計測します")
+    parser.add_argument("--rule-counts", default="10,100,500", help="計測するルール数（カンマ区切り）")
+    parser.add_argument("--count", type=int, default=100_000, help="計測に使うタイトル数")
+    parser.add_argument("--check", metavar="LOG", nargs="+",
+                        help="ログCSVのタイトルで、索引付きの照合が全ルールの照合と同じ結果になるか確かめます")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(tuple(int(n) for n in args.rule_counts.split(",")), args.count)
+        return
+    classifier = TitleClassifier.load(args.rules)
+    if args.check:
+        from log_schema import read_records
+        pairs = list(dict.fromkeys((r.app, r.title) for path in args.check for r in read_records(path)))
+        mismatches = check_index(classifier, pairs)
+        for app, title, found, expected in mismatches:
+            print(f"食い違い: {app}: {title}（索引: {found}, 全ルール: {expected}）")
+        print(f"{len(pairs)}件のタイトルを確かめました。食い違い: {len(mismatches)}件")
+        raise SystemExit(1 if mismatches else 0)
+    for text in args.titles:
+        app, _, title = text.partition(":")
+        if not app.lower().endswith(".exe"):
+            app, title = "", text
+        print(f"{text}: {classifier.classify(app, title)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,162 +1,269 @@
 # -*- coding: utf-8 -*-
 
 import time
-import csv
-import os
-import psutil
-from datetime import datetime
 import threading
-from pystray import MenuItem as item
-import pystray
-from PIL import Image
 import pomodoro
-import keyboard
-
-# Mock win32 libraries if not available (for Linux environment testing)
-try:
-    import win32gui
-    import win32process
-except ImportError:
-    win32gui = None
-    win32process = None
+import metrics
+from live_profile import LiveProfiler
+from log_writer import LogWriter
+from interval_log import IntervalLogWriter
+from log_schema import POINT_HEADER
+from window_source import default_window_source
+from scheduler import AdaptiveScheduler
+from title_rules import load_classifier, describe, TITLE_RULES_FILE
+from events import EventBus, StateChanged, WindowSwitched, LogPaused, DayRolledOver
 
 # --- 設定 ---
 CHECK_INTERVAL = 5  # アクティブウィンドウのチェック間隔（秒）
 LOG_FILE_PREFIX = "log_"  # ログファイル名の接頭辞
 ICON_FILE = "icon.png"  # トレイアイコンのファイル名
+STORAGE_BACKEND = "csv"  # ログの保存先: "csv" / "sqlite" / "both"
+LOG_FORMAT = "interval"  # CSVの形式: "interval"（開始・終了・秒数）/ "point"（切り替え時刻のみ、旧形式）
 
 # ホットキー設定
 HOTKEY_START_WORK = "ctrl+shift+s"
 HOTKEY_START_BREAK = "ctrl+shift+b"
 HOTKEY_STOP_TIMER = "ctrl+shift+x"
 HOTKEY_TOGGLE_LOG = "ctrl+shift+p"
+HOTKEY_TOGGLE_PROFILE = "ctrl+shift+f"  # CPU の計測を開始／停止してレポートを保存
+HOTKEY_MEMORY_SNAPSHOT = "ctrl+shift+m"  # tracemalloc のスナップショットを取り、前回との差分を保存
+
+DIAGNOSTICS_REFRESH_MS = 2000  # Diagnostics ウィンドウの更新間隔（ミリ秒）
 # --- 設定ここまで ---
 
+LOG_HEADER = POINT_HEADER  # Rows handed to the writers; IntervalLogWriter closes them into intervals
+
 class UnifiedLogger:
     """
     PC操作ログとポモドーロタイマーを統合したクラス。
+    window_source を渡すとアクティブウィンドウの取得元を差し替えられる（シミュレーション用など）。
+    状態の変化は bus (EventBus) にイベントとして発行され、UIはそれを購読して再描画する。
     """
 
-    def __init__(self):
-        self.pomodoro = pomodoro.PomodoroTimer()
+    def __init__(self, window_source=None, bus=None):
+        self.bus = bus or EventBus()
+        self.pomodoro = pomodoro.PomodoroTimer(bus=self.bus)
+        self.window_source = window_source or default_window_source()
         self.current_log_file = self._get_log_file_path()
         self.last_window_title = None
+        self.writers = []
+        if STORAGE_BACKEND in ("csv", "both"):
+            if LOG_FORMAT == "interval":
+                self.writers.append(IntervalLogWriter(point_header=LOG_HEADER))
+            else:
+                self.writers.append(LogWriter(LOG_HEADER))
+        if STORAGE_BACKEND in ("sqlite", "both"):
+            from activity_store import SqliteLogWriter, ACTIVITY_DB_FILE
+            self.writers.append(SqliteLogWriter(LOG_HEADER, db_path=ACTIVITY_DB_FILE))
         self._initialize_log_file()
         self.is_running = threading.Event()
         self.is_paused = threading.Event()
         self.icon = None  # To be set by setup_tray
         self.last_p_state = None # Initialize to avoid AttributeError in first run loop if logic changes
+        # Latest Pomodoro state as pushed by the timer, so the loop never polls get_state()
+        self._p_state = self.pomodoro.STATE_IDLE
+        self._p_task = None
+        self._tooltip = None
+        self.bus.subscribe(self._on_state_changed, (StateChanged,))
+        self.scheduler = AdaptiveScheduler(max_interval=CHECK_INTERVAL, now=self.window_source.now)
+        # Optional: maps titles to projects/tickets/categories (None when there is no rules file)
+        self.classifier = load_classifier(TITLE_RULES_FILE)
+        # On-demand CPU/memory profiling of this live process (tray menu and hotkeys)
+        self.profiler = LiveProfiler(wake=self.wake)
 
     def _get_log_file_path(self):
-        today = datetime.now().strftime("%Y%m%d")
+        today = self.window_source.now().strftime("%Y%m%d")
         return f"{LOG_FILE_PREFIX}{today}.csv"
 
     def _initialize_log_file(self):
-        # Header updated with Pomodoro State and Task Name
-        if not os.path.exists(self.current_log_file):
-            print(f"新しいログファイルを作成します: {self.current_log_file}")
-            with open(self.current_log_file, mode='w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                writer.writerow(["タイムスタンプ", "アプリ名", "ウィンドウタイトル", "プロセスID", "ポモドーロ状態", "タスク名"])
+        # Header (with Pomodoro State and Task Name) is written by the writer if the file is new.
+        # Rows queued before this call still go to the previous day's file.
+        for writer in self.writers:
+            writer.open(self.current_log_file)
 
     def _ensure_correct_log_file(self):
         new_log_file = self._get_log_file_path()
         if new_log_file != self.current_log_file:
             print(f"日付が変更されました。ログファイルを切り替えます: {new_log_file}")
+            old_log_file = self.current_log_file
+            # The open interval ends at midnight in yesterday's file...
+            self._close_intervals(self.window_source.now().strftime("%Y-%m-%d 00:00:00"))
             self.current_log_file = new_log_file
             self._initialize_log_file()
+            # ...and the current window starts a fresh one in today's
+            self.last_window_title = None
+            self.bus.publish(DayRolledOver(old_log_file, new_log_file))
 
-    def get_active_window_info(self):
-        if win32gui is None:
-            return 1000, "Mock Window Title", "MockProcess.exe"
-
-        try:
-            hwnd = win32gui.GetForegroundWindow()
-            if not hwnd:
-                 return None, "Unknown", "Unknown"
-
-            _, pid = win32process.GetWindowThreadProcessId(hwnd)
-            window_title = win32gui.GetWindowText(hwnd)
-            try:
-                process = psutil.Process(pid)
-                process_name = process.name()
-            except psutil.NoSuchProcess:
-                process_name = "Unknown"
-
-            return pid, window_title, process_name
-        except Exception as e:
-            # print(f"Error getting window info: {e}") # Reduce noise
-            return None, "Unknown", "Unknown"
-
-    def log_activity(self, pid, window_title, process_name):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def _on_state_changed(self, event):
+        # Runs on the timer (or caller) thread: just record and wake the loop
+        self._p_state = event.new
+        self._p_task = event.task
+        self.wake()
 
-        # Get Pomodoro state
-        p_state = self.pomodoro.get_state()
-        state_str = p_state['state']
-        task_name = p_state['task'] if p_state['task'] else ""
+    def _close_intervals(self, end=None):
+        end = end or self.window_source.now().strftime("%Y-%m-%d %H:%M:%S")
+        for writer in self.writers:
+            writer.close_interval(end)
 
-        with open(self.current_log_file, mode='a', newline='', encoding='utf-8-sig') as f:
-            writer = csv.writer(f)
-            writer.writerow([timestamp, process_name, window_title, pid, state_str, task_name])
+    def get_active_window_info(self):
+        return self.window_source.get_active_window()
+
+    def log_activity(self, pid, window_title, process_name, state_changed=False):
+        timestamp = self.window_source.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        state_str = self._p_state
+        task_name = self._p_task if self._p_task else ""
+
+        row = [timestamp, process_name, window_title, pid, state_str, task_name]
+        # Handing the row to the writer threads; the file append itself is timed as writer.batch
+        with metrics.timer("log.enqueue"):
+            for writer in self.writers:
+                writer.write(row, state_changed=state_changed)
+        # Memoized per title, so a repeated window costs one dict lookup
+        with metrics.timer("log.classify"):
+            classification = self.classifier.classify(process_name, window_title) if self.classifier else None
+        with metrics.timer("log.publish"):
+            self.bus.publish(WindowSwitched(timestamp, pid, window_title, process_name, state_str, task_name,
+                                            classification))
+        metrics.inc("log.rows")
 
         # Console output matches plan
-        print(f"記録: [{timestamp}] {process_name} - {window_title} ({state_str}: {task_name})")
+        label = describe(classification) if classification else ""
+        print(f"記録: [{timestamp}] {process_name} - {window_title} ({state_str}: {task_name})"
+              + (f" <{label}>" if label else ""))
 
     def run(self):
         self.is_running.set()
         while self.is_running.is_set():
-            # Tick the Pomodoro Timer
-            self.pomodoro.tick()
+            # Pomodoro transitions run on the timer's own thread; no tick() needed.
+
+            # cProfile can only be switched on/off from the thread it measures
+            if self.profiler.loop.pending:
+                self.profiler.loop.poll()
 
             # Update tray tooltip if possible
             if self.icon:
-                 p_state = self.pomodoro.get_state()
-                 status = f"State: {p_state['state']}"
-                 if p_state['state'] != pomodoro.PomodoroTimer.STATE_IDLE:
-                     mins = p_state['remaining_time'] // 60
-                     secs = p_state['remaining_time'] % 60
-                     status += f" ({mins:02d}:{secs:02d})"
-                 if self.is_paused.is_set():
-                     status += " [LOG PAUSED]"
-                 self.icon.title = status
+                with metrics.timer("loop.tooltip"):
+                    self._update_tooltip()
 
             if self.is_paused.is_set():
-                time.sleep(1) # Sleep less when paused to keep timer ticking?
-                # Actually if logger is paused, should timer continue?
-                # Usually yes. Logger pause only stops logging window activity.
+                # Timer keeps running while logging is paused: sleep until its deadline
+                # (or midnight). toggle_pause()/stop() wake us up early.
+                self._sleep(poll=False)
                 continue
 
+            started = time.perf_counter() if metrics.enabled() else None
             self._ensure_correct_log_file()
-            pid, window_title, process_name = self.get_active_window_info()
+            with metrics.timer("loop.get_active_window"):
+                pid, window_title, process_name = self.get_active_window_info()
 
             # Log if window changed OR if pomodoro state changed (maybe?)
-            p_state = self.pomodoro.get_state()
-            current_p_state = p_state['state']
+            current_p_state = self._p_state
 
             # We might need to store last pomodoro state to detect change
             if self.last_p_state is None:
                 self.last_p_state = current_p_state
 
-            if (window_title and window_title != self.last_window_title) or (current_p_state != self.last_p_state):
-                self.log_activity(pid, window_title, process_name)
+            switched = bool(window_title and window_title != self.last_window_title)
+            if switched or (current_p_state != self.last_p_state):
+                self.log_activity(pid, window_title, process_name,
+                                  state_changed=(current_p_state != self.last_p_state))
                 self.last_window_title = window_title
                 self.last_p_state = current_p_state
 
-            # Let's try 1 second interval.
-            time.sleep(1)
+            # Poll fast right after a switch and back off while the window is stable.
+            # Event-driven sources wake us on a switch, so they only need the deadlines.
+            self.scheduler.record_sample(switched)
+            if started is not None:
+                self._record_iteration(time.perf_counter() - started, switched)
+            self._sleep(poll=not self.window_source.event_driven)
+
+    def _record_iteration(self, busy, switched):
+        metrics.observe("loop.busy", busy)
+        metrics.inc("loop.iterations")
+        if switched:
+            metrics.inc("loop.switches")
+        if busy > metrics.LOOP_BUDGET:
+            metrics.inc("loop.overruns")
+
+    def _sleep(self, poll):
+        deadline_in = self.pomodoro.seconds_until_deadline()
+        if self.icon and deadline_in is not None:
+            # Also wake when the tooltip's minute digit changes
+            deadline_in = min(deadline_in, deadline_in % 60 or 60)
+        timeout = self.scheduler.next_timeout(deadline_in, poll=poll)
+        slept_from = time.monotonic() if metrics.enabled() else None
+        self.window_source.wait_for_change(timeout)
+        self.scheduler.record_wakeup()
+        if slept_from is not None:
+            # Woken early (a switch, a command) is not drift; oversleeping past the timeout is
+            drift = time.monotonic() - slept_from - timeout
+            if drift >= 0:
+                metrics.observe("loop.wake_drift", drift)
+                metrics.set_gauge("loop.wake_drift_ms", drift * 1000)
+                metrics.max_gauge("loop.wake_drift_max_ms", drift * 1000)
+            metrics.set_gauge("loop.poll_interval_s", self.scheduler.interval)
+
+    def wake(self):
+        """眠っている記録ループをすぐに起こす（状態変更を即座に記録するため）。"""
+        self.window_source.wake()
+
+    def _update_tooltip(self):
+        status = f"State: {self._p_state}"
+        if self._p_state != pomodoro.PomodoroTimer.STATE_IDLE:
+            remaining = int(self.pomodoro.remaining_time)
+            status += f" ({remaining // 60:02d}:{remaining % 60:02d})"
+        if self.is_paused.is_set():
+            status += " [LOG PAUSED]"
+        # Only touch the tray when the text actually changed
+        if status != self._tooltip:
+            self._tooltip = status
+            self.icon.title = status
 
     def stop(self):
         self.is_running.clear()
+        self.window_source.close()
         self.pomodoro.stop()
+        self.pomodoro.shutdown()
+        # Close the running interval and flush everything still queued so no rows are lost on exit
+        self._close_intervals()
+        for writer in self.writers:
+            writer.close()
+        # Last values, including the final flushes, go to the metrics file
+        metrics.disable()
+        self.profiler.stop()
+        print(f"平均起床回数: {self.scheduler.average_wakeups_per_minute():.1f} 回/分")
 
     def toggle_pause(self):
         if self.is_paused.is_set():
             print("ログ記録を再開します。")
+            # Start a new interval for whatever window is active now
+            self.last_window_title = None
             self.is_paused.clear()
         else:
             print("ログ記録を一時停止します。")
             self.is_paused.set()
+            # Paused time is not attributed to the window that was active
+            self._close_intervals()
+        self.bus.publish(LogPaused(self.is_paused.is_set()))
+        self.wake()
+
+    def enable_metrics(self):
+        """計測を始める（トレイの Diagnostics から。起動時は --metrics か metrics.METRICS_ENABLED）。"""
+        metrics.enable()
+
+    def diagnostics(self):
+        """計測値（LoggerClient と同じ問い合わせ）。無効なら {"enabled": False}。"""
+        return metrics.snapshot()
+
+    def toggle_profiling(self):
+        """CPU の計測を開始／停止する。停止時はレポートを live_profile.PROFILE_DIR に保存する。"""
+        # Stopping writes the report; keep that off the hotkey/tray thread
+        threading.Thread(target=self.profiler.toggle, name="ProfileToggle", daemon=True).start()
+
+    def memory_snapshot_action(self):
+        """tracemalloc のスナップショットを取り、前回・最初の回との差分を保存する。"""
+        threading.Thread(target=self.profiler.memory_snapshot, name="MemorySnapshot", daemon=True).start()
 
     # --- Hotkey Actions ---
     def start_work_action(self):
@@ -200,6 +307,11 @@ def setup_tray(logger):
     """
     システムトレイのアイコンとメニューを設定・実行する。
     """
+    # Loaded on first use: a headless logger never pays for the GUI toolkits
+    from pystray import MenuItem as item
+    import pystray
+    from PIL import Image
+
     try:
         image = Image.open(ICON_FILE)
     except FileNotFoundError:
@@ -219,10 +331,22 @@ def setup_tray(logger):
     def on_start_break(icon, item):
         logger.start_break_action()
 
+    def on_diagnostics(icon, item):
+        show_diagnostics(logger)
+
+    def on_toggle_profile(icon, item):
+        logger.toggle_profiling()
+
+    def on_memory_snapshot(icon, item):
+        logger.memory_snapshot_action()
+
     menu = (
         item('Start Work', on_start_work),
         item('Start Break', on_start_break),
         item('Pause/Resume Log', on_toggle_pause),
+        item('Diagnostics', on_diagnostics),
+        item('Profile: Start/Stop', on_toggle_profile),
+        item('Memory Snapshot', on_memory_snapshot),
         item('Exit', on_exit)
     )
 
@@ -230,25 +354,123 @@ def setup_tray(logger):
     logger.icon = icon
     icon.run()
 
+def show_diagnostics(logger):
+    """
+    計測値（ループの遅れ・ウィンドウ取得や書き込みの時間など）を表示するウィンドウを開く。
+    このプロセスで記録していて計測が無効なら、ここから計測を始める。
+    """
+    if hasattr(logger, "enable_metrics"):
+        logger.enable_metrics()
+    # pystray owns the main thread; the window gets a Tk of its own on a separate thread
+    threading.Thread(target=_diagnostics_window, args=(logger,), name="Diagnostics", daemon=True).start()
+
+
+def _diagnostics_window(logger):
+    def report():
+        try:
+            data = logger.diagnostics()
+        except (OSError, ValueError) as e:
+            return f"計測値を取得できませんでした: {e}"
+        return metrics.format_report(data)
+
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"Diagnostics ウィンドウを開けません ({e})。\n{report()}")
+        return
+    root.title("Unified Logger - Diagnostics")
+    text = tk.Text(root, width=110, height=32, font=("Consolas", 9))
+    text.pack(fill="both", expand=True)
+
+    def refresh():
+        text.config(state="normal")
+        text.delete("1.0", "end")
+        text.insert("1.0", report())
+        text.config(state="disabled")
+        root.after(DIAGNOSTICS_REFRESH_MS, refresh)
+
+    refresh()
+    root.mainloop()
+
 def setup_hotkeys(logger):
     try:
+        import keyboard
         keyboard.add_hotkey(HOTKEY_START_WORK, logger.start_work_action)
         keyboard.add_hotkey(HOTKEY_START_BREAK, logger.start_break_action)
         keyboard.add_hotkey(HOTKEY_STOP_TIMER, logger.stop_timer_action)
         keyboard.add_hotkey(HOTKEY_TOGGLE_LOG, logger.toggle_pause)
-        print(f"Hotkeys registered: Work={HOTKEY_START_WORK}, Break={HOTKEY_START_BREAK}, Stop={HOTKEY_STOP_TIMER}, Log={HOTKEY_TOGGLE_LOG}")
+        keyboard.add_hotkey(HOTKEY_TOGGLE_PROFILE, logger.toggle_profiling)
+        keyboard.add_hotkey(HOTKEY_MEMORY_SNAPSHOT, logger.memory_snapshot_action)
+        print(f"Hotkeys registered: Work={HOTKEY_START_WORK}, Break={HOTKEY_START_BREAK}, Stop={HOTKEY_STOP_TIMER}, Log={HOTKEY_TOGGLE_LOG}, "
+              f"Profile={HOTKEY_TOGGLE_PROFILE}, Memory={HOTKEY_MEMORY_SNAPSHOT}")
     except ImportError:
         print("Keyboard library not installed or not working (root required on Linux). Hotkeys disabled.")
     except Exception as e:
         print(f"Failed to register hotkeys: {e}")
 
-if __name__ == "__main__":
+def run_headless(logger, logging_thread, server):
+    """トレイ・ホットキー無しで記録とAPIだけを動かす。Ctrl+C で終了する。"""
+    print("Unified Logger Started (headless). Press Ctrl+C to exit.")
+    try:
+        # Short joins keep Ctrl+C responsive (a plain join() can't be interrupted on Windows)
+        while logging_thread.is_alive():
+            logging_thread.join(1)
+    except KeyboardInterrupt:
+        pass
+    logger.stop()
+    server.shutdown()
+
+
+def main():
+    import argparse
+    from logger_daemon import LoggerService, LoggerClient, bind_api_server, serve_api, daemon_running
+
+    parser = argparse.ArgumentParser(description="PC操作ログとポモドーロタイマーを動かします。")
+    parser.add_argument("--headless", action="store_true",
+                        help="トレイ・ホットキー無しで動かします（操作はロガーAPI・Hub・ブラウザから）")
+    parser.add_argument("--metrics", nargs="?", const=metrics.METRICS_FILE, metavar="FILE",
+                        help=f"ループ・書き込み・タイマーの計測値を定期的に FILE（省略時 {metrics.METRICS_FILE}）へ書き出します")
+    parser.add_argument("--profile-startup", nargs="?", const="", metavar="JSON",
+                        help="起動せずに、段階ごとの import 時間と RSS を表示します（JSON を指定すると保存）")
+    args = parser.parse_args()
+
+    if args.profile_startup is not None:
+        import startup_profile
+        raise SystemExit(startup_profile.run(startup_profile.LOGGER_STAGES, args.profile_startup or None))
+
+    # Take the API port before building the logger: only the process holding it may write the log
+    try:
+        server = bind_api_server()
+    except OSError as e:
+        if not daemon_running():
+            print(f"ロガーAPIのポートを使えないため起動できません: {e}")
+            raise SystemExit(1)
+        if args.headless:
+            print("ロガーは既に動いています。")
+            return
+        # Another process already logs on this machine: the tray only controls it
+        print("動いているロガーにつなぎます。")
+        logger = LoggerClient()
+        threading.Thread(target=logger.run, daemon=True).start()
+        setup_hotkeys(logger)
+        setup_tray(logger)
+        return
+
+    if args.metrics or metrics.METRICS_ENABLED:
+        metrics.enable(args.metrics or metrics.METRICS_FILE)
     logger = UnifiedLogger()
+    # Hub UI, the browser timer and other trays talk to this process through the API
+    serve_api(server, LoggerService(logger))
 
     # ロギングスレッドの開始
-    logging_thread = threading.Thread(target=logger.run, daemon=True)
+    logging_thread = threading.Thread(target=logger.run, name="UnifiedLogger", daemon=True)
     logging_thread.start()
 
+    if args.headless:
+        run_headless(logger, logging_thread, server)
+        return
+
     print("Unified Logger Started.")
     print("Press Ctrl+C to exit if running in console.")
 
@@ -258,3 +480,8 @@ if __name__ == "__main__":
     # システムトレイのUIを開始（メインスレッド）
     # Note: pystray.run() blocks.
     setup_tray(logger)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from process_cache import ProcessNameCache
+from log_schema import read_records
+
+# Mock win32 libraries if not available (for Linux environment testing)
+try:
+    import win32gui
+    import win32process
+except ImportError:
+    win32gui = None
+    win32process = None
+
+# --- 設定 ---
+WINDOW_SOURCE_BACKEND = "poll"  # "poll"（定期問い合わせ）または "event"（SetWinEventHook）
+# --- 設定ここまで ---
+
+UNKNOWN_WINDOW = (None, "Unknown", "Unknown")
+
+
+class WindowSource:
+    """
+    アクティブウィンドウ情報の取得元の基底クラス。
+    get_active_window() は (pid, ウィンドウタイトル, プロセス名) を返す。
+    wait_for_change() は次に確認すべき時まで待ち、変化があった可能性があれば True を返す。
+    event_driven が True のソースは変化時に必ず起こしてくれるので、定期的に見に行く必要が無い。
+    """
+
+    event_driven = False
+
+    def __init__(self):
+        self._wake = threading.Event()
+
+    def get_active_window(self):
+        raise NotImplementedError
+
+    def wait_for_change(self, timeout):
+        self._wake.wait(timeout)
+        self._wake.clear()
+        return True
+
+    def wake(self):
+        """wait_for_change() で待機中のスレッドを起こす（停止時など）。"""
+        self._wake.set()
+
+    def now(self):
+        """ログのタイムスタンプに使う現在時刻。"""
+        return datetime.now()
+
+    def close(self):
+        self.wake()
+
+
+class StaticSource(WindowSource):
+    """常に同じウィンドウを返すソース（win32が無い環境用のモック）。"""
+
+    def __init__(self, pid=1000, window_title="Mock Window Title", process_name="MockProcess.exe"):
+        super().__init__()
+        self.info = (pid, window_title, process_name)
+
+    def get_active_window(self):
+        return self.info
+
+
+class Win32PollingSource(WindowSource):
+    """
+    呼ばれるたびに前面ウィンドウを問い合わせるWindows用ソース。
+    同じウィンドウ・同じプロセスが続く間は psutil を呼ばない。
+    """
+
+    def __init__(self, process_names=None):
+        super().__init__()
+        self.process_names = process_names or ProcessNameCache()
+        self._last_hwnd = None
+        self._last_pid = None
+        self._last_process_name = None
+
+    def get_active_window(self):
+        try:
+            hwnd = win32gui.GetForegroundWindow()
+            if not hwnd:
+                return UNKNOWN_WINDOW
+            return self._describe(hwnd)
+        except Exception:
+            return UNKNOWN_WINDOW
+
+    def _describe(self, hwnd):
+        _, pid = win32process.GetWindowThreadProcessId(hwnd)
+        window_title = win32gui.GetWindowText(hwnd)
+
+        # Same window in the same process: the title may change (tabs), the name can't
+        if hwnd == self._last_hwnd and pid == self._last_pid:
+            return pid, window_title, self._last_process_name
+
+        process_name = self.process_names.get_name(pid)
+        self._last_hwnd = hwnd
+        self._last_pid = pid
+        self._last_process_name = process_name
+        return pid, window_title, process_name
+
+
+class Win32EventSource(Win32PollingSource):
+    """
+    SetWinEventHook で前面ウィンドウの切り替えとタイトル変更を受け取るWindows用ソース。
+    wait_for_change() はイベントが届くまで眠るため、変化が無い間はポーリングしない。
+    """
+
+    EVENT_SYSTEM_FOREGROUND = 0x0003
+    EVENT_OBJECT_NAMECHANGE = 0x800C
+    WINEVENT_OUTOFCONTEXT = 0x0000
+    WINEVENT_SKIPOWNPROCESS = 0x0002
+    OBJID_WINDOW = 0
+    WM_QUIT = 0x0012
+
+    event_driven = True
+
+    def __init__(self, process_names=None):
+        super().__init__(process_names)
+        self._changed = threading.Event()
+        self._changed.set()  # First wait returns immediately so the caller samples once
+        self._ready = threading.Event()
+        self._thread_id = None
+        self._hook_error = None
+        self._thread = threading.Thread(target=self._hook_loop, name="WinEventHook", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        if self._hook_error is not None:
+            raise self._hook_error
+
+    def wait_for_change(self, timeout):
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+    def wake(self):
+        self._changed.set()
+
+    def close(self):
+        import ctypes
+        if self._thread_id is not None:
+            ctypes.windll.user32.PostThreadMessageW(self._thread_id, self.WM_QUIT, 0, 0)
+        self.wake()
+
+    def _hook_loop(self):
+        # The hook must be installed and pumped on the same thread
+        import ctypes
+        from ctypes import wintypes
+
+        # A private handle: the prototypes below must not change ctypes.windll.user32 for other code
+        user32 = ctypes.WinDLL("user32")
+        kernel32 = ctypes.windll.kernel32
+
+        WinEventProc = ctypes.WINFUNCTYPE(
+            None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+            wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+        # Without prototypes ctypes passes and returns C int, truncating 64-bit handles
+        user32.GetForegroundWindow.restype = wintypes.HWND
+        user32.GetForegroundWindow.argtypes = []
+        user32.SetWinEventHook.restype = wintypes.HANDLE
+        user32.SetWinEventHook.argtypes = [wintypes.DWORD, wintypes.DWORD, wintypes.HMODULE, WinEventProc,
+                                           wintypes.DWORD, wintypes.DWORD, wintypes.DWORD]
+        user32.UnhookWinEvent.restype = wintypes.BOOL
+        user32.UnhookWinEvent.argtypes = [wintypes.HANDLE]
+        user32.GetMessageW.restype = wintypes.BOOL
+        user32.GetMessageW.argtypes = [ctypes.POINTER(wintypes.MSG), wintypes.HWND, wintypes.UINT, wintypes.UINT]
+
+        def callback(hook, event, hwnd, id_object, id_child, thread, timestamp):
+            if event == self.EVENT_OBJECT_NAMECHANGE:
+                # Title changes are only interesting for the foreground window itself
+                if id_object != self.OBJID_WINDOW or hwnd != user32.GetForegroundWindow():
+                    return
+            self._changed.set()
+
+        # Keep a reference so the trampoline isn't garbage collected
+        self._callback = WinEventProc(callback)
+        flags = self.WINEVENT_OUTOFCONTEXT | self.WINEVENT_SKIPOWNPROCESS
+        hooks = [
+            user32.SetWinEventHook(self.EVENT_SYSTEM_FOREGROUND, self.EVENT_SYSTEM_FOREGROUND,
+                                   None, self._callback, 0, 0, flags),
+            user32.SetWinEventHook(self.EVENT_OBJECT_NAMECHANGE, self.EVENT_OBJECT_NAMECHANGE,
+                                   None, self._callback, 0, 0, flags),
+        ]
+        if not all(hooks):
+            self._hook_error = OSError("SetWinEventHook failed")
+            self._ready.set()
+            return
+
+        self._thread_id = kernel32.GetCurrentThreadId()
+        self._ready.set()
+
+        msg = wintypes.MSG()
+        while user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+            user32.TranslateMessage(ctypes.byref(msg))
+            user32.DispatchMessageW(ctypes.byref(msg))
+
+        for hook in hooks:
+            user32.UnhookWinEvent(hook)
+
+
+class SimulatedSource(WindowSource):
+    """
+    記録済み、または生成したウィンドウ切り替えの列を再生するソース。
+    events は (開始からの秒数, pid, ウィンドウタイトル, プロセス名) のリスト。
+    speed=60 なら1分を1秒で再生し、speed=None なら wait_for_change() の
+    たびに次の切り替えへ即座に進む（スループット計測・回帰テスト用）。
+    タイムスタンプ (now) もシミュレーション時刻で返すため、結果は決定的になる。
+    """
+
+    def __init__(self, events, speed=1.0, start_time=None, clock=time.monotonic):
+        super().__init__()
+        self.events = sorted(events, key=lambda e: e[0])
+        self.speed = speed
+        self.start_time = start_time or datetime.now().replace(microsecond=0)
+        self.clock = clock
+        self.finished = threading.Event()
+        self._index = 0
+        self._sim_elapsed = self.events[0][0] if self.events else 0.0
+        self._started_at = clock()
+        if len(self.events) <= 1:
+            self.finished.set()
+
+    # --- Construction helpers ---
+    @classmethod
+    def from_log(cls, path, **kwargs):
+        """既存のログCSV（形式は問わない）から切り替え列を読み込む。"""
+        events = []
+        first = None
+        for record in read_records(path):
+            ts = datetime.strptime(record.start, "%Y-%m-%d %H:%M:%S")
+            if first is None:
+                first = ts
+            pid = int(record.pid) if record.pid else None
+            events.append(((ts - first).total_seconds(), pid, record.title, record.app))
+        kwargs.setdefault("start_time", first)
+        return cls(events, **kwargs)
+
+    @classmethod
+    def generate(cls, count, mean_dwell=30.0, apps=None, titles_per_app=20, seed=0, **kwargs):
+        """指数分布の滞在時間で切り替え列を生成する。seed が同じなら同じ列になる。"""
+        rng = random.Random(seed)
+        apps = apps or ["chrome.exe", "Code.exe", "OUTLOOK.EXE", "Teams.exe", "explorer.exe"]
+        pids = {app: 1000 + i * 4 for i, app in enumerate(apps)}
+        events = []
+        offset = 0.0
+        for _ in range(count):
+            app = rng.choice(apps)
+            title = f"{app} - document {rng.randrange(titles_per_app)}"
+            events.append((offset, pids[app], title, app))
+            offset += rng.expovariate(1.0 / mean_dwell)
+        return cls(events, **kwargs)
+
+    # --- WindowSource ---
+    def get_active_window(self):
+        if not self.events:
+            return UNKNOWN_WINDOW
+        self._advance()
+        _, pid, title, process_name = self.events[self._index]
+        return pid, title, process_name
+
+    def wait_for_change(self, timeout):
+        self._advance()
+        if self._index + 1 >= len(self.events):
+            self.finished.set()
+            # Nothing more will change, in step mode too: sleep out the timeout instead of spinning
+            self._wake.wait(timeout)
+            self._wake.clear()
+            return False
+
+        if self.speed is None:
+            # Step mode: jump straight to the next switch
+            self._index += 1
+            self._sim_elapsed = self.events[self._index][0]
+            return True
+
+        next_offset = self.events[self._index + 1][0]
+        real_wait = (next_offset - self._sim_elapsed) / self.speed
+        if real_wait > timeout:
+            self._wake.wait(timeout)
+            self._wake.clear()
+            self._advance()
+            return False
+        self._wake.wait(max(0.0, real_wait))
+        self._wake.clear()
+        self._advance()
+        return True
+
+    def now(self):
+        self._advance()
+        return self.start_time + timedelta(seconds=self._sim_elapsed - (self.events[0][0] if self.events else 0.0))
+
+    def _advance(self):
+        if self.speed is None:
+            return
+        base = self.events[0][0] if self.events else 0.0
+        self._sim_elapsed = base + (self.clock() - self._started_at) * self.speed
+        while self._index + 1 < len(self.events) and self.events[self._index + 1][0] <= self._sim_elapsed:
+            self._index += 1
+
+
+def default_window_source(backend=WINDOW_SOURCE_BACKEND):
+    """実行環境に合ったソースを返す。Windows以外ではモックになる。"""
+    if win32gui is None:
+        return StaticSource()
+    if backend == "event":
+        try:
+            return Win32EventSource()
+        except Exception as e:
+            print(f"イベント監視を開始できませんでした。ポーリングに切り替えます: {e}")
+    return Win32PollingSource()